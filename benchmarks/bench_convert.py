@@ -0,0 +1,231 @@
+#! /usr/bin/env python
+###############################################################################
+# bench_convert.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Converter benchmark on synthetic products
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+"""Benchmark the HDF5 converters on synthetic products.
+
+For every raster size a synthetic ROI_PAC, ISCE and GMTSAR product is written
+by synthetic_products.py in a process of its own, and each converter is run on
+it in a fresh interpreter for every configuration:
+
+    default       all layers with overviews
+    no_overviews  -no_overviews
+    complex       -complex (ROI_PAC and ISCE), also stores the complex interferogram
+    quantized     -quantize, layers stored as scaled integers
+    unchanged     a second run on an existing product whose inputs did not change
+
+The table reports wall time, CPU time and peak RSS of the converter process,
+the size of the .h5 product, and its compression ratio (uncompressed bytes of
+all datasets divided by the file size, needs h5py in the interpreter running
+the benchmark). Results can be saved with --save and compared with an earlier
+run with --compare; the run exits with status 1 if wall time or peak RSS grew
+by more than --tolerance.
+
+Usage:
+    benchmarks/bench_convert.py [--sizes 2048x2048,4096x4096] [--tools roipac,isce,gmtsar]
+                                [--configs default,...] [--python2 CMD] [--python3 CMD]
+                                [--keep DIR] [--save FILE] [--compare FILE]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import synthetic_products
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (product, script, interpreter, arguments, configurations it supports)
+TOOLS = [('roipac', 'data_utils/roipac2hdf5.py', 'python2',
+          ['-rsc1', '%s.slc.rsc' % synthetic_products.ROIPAC_DATES[0], '-rsc2', '%s.slc.rsc' % synthetic_products.ROIPAC_DATES[1], '-swath', 'IS2'],
+          ['default', 'no_overviews', 'complex', 'quantized', 'unchanged']),
+         ('isce', 'data_utils/isce2hdf5.py', 'python3', ['-swath', 'IS2'],
+          ['default', 'no_overviews', 'complex', 'quantized', 'unchanged']),
+         ('gmtsar', 'data_utils/gmtsar2hdf5.py', 'python2',
+          ['-relative_orbit', '170', '-frame', '2925', '-swath', 'IS2', '-footprint', 'POLYGON((-118 36,-117 36,-117 35,-118 35,-118 36))'],
+          ['default', 'no_overviews', 'quantized', 'unchanged'])]
+
+# Runs a command and writes its exit status, wall and CPU seconds and ru_maxrss
+# to the file argv[1]. On Linux a child starts with the peak RSS of the process
+# that forked it, so the converters are forked from this small interpreter
+# (python -S, about 11 MB) rather than from the benchmark, which holds numpy and h5py.
+MEASURE = '''import os, sys, time
+start = time.time()
+pid = os.fork()
+if not pid:
+    try:
+        os.execvp(sys.argv[2], sys.argv[2:])
+    except OSError as e:
+        sys.stderr.write('%s: %s\\n' % (sys.argv[2], e))
+    os._exit(127)
+pid, status, usage = os.wait4(pid, 0)
+with open(sys.argv[1], 'w') as f:
+    f.write('%d %r %r %d' % (status, time.time() - start, usage.ru_utime + usage.ru_stime, usage.ru_maxrss))
+'''
+
+# (extra arguments, run once before the measured run)
+CONFIGS = {'default': ([], False),
+           'no_overviews': (['-no_overviews'], False),
+           'complex': (['-complex'], False),
+           'quantized': (['-quantize'], False),
+           'unchanged': ([], True)}
+
+def run_converter(interpreter, script, args, cwd):
+    '''Run a converter in cwd, returns (wall seconds, cpu seconds, peak RSS in MB), measured by MEASURE.'''
+    fd, result = tempfile.mkstemp(prefix='bench_convert_', suffix='.txt')
+    os.close(fd)
+    try:
+        with tempfile.TemporaryFile() as log:
+            subprocess.call([sys.executable, '-S', '-c', MEASURE, result] + interpreter.split() + [script] + args,
+                            cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+            with open(result) as f:
+                fields = f.read().split()
+            status = int(fields[0]) if fields else -1
+            if status:
+                log.seek(0)
+                lines = log.read().decode('utf-8', 'replace').strip().splitlines() or ['exit status %d' % status]
+                raise RuntimeError(lines[-1])
+    finally:
+        os.remove(result)
+    # ru_maxrss is in kB on Linux and in bytes on Mac OS X
+    rss = int(fields[3]) / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+    return float(fields[1]), float(fields[2]), rss
+
+def make_product(product, directory, length, width):
+    '''Write a synthetic product with synthetic_products.py in a process of its own, returns the directory to convert in.'''
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'synthetic_products.py'), product, directory,
+                             '--length', str(length), '--width', str(width)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    lines = proc.communicate()[0].decode('utf-8', 'replace').strip().splitlines() or ['exit status %d' % proc.returncode]
+    if proc.returncode:
+        raise RuntimeError(lines[-1])
+    return lines[-1]
+
+def compression_ratio(h5file):
+    '''Uncompressed bytes of all datasets over the file size, None without h5py.'''
+    try:
+        import h5py
+    except ImportError:
+        return None
+    nbytes = []
+    with h5py.File(h5file, 'r') as f:
+        f.visititems(lambda name, obj: nbytes.append(obj.size * obj.dtype.itemsize) if isinstance(obj, h5py.Dataset) else None)
+    return sum(nbytes) / float(os.path.getsize(h5file))
+
+def compare(results, baseline, tolerance):
+    '''Regressions of results against baseline, as a list of messages.'''
+    old = dict(((r['tool'], r['size'], r['config']), r) for r in baseline)
+    problems = []
+    for r in results:
+        b = old.get((r['tool'], r['size'], r['config']))
+        if b is None:
+            continue
+        name = '%s %s %s' % (r['tool'], r['size'], r['config'])
+        if r['wall'] > b['wall'] * (1 + tolerance):
+            problems.append('%s: %.2f s, was %.2f s' % (name, r['wall'], b['wall']))
+        if r['rss_mb'] > b['rss_mb'] * (1 + tolerance):
+            problems.append('%s: peak RSS %.1f MB, was %.1f MB' % (name, r['rss_mb'], b['rss_mb']))
+    return problems
+
+def parse():
+    parser = argparse.ArgumentParser(description='Benchmark the HDF5 converters on synthetic products')
+    parser.add_argument('--sizes', default='2048x2048', help='comma separated LENGTHxWIDTH raster sizes (default=%(default)s)')
+    parser.add_argument('--tools', default='roipac,isce,gmtsar', help='comma separated converters to run (default=%(default)s)')
+    parser.add_argument('--configs', default='default,no_overviews,complex,quantized,unchanged', help='comma separated configurations (default=%(default)s)')
+    parser.add_argument('--python2', default='python2', help='python 2 interpreter command (default=%(default)s)')
+    parser.add_argument('--python3', default='python3', help='python 3 interpreter command (default=%(default)s)')
+    parser.add_argument('--keep', help='write the synthetic products here and keep them, default is a temporary directory')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression for --compare (default=%(default)s)')
+    return parser.parse_args()
+
+def main(argv):
+    clos = parse()
+    interpreters = {'python2': clos.python2, 'python3': clos.python3}
+    tools = clos.tools.split(',')
+    configs = clos.configs.split(',')
+    workdir = clos.keep or tempfile.mkdtemp(prefix='bench_convert_')
+    results = []
+    print('%-8s %11s %-13s %8s %8s %8s %8s %7s' % ('tool', 'size', 'config', 'wall s', 'cpu s', 'RSS MB', 'h5 MB', 'ratio'))
+    try:
+        for size in clos.sizes.split(','):
+            length, width = [int(n) for n in size.lower().split('x')]
+            for product, script, interpreter, args, supported in TOOLS:
+                if product not in tools:
+                    continue
+                try:
+                    cwd = make_product(product, os.path.join(workdir, '%s_%s' % (product, size)), length, width)
+                except RuntimeError as e:
+                    # GMTSAR grids need GDAL
+                    print('%-8s %11s %-13s  %s (%s)' % (product, size, '-', 'SKIPPED' if 'No module named' in str(e) else 'FAILED', e))
+                    continue
+                for config in configs:
+                    if config not in supported:
+                        continue
+                    extra, rerun = CONFIGS[config]
+                    for h5file in glob.glob(os.path.join(cwd, '*.h5')):
+                        os.remove(h5file)
+                    command = [interpreters[interpreter], os.path.join(ROOT, script), args + extra, cwd]
+                    try:
+                        if rerun:
+                            run_converter(*command)
+                        wall, cpu, rss = run_converter(*command)
+                    except (RuntimeError, OSError) as e:
+                        print('%-8s %11s %-13s  FAILED (%s)' % (product, size, config, e))
+                        continue
+                    h5file = glob.glob(os.path.join(cwd, '*.h5'))[0]
+                    ratio = compression_ratio(h5file)
+                    r = {'tool': product, 'size': size, 'config': config, 'wall': wall, 'cpu': cpu, 'rss_mb': rss,
+                         'h5_mb': os.path.getsize(h5file) / (1024 * 1024.0), 'ratio': ratio}
+                    results.append(r)
+                    print('%-8s %11s %-13s %8.2f %8.2f %8.1f %8.1f %7s' % (product, size, config, wall, cpu, rss, r['h5_mb'],
+                                                                          '%.2f' % ratio if ratio else '-'))
+    finally:
+        if not clos.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if clos.save:
+        with open(clos.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if clos.compare:
+        with open(clos.compare) as f:
+            problems = compare(results, json.load(f), clos.tolerance)
+        for p in problems:
+            print('REGRESSION', p)
+        return 1 if problems else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[:]))
@@ -0,0 +1,348 @@
+#! /usr/bin/env python
+###############################################################################
+# bench_download.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Download driver benchmark against a local archive stand-in
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+"""Benchmark the download drivers against a local stand-in for the archives.
+
+A stand-in server is started in its own process. It serves synthetic
+granules the way the archives do:
+
+    /asf/login          POST user_name/user_password, sets a session cookie
+    /asf/files/<name>   needs the session cookie
+    /unavco/files/...   HTTP Digest authentication
+    /va4/files/...      no authentication (secp only sends its -C credentials
+                        through the ESA single sign-on, which is not simulated)
+
+Range requests are answered with 206. Every response can be delayed
+(--latency), each connection is limited to --bandwidth MB/s, and a fraction
+of the file requests fail with 503 (--fail-rate) or are cut off halfway
+(--drop-rate).
+
+For each driver and --parallel level the downloads run in a fresh python 2
+process through SsaraClient.download, which reports wall time, throughput of
+the granules that arrived complete, CPU time (including secp/curl for va4)
+and peak RSS. Results can be saved with --save and compared with an earlier
+run with --compare; the run exits with status 1 if throughput or the number
+of complete granules dropped, or peak RSS grew, by more than --tolerance.
+
+Usage:
+    benchmarks/bench_download.py [--drivers asf,unavco,va4] [--parallel 1,2,4]
+                                 [--files N] [--size MB] [--latency MS] [--bandwidth MB/S]
+                                 [--fail-rate P] [--drop-rate P] [--save FILE] [--compare FILE]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+try:
+    import BaseHTTPServer as httpserver
+    import SocketServer as socketserver
+except ImportError:
+    import http.server as httpserver
+    import socketserver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USER = 'bench'
+PASSWORD = 'bench-password'
+REALM = 'SSARA benchmark'
+SESSION = 'bench_session=0123456789abcdef'
+
+COLLECTIONS = {'asf': 'Alaska Satellite Facility', 'unavco': 'WInSAR', 'va4': 'Supersites VA4'}
+
+### STAND-IN SERVER ###
+
+class Handler(httpserver.BaseHTTPRequestHandler):
+    """Serves the synthetic granules, see the module docstring for the URL layout."""
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=b'', headers=()):
+        self.send_response(code)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _digest_ok(self):
+        '''Check a Digest Authorization header (RFC 2617, MD5 with qop=auth).'''
+        header = self.headers.get('Authorization') or ''
+        if not header.startswith('Digest '):
+            return False
+        fields = {}
+        for item in header[len('Digest '):].split(','):
+            key, _, value = item.strip().partition('=')
+            fields[key] = value.strip('"')
+        md5 = lambda s: hashlib.md5(s.encode('utf-8')).hexdigest()
+        ha1 = md5('%s:%s:%s' % (USER, REALM, PASSWORD))
+        ha2 = md5('%s:%s' % (self.command, fields.get('uri', '')))
+        expected = md5(':'.join([ha1, fields.get('nonce', ''), fields.get('nc', ''), fields.get('cnonce', ''), fields.get('qop', ''), ha2]))
+        return fields.get('username') == USER and fields.get('response') == expected
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = self.rfile.read(length).decode('utf-8')
+        if self.path == '/asf/login' and 'user_name=%s' % USER in form:
+            self._send(200, b'logged in', [('Set-Cookie', SESSION + '; Path=/')])
+        else:
+            self._send(401, b'login failed')
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        time.sleep(self.server.latency)
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[1] != 'files' or parts[0] not in COLLECTIONS:
+            return self._send(404, b'not found')
+        archive = parts[0]
+        if archive == 'asf' and SESSION not in (self.headers.get('Cookie') or ''):
+            return self._send(401, b'not logged in')
+        if archive == 'unavco' and not self._digest_ok():
+            nonce = hashlib.md5(str(random.random()).encode('utf-8')).hexdigest()
+            return self._send(401, b'authorization required', [('WWW-Authenticate', 'Digest realm="%s", nonce="%s", qop="auth", algorithm="MD5"' % (REALM, nonce))])
+        with self.server.lock:
+            roll = self.server.random.random()
+        if not head and roll < self.server.fail_rate:
+            return self._send(503, b'injected failure')
+        drop = not head and roll < self.server.fail_rate + self.server.drop_rate
+
+        size = self.server.size
+        start, end = 0, size - 1
+        byte_range = self.headers.get('Range')
+        if byte_range and byte_range.startswith('bytes='):
+            first, _, last = byte_range[len('bytes='):].partition('-')
+            start, end = (int(first), int(last or size - 1)) if first else (size - int(last), size - 1)
+            if start >= size:
+                return self._send(416, b'', [('Content-Range', 'bytes */%d' % size)])
+            end = min(end, size - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+        self._stream(start, end + 1, (start + end) // 2 if drop else None)
+
+    def _stream(self, start, stop, cut=None):
+        '''Write bytes start:stop of the granule at the bandwidth limit, stopping at cut.'''
+        block = self.server.block
+        chunk = 64 * 1024
+        began = time.time()
+        pos = start
+        while pos < stop:
+            if cut is not None and pos >= cut:
+                self.close_connection = True
+                return
+            n = min(chunk, stop - pos, len(block) - pos % len(block))
+            self.wfile.write(block[pos % len(block):pos % len(block) + n])
+            pos += n
+            if self.server.bandwidth:
+                ahead = (pos - start) / self.server.bandwidth - (time.time() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+class Server(socketserver.ThreadingMixIn, httpserver.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+def serve(clos):
+    '''Run the stand-in server until killed, printing its port first.'''
+    server = Server(('127.0.0.1', clos.port), Handler)
+    server.size = int(clos.size * 1024 * 1024)
+    server.latency = clos.latency / 1000.0
+    server.bandwidth = clos.bandwidth * 1024 * 1024
+    server.fail_rate = clos.fail_rate
+    server.drop_rate = clos.drop_rate
+    server.random = random.Random(clos.seed)
+    server.lock = threading.Lock()
+    # granule contents: one random MB repeated
+    server.block = bytes(bytearray(random.Random(clos.seed).getrandbits(8) for i in range(1024 * 1024)))
+    print(server.server_address[1])
+    sys.stdout.flush()
+    server.serve_forever()
+
+### DOWNLOAD WORKER ###
+
+class Credentials(object):
+    asfuser = unavuser = eossouser = USER
+    asfpass = unavpass = eossopass = PASSWORD
+
+def worker(clos):
+    '''Download --files granules with one driver in this process and print the measurements as JSON.'''
+    import resource
+    # va4_dl runs secp from the directory of sys.argv[0]
+    sys.argv[0] = os.path.join(ROOT, 'ssara_federated_query.py')
+    sys.path.insert(0, ROOT)
+    import ssara_federated_query as ssara
+    import password_config
+    base = 'http://127.0.0.1:%d' % clos.port
+    ssara.ASF_LOGIN_URL = base + '/asf/login'
+    ssara.UNAVCO_AUTH_URL = base + '/unavco/'
+    for key in ('eossouser', 'eossopass'):
+        setattr(password_config, key, getattr(Credentials, key))
+    scenes = [{'downloadUrl': '%s/%s/files/BENCH_%04d.zip' % (base, clos.worker, i),
+               'collectionName': COLLECTIONS[clos.worker],
+               'startTime': '2020-01-01 00:00:%02d' % (i % 60)} for i in range(clos.files)]
+    size = int(clos.size * 1024 * 1024)
+    parallel = int(clos.parallel)
+
+    workdir = tempfile.mkdtemp(prefix='bench_download_')
+    cwd = os.getcwd()
+    stdout = sys.stdout
+    try:
+        os.chdir(workdir)
+        sys.stdout = open(os.devnull, 'w')
+        client = ssara.SsaraClient(credentials=Credentials)
+        self_before = resource.getrusage(resource.RUSAGE_SELF)
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.time()
+        client.download(scenes, parallel)
+        wall = time.time() - start
+        # va4_dl does not wait for secp, reap it so its CPU time is counted
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except OSError:
+            pass
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        complete = sum(1 for d in scenes
+                       if os.path.exists(os.path.basename(d['downloadUrl'])) and os.path.getsize(os.path.basename(d['downloadUrl'])) == size)
+    finally:
+        sys.stdout = stdout
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    cpu = lambda r: r.ru_utime + r.ru_stime
+    result = {'driver': clos.worker, 'parallel': parallel, 'files': clos.files, 'complete': complete,
+              'mb': complete * size / (1024 * 1024.0), 'wall': wall,
+              'cpu': cpu(self_after) - cpu(self_before) + cpu(children_after) - cpu(children_before),
+              # ru_maxrss is in kB on Linux and in bytes on Mac OS X
+              'rss_mb': self_after.ru_maxrss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)}
+    result['mb_sec'] = result['mb'] / wall if wall else 0.0
+    print(json.dumps(result))
+
+### BENCHMARK ###
+
+def compare(results, baseline, tolerance):
+    '''Regressions of results against baseline, as a list of messages.'''
+    old = dict(((r['driver'], r['parallel']), r) for r in baseline)
+    problems = []
+    for r in results:
+        b = old.get((r['driver'], r['parallel']))
+        if b is None:
+            continue
+        name = '%s --parallel %d' % (r['driver'], r['parallel'])
+        if r['mb_sec'] < b['mb_sec'] * (1 - tolerance):
+            problems.append('%s: throughput %.1f MB/s, was %.1f MB/s' % (name, r['mb_sec'], b['mb_sec']))
+        if r['complete'] < b['complete']:
+            problems.append('%s: %d complete granules, was %d' % (name, r['complete'], b['complete']))
+        if r['rss_mb'] > b['rss_mb'] * (1 + tolerance):
+            problems.append('%s: peak RSS %.1f MB, was %.1f MB' % (name, r['rss_mb'], b['rss_mb']))
+    return problems
+
+def parse():
+    parser = argparse.ArgumentParser(description='Benchmark the download drivers against a local stand-in for the archives')
+    parser.add_argument('--drivers', default='asf,unavco,va4', help='comma separated drivers to run (default=%(default)s)')
+    parser.add_argument('--parallel', default='1,2,4', help='comma separated --parallel levels (default=%(default)s)')
+    parser.add_argument('--files', type=int, default=8, help='granules per run (default=%(default)s)')
+    parser.add_argument('--size', type=float, default=8, help='granule size in MB (default=%(default)s)')
+    parser.add_argument('--latency', type=float, default=20, help='delay before every response in ms (default=%(default)s)')
+    parser.add_argument('--bandwidth', type=float, default=0, help='per connection limit in MB/s, 0 for none (default=%(default)s)')
+    parser.add_argument('--fail-rate', dest='fail_rate', type=float, default=0, help='fraction of file requests that fail with 503 (default=%(default)s)')
+    parser.add_argument('--drop-rate', dest='drop_rate', type=float, default=0, help='fraction of file requests cut off halfway (default=%(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for contents and failures (default=%(default)s)')
+    parser.add_argument('--port', type=int, default=0, help='port of the stand-in server, 0 picks a free one (default=%(default)s)')
+    parser.add_argument('--python2', default='python2', help='python 2 interpreter command for the drivers (default=%(default)s)')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression for --compare (default=%(default)s)')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main(argv):
+    clos = parse()
+    if clos.serve:
+        return serve(clos)
+    if clos.worker:
+        return worker(clos)
+
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve'] + argv[1:], stdout=subprocess.PIPE)
+    results = []
+    try:
+        port = int(server.stdout.readline())
+        options = ['--port', str(port), '--files', str(clos.files), '--size', str(clos.size)]
+        print('stand-in on port %d: %d granules of %.1f MB, latency %.0f ms, bandwidth %s, fail %.0f%%, drop %.0f%%'
+              % (port, clos.files, clos.size, clos.latency, '%.1f MB/s' % clos.bandwidth if clos.bandwidth else 'unlimited',
+                 clos.fail_rate * 100, clos.drop_rate * 100))
+        print('%-8s %8s %9s %8s %8s %8s %8s %8s' % ('driver', 'parallel', 'complete', 'MB', 'wall s', 'MB/s', 'cpu s', 'RSS MB'))
+        for driver in clos.drivers.split(','):
+            for parallel in [int(p) for p in clos.parallel.split(',')]:
+                proc = subprocess.Popen(clos.python2.split() + [os.path.abspath(__file__), '--worker', driver, '--parallel', str(parallel)] + options,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                out, err = proc.communicate()
+                if proc.returncode:
+                    print('%-8s %8d  FAILED (%s)' % (driver, parallel, (err.decode('utf-8', 'replace').strip().splitlines() or ['?'])[-1]))
+                    continue
+                r = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+                results.append(r)
+                print('%-8s %8d %5d/%-3d %8.1f %8.2f %8.1f %8.2f %8.1f' % (driver, parallel, r['complete'], r['files'], r['mb'], r['wall'], r['mb_sec'], r['cpu'], r['rss_mb']))
+    finally:
+        server.terminate()
+        server.wait()
+
+    if clos.save:
+        with open(clos.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if clos.compare:
+        with open(clos.compare) as f:
+            problems = compare(results, json.load(f), clos.tolerance)
+        for p in problems:
+            print('REGRESSION', p)
+        return 1 if problems else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[:]))
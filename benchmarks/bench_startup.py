@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+###############################################################################
+# bench_startup.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Startup time budget for the command line tools
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+"""Check that --help of every command line tool stays within its startup budget.
+
+Each tool is run with -h in a fresh interpreter a few times. The median wall
+time is compared to the budget, and the modules that were imported are
+checked against the ones that must stay deferred until they are needed.
+Exits with status 1 if any tool is over budget or imports a deferred module.
+
+Usage:
+    benchmarks/bench_startup.py [--repeat N] [--python2 CMD] [--python3 CMD] [--scale X]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (script, interpreter, budget in seconds, modules that --help must not import)
+# the converters import numpy for their readers, hence the larger budgets
+TOOLS = [('ssara_federated_query.py', 'python2', 0.06, ['urllib2', 'urllib', 'json', 'csv', 'threading', 'Queue', 'subprocess']),
+         ('data_utils/gdal2roipac.py', 'python2', 0.06, ['osgeo', 'numpy']),
+         ('data_utils/roipac2hdf5.py', 'python2', 0.25, ['h5py']),
+         ('data_utils/gmtsar2hdf5.py', 'python2', 0.25, ['h5py', 'osgeo']),
+         ('data_utils/isce2hdf5.py', 'python3', 0.25, ['h5py', 'osgeo', 'isce', 'isceobj']),
+         ('data_utils/h5subset.py', 'python3', 0.25, ['h5py', 'multiprocessing']),
+         ('data_utils/h5catalog.py', 'python3', 0.25, ['h5py'])]
+
+# run the tool as __main__ with -h, then report which of the watched modules got imported
+DRIVER = """import sys, runpy
+sys.argv = [%(script)r, '-h']
+sys.path.insert(0, %(path)r)
+stdout = sys.stdout
+sys.stdout = open(%(devnull)r, 'w')
+try:
+    runpy.run_path(%(script)r, run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = stdout
+print(' '.join(m for m in %(watch)r if m in sys.modules))
+"""
+
+def run_tool(interpreter, script, watch):
+    '''Run script -h once, returns (seconds, imported watched modules).'''
+    code = DRIVER % {'script': script, 'path': os.path.dirname(script), 'devnull': os.devnull, 'watch': watch}
+    start = time.time()
+    proc = subprocess.Popen(interpreter.split() + ['-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    elapsed = time.time() - start
+    if proc.returncode:
+        raise RuntimeError(err.decode('utf-8', 'replace').strip().splitlines()[-1])
+    return elapsed, out.decode('utf-8').split()
+
+def parse():
+    parser = argparse.ArgumentParser(description='Check the --help startup time of the command line tools')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per tool, the median is used (default=%(default)s)')
+    parser.add_argument('--python2', default='python2', help='python 2 interpreter command (default=%(default)s)')
+    parser.add_argument('--python3', default='python3', help='python 3 interpreter command (default=%(default)s)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply all budgets, e.g. for slow machines')
+    return parser.parse_args()
+
+def main(argv):
+    clos = parse()
+    interpreters = {'python2': clos.python2, 'python3': clos.python3}
+    failed = False
+    print('%-28s %10s %10s  %s' % ('tool', 'median ms', 'budget ms', 'status'))
+    for script, interpreter, budget, watch in TOOLS:
+        budget *= clos.scale
+        try:
+            runs = [run_tool(interpreters[interpreter], os.path.join(ROOT, script), watch) for i in range(clos.repeat)]
+        except (RuntimeError, OSError) as e:
+            print('%-28s %10s %10.0f  SKIPPED (%s)' % (script, '-', budget * 1000, e))
+            continue
+        median = sorted(t for t, imported in runs)[len(runs) // 2]
+        imported = runs[0][1]
+        status = 'ok'
+        if imported:
+            status = 'FAIL imports %s' % ', '.join(imported)
+        elif median > budget:
+            status = 'FAIL over budget'
+        failed = failed or status != 'ok'
+        print('%-28s %10.1f %10.0f  %s' % (script, median * 1000, budget * 1000, status))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[:]))
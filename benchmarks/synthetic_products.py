@@ -0,0 +1,264 @@
+#! /usr/bin/env python
+###############################################################################
+# synthetic_products.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Synthetic ROI_PAC, ISCE and GMTSAR products for the benchmarks
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+"""Write synthetic interferogram products in the layout the converters expect.
+
+The rasters have any size and are generated block by block, so products
+larger than memory can be made. They look enough like real data for
+compression and statistics to behave realistically: a phase ramp plus a
+deformation bump, speckle noise, coherence that drops away from the centre,
+and a no-data wedge (zeros, or NaN in the GMTSAR grids) like the edge of a
+geocoded swath.
+
+    roipac  int_070603-070721/ with the geo_*.unw/.int/.cor, geo_incidence.unw,
+            the SLC and baseline .rsc files, and DEM/roipac.dem next to it;
+            run roipac2hdf5.py in int_070603-070721/
+    isce    filt_topophase.flat.geo, filt_topophase.flat.unw.geo, phsig.cor.geo,
+            los.rdr.geo with their .xml and insarProc.xml
+    gmtsar  phase_ll.grd, phasefilt_ll.grd, unwrap_ll.grd, corr_ll.grd and
+            master.PRM/slave.PRM (the grids are written with GDAL)
+
+Usage:
+    benchmarks/synthetic_products.py roipac|isce|gmtsar DIR [--length L] [--width W] [--seed N]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+WEST = -118.0
+NORTH = 36.0
+STEP = 0.000833333
+BLOCK_ROWS = 256
+
+ROIPAC_DATES = ('070603', '070721')
+ROIPAC_DIR = 'int_%s-%s' % ROIPAC_DATES
+
+def fields(length, width, r0, r1, seed=1):
+    '''Synthetic rows r0:r1: amplitude, unwrapped phase, wrapped complex, coherence, incidence, elevation.
+
+    Pixels outside the swath are 0 in every layer, low coherence pixels are
+    not unwrapped (0 in the unwrapped phase).
+    '''
+    rng = np.random.RandomState(seed * 100003 + r0)
+    y, x = np.mgrid[r0:r1, 0:width].astype(np.float32)
+    y /= length
+    x /= width
+    bump = np.exp(-((x - 0.5) ** 2 + (y - 0.5) ** 2) / 0.02)
+    unw = 2 * np.pi * (3 * x + 2 * y) + 10 * bump
+    cor = np.clip(0.2 + 0.7 * np.exp(-((x - 0.5) ** 2 + (y - 0.5) ** 2) / 0.2) + 0.1 * rng.standard_normal(x.shape), 0, 1)
+    amp = np.abs(100 + 30 * rng.standard_normal(x.shape)).astype(np.float32)
+    noise = rng.standard_normal(x.shape) * (1 - cor)
+    wrapped = (amp * np.exp(1j * (unw + noise))).astype(np.complex64)
+    incidence = 19 + 8 * x
+    elevation = (500 + 1500 * bump + 200 * np.sin(8 * x) * np.cos(5 * y)).astype(np.int16)
+    outside = x < 0.15 * (1 - y)
+    for a in (amp, unw, cor, wrapped, incidence, elevation):
+        a[outside] = 0
+    unw[cor < 0.3] = 0
+    return (amp, unw.astype(np.float32), wrapped, cor.astype(np.float32), incidence.astype(np.float32), elevation)
+
+def blocks(length, width, seed=1):
+    for r0 in range(0, length, BLOCK_ROWS):
+        yield fields(length, width, r0, min(r0 + BLOCK_ROWS, length), seed)
+
+def rmg(a, b):
+    '''Interleave two (rows, width) arrays by line, like ROI_PAC rmg and ISCE BIL files.'''
+    return np.stack([a, b], axis=1).astype(np.float32)
+
+def write_keys(path, keys, sep=' '):
+    with open(path, 'w') as f:
+        for key, value in keys:
+            f.write('%s%s%s\n' % (key.ljust(40) if sep == ' ' else key, sep, value))
+
+def write_rasters(paths, layers, length, width, seed):
+    '''Write the rasters in paths, layers(block) gives the array for each path.'''
+    files = [open(p, 'wb') for p in paths]
+    try:
+        for block in blocks(length, width, seed):
+            for f, a in zip(files, layers(block)):
+                a.tofile(f)
+    finally:
+        for f in files:
+            f.close()
+
+### ROI_PAC ###
+
+def roipac(directory, length, width, seed=1):
+    south, east = NORTH - length * STEP, WEST + width * STEP
+    geo = [('WIDTH', width), ('FILE_LENGTH', length), ('X_FIRST', WEST), ('X_STEP', STEP), ('X_UNIT', 'degres'),
+           ('Y_FIRST', NORTH), ('Y_STEP', -STEP), ('Y_UNIT', 'degres'), ('WAVELENGTH', 0.0562356424),
+           ('LAT_REF1', NORTH), ('LON_REF1', WEST), ('LAT_REF2', NORTH), ('LON_REF2', east),
+           ('LAT_REF3', south), ('LON_REF3', WEST), ('LAT_REF4', south), ('LON_REF4', east)]
+    intdir = os.path.join(directory, ROIPAC_DIR)
+    demdir = os.path.join(directory, 'DEM')
+    for d in (intdir, demdir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    for i, date in enumerate(ROIPAC_DATES):
+        write_keys(os.path.join(intdir, date + '.slc.rsc'),
+                   [('DATE', date), ('PLATFORM', 'ENVISAT'), ('TRACK', 170), ('FIRST_FRAME', 2925),
+                    ('ORBIT_DIRECTION', 'ascending'), ('ANTENNA_SIDE', -1), ('POLARIZATION', 'VV'),
+                    ('PRF', 1652.41576), ('ORBIT_NUMBER', 27501 + 501 * i), ('DOPPLER_RANGE0', 0.3012),
+                    ('DOPPLER_RANGE1', -1.2e-05), ('DOPPLER_RANGE2', 0), ('DOPPLER_RANGE3', 0)])
+    write_keys(os.path.join(intdir, '%s_%s_baseline.rsc' % ROIPAC_DATES),
+               [('P_BASELINE_TOP_HDR', 48.3), ('P_BASELINE_BOTTOM_HDR', 51.1)])
+    root = os.path.join(intdir, 'geo_%s-%s' % ROIPAC_DATES)
+    paths = [root + '.unw', root + '.int', root + '.cor', os.path.join(intdir, 'geo_incidence.unw'), os.path.join(demdir, 'roipac.dem')]
+    for p in paths:
+        write_keys(p + '.rsc', geo)
+    write_rasters(paths, lambda b: (rmg(b[0], b[1]), b[2], rmg(b[0], b[3]), rmg(b[4], b[4]), b[5]), length, width, seed)
+    return intdir
+
+### ISCE ###
+
+ISCE_IMAGE = """<imageFile>
+    <property name="width"><value>%(width)d</value></property>
+    <property name="length"><value>%(length)d</value></property>
+    <property name="data_type"><value>%(data_type)s</value></property>
+    <property name="scheme"><value>%(scheme)s</value></property>
+    <property name="number_bands"><value>%(bands)d</value></property>
+    <property name="file_name"><value>%(file_name)s</value></property>
+    <component name="coordinate1">
+        <factorymodule>isceobj.Image</factorymodule>
+        <property name="startingValue"><value>%(west)r</value></property>
+        <property name="delta"><value>%(step)r</value></property>
+        <property name="size"><value>%(width)d</value></property>
+    </component>
+    <component name="coordinate2">
+        <factorymodule>isceobj.Image</factorymodule>
+        <property name="startingValue"><value>%(north)r</value></property>
+        <property name="delta"><value>%(ystep)r</value></property>
+        <property name="size"><value>%(length)d</value></property>
+    </component>
+</imageFile>
+"""
+
+INSAR_PROC = """<insarProc>
+    <master>
+        <frame>
+            <SENSING_START>2007-06-03 05:49:51.123456</SENSING_START>
+            <SENSING_STOP>2007-06-03 05:50:07.654321</SENSING_STOP>
+            <TRACK_NUMBER>170</TRACK_NUMBER>
+            <ORBIT_NUMBER>27501</ORBIT_NUMBER>
+            <PASS_DIRECTION>ASCENDING</PASS_DIRECTION>
+            <POLARIZATION>VV</POLARIZATION>
+        </frame>
+        <platform><MISSION>ENVISAT</MISSION></platform>
+        <lookSide>-1</lookSide>
+        <wavelength>0.0562356424</wavelength>
+        <prf>1652.41576</prf>
+    </master>
+    <slave>
+        <frame>
+            <SENSING_START>2007-07-21 05:49:50.123456</SENSING_START>
+            <SENSING_STOP>2007-07-21 05:50:06.654321</SENSING_STOP>
+            <TRACK_NUMBER>170</TRACK_NUMBER>
+            <ORBIT_NUMBER>28002</ORBIT_NUMBER>
+            <PASS_DIRECTION>ASCENDING</PASS_DIRECTION>
+            <POLARIZATION>VV</POLARIZATION>
+        </frame>
+        <platform><MISSION>ENVISAT</MISSION></platform>
+    </slave>
+    <baseline>
+        <perp_baseline_top>48.3</perp_baseline_top>
+        <perp_baseline_bottom>51.1</perp_baseline_bottom>
+    </baseline>
+</insarProc>
+"""
+
+def isce(directory, length, width, seed=1):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    images = [('filt_topophase.flat.unw.geo', 'FLOAT', 'BIL', 2),
+              ('filt_topophase.flat.geo', 'CFLOAT', 'BIP', 1),
+              ('phsig.cor.geo', 'FLOAT', 'BIP', 1),
+              ('los.rdr.geo', 'FLOAT', 'BIL', 2)]
+    for name, data_type, scheme, bands in images:
+        with open(os.path.join(directory, name + '.xml'), 'w') as f:
+            f.write(ISCE_IMAGE % {'width': width, 'length': length, 'data_type': data_type, 'scheme': scheme, 'bands': bands,
+                                  'file_name': name, 'west': WEST, 'north': NORTH, 'step': STEP, 'ystep': -STEP})
+    with open(os.path.join(directory, 'insarProc.xml'), 'w') as f:
+        f.write(INSAR_PROC)
+    paths = [os.path.join(directory, name) for name, data_type, scheme, bands in images]
+    write_rasters(paths, lambda b: (rmg(b[0], b[1]), b[2], b[3], rmg(90 - b[4], b[4])), length, width, seed)
+    return directory
+
+### GMTSAR ###
+
+def gmtsar(directory, length, width, seed=1):
+    from osgeo import gdal
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name, clock, extra in (('master.PRM', '2007154.2429', []), ('slave.PRM', '2007202.2429', [('baseline_center', 49.7)])):
+        write_keys(os.path.join(directory, name),
+                   [('SC_identity', 4), ('SC_clock_start', clock), ('PRF', 1652.41576), ('radar_wavelength', 0.0562356424),
+                    ('fd1', 0.3012), ('orbdir', 'A')] + extra, ' = ')
+    driver = gdal.GetDriverByName('netCDF')
+    grids = []
+    for name in ('phase_ll.grd', 'phasefilt_ll.grd', 'unwrap_ll.grd', 'corr_ll.grd'):
+        grid = driver.Create(os.path.join(directory, name), width, length, 1, gdal.GDT_Float32)
+        grid.SetGeoTransform((WEST, STEP, 0, NORTH, 0, -STEP))
+        grid.GetRasterBand(1).SetNoDataValue(float('nan'))
+        grids.append(grid)
+    r0 = 0
+    for amp, unw, wrapped, cor, incidence, elevation in blocks(length, width, seed):
+        phase = np.angle(wrapped).astype(np.float32)
+        layers = [phase, phase, unw, cor]
+        for grid, a in zip(grids, layers):
+            a = a.copy()
+            a[amp == 0] = np.nan
+            grid.GetRasterBand(1).WriteArray(a, 0, r0)
+        r0 += len(amp)
+    for grid in grids:
+        grid.FlushCache()
+    return directory
+
+PRODUCTS = {'roipac': roipac, 'isce': isce, 'gmtsar': gmtsar}
+
+def parse():
+    parser = argparse.ArgumentParser(description='Write a synthetic ROI_PAC, ISCE or GMTSAR interferogram product')
+    parser.add_argument('product', choices=sorted(PRODUCTS), help='processor layout to write')
+    parser.add_argument('directory', help='output directory, created if needed')
+    parser.add_argument('--length', type=int, default=2048, help='rows (default=%(default)s)')
+    parser.add_argument('--width', type=int, default=2048, help='columns (default=%(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default=%(default)s)')
+    return parser.parse_args()
+
+def main(argv):
+    clos = parse()
+    workdir = PRODUCTS[clos.product](clos.directory, clos.length, clos.width, clos.seed)
+    print(workdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[:]))
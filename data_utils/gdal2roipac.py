@@ -31,109 +31,175 @@
 
 import os
 import sys
-from osgeo import gdal
+import argparse
 
-if len(sys.argv)<3:
-    print "USAGE: %s IN_FILE OUT_FILE" % sys.argv[0]
-    print "\nExample: %s dem.tif roipac.dem" % sys.argv[0]
-    exit()
+# ISCE DATA_TYPE names for the numpy types that can be written
+ISCE_TYPES = {'uint8': 'BYTE', 'int16': 'SHORT', 'int32': 'INT', 'float32': 'FLOAT', 'float64': 'DOUBLE', 'complex64': 'CFLOAT'}
+# approximate size of the row strips streamed from GDAL to the output file
+STRIP_BYTES = 32 * 1024 * 1024
 
-workdir = os.getcwd()
-input_name = workdir+'/'+sys.argv[1]
-output_name = workdir+'/'+sys.argv[2]
-#######################################
-##### CREATE A ROI_PAC FORMAT DEM #####
-#######################################
-indataset = gdal.Open(input_name)
-data = indataset.ReadAsArray()
-data.flatten()
-data.tofile(output_name)
-adfGeoTransform = indataset.GetGeoTransform(can_return_null = True)
-x_first = '%.12f' % adfGeoTransform[0]
-x_step = '%.12f' % adfGeoTransform[1]
-y_first = '%.12f' % adfGeoTransform[3]
-y_step = '%.12f' % adfGeoTransform[5]
-with open(output_name+'.rsc','w') as RSC:
-    RSC.write('WIDTH          '+str(indataset.RasterXSize)+'\n')
-    RSC.write('FILE_LENGTH    '+str(indataset.RasterYSize)+'\n')
-    RSC.write('X_FIRST        '+x_first+'\n')
-    RSC.write('Y_FIRST        '+y_first+'\n')
-    RSC.write('X_STEP         '+x_step+'\n')
-    RSC.write('Y_STEP         '+y_step+'\n')
-    RSC.write('Z_SCALE        1\n')
-    RSC.write('Z_OFFSET       0\n')
-    RSC.write('X_UNIT         degrees\n')
-    RSC.write('Y_UNIT         degrees\n')
-    RSC.write('PROJECTION     LATLON')
+def parse():
+    '''Command line parser.'''
+    parser = argparse.ArgumentParser(description='Convert any format supported by GDAL to ROI_PAC format',
+                                     epilog='Example: %s dem.tif roipac.dem  or  %s -dtype int16 -nodata 0 a.tif a.dem b.tif b.dem' % (sys.argv[0],sys.argv[0]))
+    parser.add_argument('files', nargs='+', metavar='IN_FILE OUT_FILE', help='one or more input/output file pairs')
+    parser.add_argument('-dtype', dest='dtype', action='store', choices=sorted(ISCE_TYPES), help='convert the data to this type (default is the input type)')
+    parser.add_argument('-nodata', dest='nodata', action='store', type=float, help='replace the input nodata value (and nan) with this value')
+    clos = parser.parse_args()
+    if len(clos.files) % 2:
+        parser.error('input and output files have to be given in pairs')
+    return clos
 
-### MAKE AN XML FILE FOR ISCE ###
-with open(output_name+'.xml','w') as XML:
-    XML.write('<imageFile>\n')
-    XML.write('    <property name="BYTE_ORDER">\n')
-    XML.write('        <value>l</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="DATA_TYPE">\n')
-    XML.write('        <value>SHORT</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="IMAGE_TYPE">\n')
-    XML.write('        <value>dem</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="REFERENCE">\n')
-    XML.write('        <value>EGM96</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="WIDTH">\n')
-    XML.write('        <value>'+str(indataset.RasterXSize)+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="LENGTH">\n')
-    XML.write('        <value>'+str(indataset.RasterYSize)+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="FILE_NAME">\n')
-    XML.write('        <value>'+output_name+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="DELTA_LONGITUDE">\n')
-    XML.write('        <value>'+x_step+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="DELTA_LATITUDE">\n')
-    XML.write('        <value>'+y_step+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="FIRST_LONGITUDE">\n')
-    XML.write('        <value>'+x_first+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <property name="FIRST_LATITUDE">\n')
-    XML.write('        <value>'+y_first+'</value>\n')
-    XML.write('    </property>\n')
-    XML.write('    <component name="Coordinate1">\n')
-    XML.write('        <factorymodule>isceobj.Image</factorymodule>\n')
-    XML.write('        <factoryname>createCoordinate</factoryname>\n')
-    XML.write('        <doc>First coordinate of a 2D image (witdh).</doc>\n')
-    XML.write('        <property name="startingValue">\n')
-    XML.write('            <value>'+x_first+'</value>\n')
-    XML.write('        </property>\n')
-    XML.write('        <property name="delta">\n')
-    XML.write('            <value>'+x_step+'</value>\n')
-    XML.write("            <doc>{'doc': 'Coordinate quantization.'}</doc>\n")
-    XML.write('            <units>{}</units>\n')
-    XML.write('        </property>\n')
-    XML.write('        <property name="size">\n')
-    XML.write('            <value>'+str(indataset.RasterXSize)+'</value>\n')
-    XML.write("            <doc>{'doc': 'Coordinate size.'}</doc>\n")
-    XML.write('        </property>\n')
-    XML.write('    </component>\n')
-    XML.write('    <component name="Coordinate2">\n')
-    XML.write('        <factorymodule>isceobj.Image</factorymodule>\n')
-    XML.write('        <factoryname>createCoordinate</factoryname>\n')
-    XML.write('        <doc>Second coordinate of a 2D image (length).</doc>\n')
-    XML.write('        <property name="startingValue">\n')
-    XML.write('            <value>'+y_first+'</value>\n')
-    XML.write('        </property>\n')
-    XML.write('        <property name="delta">\n')
-    XML.write('            <value>'+y_step+'</value>\n')
-    XML.write("            <doc>{'doc': 'Coordinate quantization.'}</doc>\n")
-    XML.write('            <units>{}</units>\n')
-    XML.write('        </property>\n')
-    XML.write('        <property name="size">\n')
-    XML.write('            <value>'+str(indataset.RasterYSize)+'</value>\n')
-    XML.write("            <doc>{'doc': 'Coordinate size.'}</doc>\n")
-    XML.write('        </property>\n')
-    XML.write('    </component>\n')
-    XML.write('</imageFile>')
+def convert(input_name, output_name, dtype=None, nodata=None):
+    '''Stream the first band of input_name to a ROI_PAC binary file with .rsc and ISCE .xml files.
+
+    The band is read in strips of whole GDAL blocks, so only one strip is in
+    memory regardless of the size of the raster. Raises IOError if GDAL can
+    not read input_name and ValueError if it has no georeferenced band, is
+    empty or the output type has no ISCE name, before anything is written.
+    '''
+    import numpy as np
+    from osgeo import gdal
+    from osgeo import gdal_array
+    indataset = gdal.Open(input_name)
+    if indataset is None:
+        raise IOError('GDAL can not read %s' % input_name)
+    if not indataset.RasterCount:
+        raise ValueError('%s has no raster band' % input_name)
+    if indataset.GetGeoTransform(can_return_null = True) is None:
+        raise ValueError('%s is not georeferenced' % input_name)
+    band = indataset.GetRasterBand(1)
+    out_dtype = np.dtype(dtype or gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+    if out_dtype.name not in ISCE_TYPES:
+        raise ValueError('%s has %s data, which has no ISCE type; convert it with -dtype %s' % (input_name, out_dtype.name, '|'.join(sorted(ISCE_TYPES))))
+    data_type = ISCE_TYPES[out_dtype.name]
+    width = indataset.RasterXSize
+    length = indataset.RasterYSize
+    if not width or not length:
+        raise ValueError('%s is empty (%d x %d)' % (input_name, length, width))
+    in_nodata = band.GetNoDataValue()
+    block_length = band.GetBlockSize()[1]
+    strip = block_length * max(1, STRIP_BYTES // (block_length * width * 8))
+    with open(output_name, 'wb') as out:
+        for row in range(0, length, strip):
+            data = band.ReadAsArray(0, row, width, min(strip, length - row))
+            if nodata is not None:
+                mask = data == in_nodata if in_nodata is not None else np.zeros(data.shape, dtype=bool)
+                if data.dtype.kind in 'fc':
+                    mask |= np.isnan(data)
+                data[mask] = nodata
+            data.astype(out_dtype, copy=False).tofile(out)
+    write_metadata(indataset, output_name, data_type)
+
+def write_metadata(indataset, output_name, data_type='SHORT'):
+    '''Write the ROI_PAC .rsc and the ISCE .xml files for output_name.'''
+    adfGeoTransform = indataset.GetGeoTransform(can_return_null = True)
+    x_first = '%.12f' % adfGeoTransform[0]
+    x_step = '%.12f' % adfGeoTransform[1]
+    y_first = '%.12f' % adfGeoTransform[3]
+    y_step = '%.12f' % adfGeoTransform[5]
+    with open(output_name+'.rsc','w') as RSC:
+        RSC.write('WIDTH          '+str(indataset.RasterXSize)+'\n')
+        RSC.write('FILE_LENGTH    '+str(indataset.RasterYSize)+'\n')
+        RSC.write('X_FIRST        '+x_first+'\n')
+        RSC.write('Y_FIRST        '+y_first+'\n')
+        RSC.write('X_STEP         '+x_step+'\n')
+        RSC.write('Y_STEP         '+y_step+'\n')
+        RSC.write('Z_SCALE        1\n')
+        RSC.write('Z_OFFSET       0\n')
+        RSC.write('X_UNIT         degrees\n')
+        RSC.write('Y_UNIT         degrees\n')
+        RSC.write('PROJECTION     LATLON')
+
+    ### MAKE AN XML FILE FOR ISCE ###
+    with open(output_name+'.xml','w') as XML:
+        XML.write('<imageFile>\n')
+        XML.write('    <property name="BYTE_ORDER">\n')
+        XML.write('        <value>l</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="DATA_TYPE">\n')
+        XML.write('        <value>'+data_type+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="IMAGE_TYPE">\n')
+        XML.write('        <value>dem</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="REFERENCE">\n')
+        XML.write('        <value>EGM96</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="WIDTH">\n')
+        XML.write('        <value>'+str(indataset.RasterXSize)+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="LENGTH">\n')
+        XML.write('        <value>'+str(indataset.RasterYSize)+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="FILE_NAME">\n')
+        XML.write('        <value>'+output_name+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="DELTA_LONGITUDE">\n')
+        XML.write('        <value>'+x_step+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="DELTA_LATITUDE">\n')
+        XML.write('        <value>'+y_step+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="FIRST_LONGITUDE">\n')
+        XML.write('        <value>'+x_first+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <property name="FIRST_LATITUDE">\n')
+        XML.write('        <value>'+y_first+'</value>\n')
+        XML.write('    </property>\n')
+        XML.write('    <component name="Coordinate1">\n')
+        XML.write('        <factorymodule>isceobj.Image</factorymodule>\n')
+        XML.write('        <factoryname>createCoordinate</factoryname>\n')
+        XML.write('        <doc>First coordinate of a 2D image (witdh).</doc>\n')
+        XML.write('        <property name="startingValue">\n')
+        XML.write('            <value>'+x_first+'</value>\n')
+        XML.write('        </property>\n')
+        XML.write('        <property name="delta">\n')
+        XML.write('            <value>'+x_step+'</value>\n')
+        XML.write("            <doc>{'doc': 'Coordinate quantization.'}</doc>\n")
+        XML.write('            <units>{}</units>\n')
+        XML.write('        </property>\n')
+        XML.write('        <property name="size">\n')
+        XML.write('            <value>'+str(indataset.RasterXSize)+'</value>\n')
+        XML.write("            <doc>{'doc': 'Coordinate size.'}</doc>\n")
+        XML.write('        </property>\n')
+        XML.write('    </component>\n')
+        XML.write('    <component name="Coordinate2">\n')
+        XML.write('        <factorymodule>isceobj.Image</factorymodule>\n')
+        XML.write('        <factoryname>createCoordinate</factoryname>\n')
+        XML.write('        <doc>Second coordinate of a 2D image (length).</doc>\n')
+        XML.write('        <property name="startingValue">\n')
+        XML.write('            <value>'+y_first+'</value>\n')
+        XML.write('        </property>\n')
+        XML.write('        <property name="delta">\n')
+        XML.write('            <value>'+y_step+'</value>\n')
+        XML.write("            <doc>{'doc': 'Coordinate quantization.'}</doc>\n")
+        XML.write('            <units>{}</units>\n')
+        XML.write('        </property>\n')
+        XML.write('        <property name="size">\n')
+        XML.write('            <value>'+str(indataset.RasterYSize)+'</value>\n')
+        XML.write("            <doc>{'doc': 'Coordinate size.'}</doc>\n")
+        XML.write('        </property>\n')
+        XML.write('    </component>\n')
+        XML.write('</imageFile>')
+
+
+def main(argv):
+    clos = parse()
+    workdir = os.getcwd()
+    failed = 0
+    for input_file, output_file in zip(clos.files[0::2], clos.files[1::2]):
+        input_name = os.path.join(workdir, input_file)
+        output_name = os.path.join(workdir, output_file)
+        print 'Converting %s to %s' % (input_file, output_file)
+        try:
+            convert(input_name, output_name, clos.dtype, clos.nodata)
+        except (IOError, ValueError), e:
+            # report the file and go on with the rest of the batch
+            print 'Problem converting %s: %s' % (input_file, e)
+            failed += 1
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[:])
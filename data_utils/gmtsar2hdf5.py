@@ -34,15 +34,13 @@ import glob
 import datetime
 import argparse
 
-import h5py
-from osgeo import gdal
+import h5product
+import h5subset
+import sar_metadata
+import tracing
 
 def read_prm(prm_file):
-    prm_dict = {}
-    for line in open(prm_file):
-        c = line.split("=")
-        prm_dict[c[0].strip()] = str.replace(c[1], '\n', '').strip()
-    return prm_dict
+    return sar_metadata.read_prm(prm_file)
 
 def parse():
     '''Command line parser.
@@ -74,12 +72,33 @@ def parse():
     parser.add_argument('-slave_platform', dest='slave_platform', action='store', help='', type=str)
     parser.add_argument('-slave_orbit', dest='slave_absolute_orbit', action='store', help='', type=int)
 #    parser.add_argument('-', dest='', action='store', help='', type=str)
+    ## UPDATING EXISTING PRODUCTS ##
+    parser.add_argument('-checksum', dest='checksum', action='store_true', help='detect changed inputs by md5 of their contents instead of size/mtime')
+    parser.add_argument('-force', dest='force', action='store_true', help='rewrite all datasets even if their inputs did not change')
+    parser.add_argument('-no_overviews', dest='overviews', action='store_false', help='do not store the 2x, 4x and 8x downsampled OVERVIEW levels')
+    parser.add_argument('-quantize', dest='quantize', action='store_true', help='store correlation as uint8, wrapped phase and incidence as int16 and unwrapped phase as int32 steps of -unwrapped_precision, with CF scale_factor, add_offset and _FillValue attributes')
+    parser.add_argument('-unwrapped_precision', dest='unwrapped_precision', action='store', help='step of the quantized unwrapped phase in radians (default=%(default)s)', type=float, default=h5product.UNWRAPPED_PRECISION)
+    ## AREA OF INTEREST AND RESOLUTION ##
+    parser.add_argument('-bbox', dest='bbox', action='store', nargs=4, type=float, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'), help='only convert this lon/lat bounding box')
+    parser.add_argument('-wkt', dest='wkt', action='store', help='only convert the bounding box of this WKT geometry', type=str)
+    parser.add_argument('-looks', dest='looks', action='store', nargs=2, type=int, metavar=('ROWS', 'COLUMNS'), help='multilook: average ROWS x COLUMNS pixel windows (circular mean for the wrapped phase)')
+    ## PROFILING ##
+    parser.add_argument('-trace', dest='trace', action='store', help='write the time, bytes and allocations of each dataset conversion to this JSON trace file', type=str)
+    parser.add_argument('-trace_profile', dest='trace_profile', action='store_true', help='also profile the conversion with cProfile, saved as TRACE.prof')
+    parser.add_argument('-trace_memory', dest='trace_memory', action='store_true', help='also trace allocations with tracemalloc (python 3 only)')
     clos = parser.parse_args()
     return clos
 
 def main(argv):
     # GET THE COMMAND LINE OPTIONS 
     clos = parse()
+    # imported after parsing so that -h does not have to load GDAL
+    from osgeo import gdal
+    tracer = None
+    if clos.trace:
+        import atexit
+        tracer = tracing.Tracer(clos.trace, clos.trace_profile, clos.trace_memory)
+        atexit.register(tracer.close)
 
     print 'Creating HDF5 file containing correlation, wrapped, and unwrapped datasets'
     prm_master = read_prm(clos.prm1) # SET AS A DEFAULT IN parse() 
@@ -147,9 +166,6 @@ def main(argv):
     meta_dict['slave_doppler'] = prm_slave['fd1']
 #    meta_dict['slave_scene'] = ''
 
-#    meta_dict['average_coherence'] = 0.0
-#    meta_dict['max_coherence'] = 0.0
-#    meta_dict['percent_unwrapped'] = 0.0
 #    meta_dict['percent_atmos'] = 0.0
     meta_dict['baseline_perp'] = float(prm_slave['baseline_center'])
     meta_dict['temporal_baseline'] = abs((first_date-last_date).days)
@@ -160,32 +176,66 @@ def main(argv):
     ###  amplitude, correlation, wrapped phase, unwrapped phase, incidence angle, troposphere, dem, model
     #################################
     h5file = os.getcwd() + '/%s_%s_%03d_%04d_%s-%s_%04d_%05d.h5' % (meta_dict['mission'],meta_dict['beam_swath'],meta_dict['relative_orbit'],meta_dict['frame'],meta_dict['first_date'],meta_dict['last_date'],meta_dict['temporal_baseline'],meta_dict['baseline_perp'])
-    f = h5py.File(h5file)
-    group = f.create_group("GEOCODE")
+    f = h5product.open_product(h5file)
+    group = f.require_group("GEOCODE")
 
     dset = gdal.Open('phase_ll.grd')
-    meta_dict['X_FIRST'] = dset.GetGeoTransform()[0]
-    meta_dict['X_STEP'] = dset.GetGeoTransform()[1]
+    geotransform = dset.GetGeoTransform()
+    meta_dict['X_FIRST'] = geotransform[0]
+    meta_dict['X_STEP'] = geotransform[1]
     meta_dict['X_UNIT'] = 'degrees'
-    meta_dict['Y_FIRST'] = dset.GetGeoTransform()[3]
-    meta_dict['Y_STEP'] = dset.GetGeoTransform()[5]
+    meta_dict['Y_FIRST'] = geotransform[3]
+    meta_dict['Y_STEP'] = geotransform[5]
     meta_dict['Y_UNIT'] = 'degrees'
     meta_dict['FILE_LENGTH'] = dset.RasterYSize
     meta_dict['WIDTH'] = dset.RasterXSize
-    meta_dict['north'] = dset.GetGeoTransform()[3]
-    meta_dict['west'] = dset.GetGeoTransform()[0]
+    meta_dict['north'] = geotransform[3]
+    meta_dict['west'] = geotransform[0]
     meta_dict['south'] = meta_dict['north'] + meta_dict['FILE_LENGTH']*meta_dict['Y_STEP']
     meta_dict['east'] = meta_dict['west'] + meta_dict['WIDTH']*meta_dict['X_STEP']
-    if not os.path.basename('wrapped_interferogram') in group:
-        group.create_dataset('wrapped_interferogram', data=dset.ReadAsArray(), compression='gzip')
-    if not os.path.basename('unwrapped_interferogram') in group:
-        group.create_dataset('unwrapped_interferogram', data=gdal.Open('unwrap_ll.grd').ReadAsArray(), compression='gzip')
-    if not os.path.basename('wrapped_filtered_interferogram') in group:
-        group.create_dataset('wrapped_filtered_interferogram', data= gdal.Open('phasefilt_ll.grd').ReadAsArray(), compression='gzip')
-    if not os.path.basename('correlation') in group:
-        group.create_dataset('correlation', data=gdal.Open('corr_ll.grd').ReadAsArray(), compression='gzip')  
-#    if not os.path.basename('incidence') in group:
-#        group.create_dataset('incidence', data=gdal.Open('look_ll.grd').ReadAsArray(), compression='gzip')
+    ## GRID, SIZE AND FOOTPRINT OF THE -bbox/-wkt AREA OF INTEREST AND -looks ##
+    aoi = clos.bbox or clos.wkt
+    out_grid, out_shape = h5subset.output_window(h5subset.product_grid(meta_dict), (meta_dict['FILE_LENGTH'], meta_dict['WIDTH']), aoi, clos.looks)[1:]
+    if aoi or clos.looks:
+        h5subset.update_grid_metadata(meta_dict, out_grid, out_shape, footprint=bool(aoi))
+    ## CREATE/UPDATE DATASETS, ONLY THOSE WHOSE GRIDS CHANGED ##
+    # (dataset name, grid, overview kind)
+    layers = [('wrapped_interferogram', 'phase_ll.grd', 'phase'),
+              ('unwrapped_interferogram', 'unwrap_ll.grd', 'mean'),
+              ('wrapped_filtered_interferogram', 'phasefilt_ll.grd', 'phase'),
+              ('correlation', 'corr_ll.grd', 'mean')]
+#              ('incidence', 'look_ll.grd', 'mean')]
+    overviews = h5product.OVERVIEW_FACTORS if clos.overviews else ()
+    updates = []
+    for name,grdfile,kind in layers:
+        encoding = h5product.layer_encoding(name, clos.unwrapped_precision) if clos.quantize else None
+        signature = h5product.source_signature([grdfile], clos.checksum, h5product.dataset_options(overviews, encoding, aoi, clos.looks))
+        if not clos.force and h5product.is_current(group, name, signature):
+            print 'Skipping %s, %s has not changed' % (name, grdfile)
+            continue
+        updates.append((name, grdfile, kind, signature, encoding))
+    # the grids are read block by block; grids on the same grid as phase_ll.grd get a
+    # reader thread each that stays a few blocks ahead, so reading overlaps with the
+    # gzip compression of the dataset being written while memory stays bounded
+    sources = []
+    for name,grdfile,kind,signature,encoding in updates:
+        grid = dset if grdfile == 'phase_ll.grd' else gdal.Open(grdfile)
+        source = h5product.BandRaster(grid.GetRasterBand(1))
+        if aoi or clos.looks:
+            # the window is found on each grid, GMTSAR may unwrap a smaller region
+            gt = grid.GetGeoTransform()
+            window = h5subset.output_window((gt[0], gt[3], gt[1], gt[5]), source.shape, aoi, clos.looks)[0]
+            source = h5product.crop_and_look(source, window, clos.looks, kind, h5product.layer_nodata(name))
+        if grid.GetGeoTransform() == geotransform:
+            source = h5product.Prefetch(source)
+        sources.append(source)
+    for (name,grdfile,kind,signature,encoding),source in zip(updates, sources):
+        with tracing.span(tracer, 'convert', dataset=name, input=grdfile) as span:
+            h5product.write_dataset(group, name, source, signature, overviews=overviews, kind=kind, stats=h5product.layer_stats(name), encoding=encoding,
+                                    nodata=h5product.layer_nodata(name))
+            span.add(bytes_in=os.path.getsize(grdfile), bytes_out=group[name].id.get_storage_size())
+    ## average_coherence, max_coherence and percent_unwrapped FROM THE DATASET STATISTICS ##
+    meta_dict.update(h5product.product_statistics(group))
     for key,value in sorted(meta_dict.iteritems()):
         f.attrs[key] = value
     f.close()
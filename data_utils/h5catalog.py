@@ -0,0 +1,340 @@
+###############################################################################
+# h5catalog.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  SQLite catalog of local HDF5 interferogram products
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+# Shared by python 2 and 3 like h5product.py.
+"""Search local HDF5 interferogram products like the SSARA API searches the archives.
+
+The root attributes of every product under the given directories are indexed
+in a SQLite file, with the bounding box of each product in an R*Tree, so
+queries take milliseconds instead of opening every .h5 file. Updates only
+read the products whose size or modification time changed and drop the ones
+that are gone:
+
+    h5catalog.py --update ~/products ~/more_products
+    h5catalog.py -r 170 -f 2925 -s 2007-01-01 --minCoherence 0.4 --intersectsWith 'POINT(-118.3 33.8)'
+
+The query options have the names of the ssara_federated_query.py options.
+Matching products are printed one per line (so they can be handed to
+h5subset.py), or as CSV with --print.
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+import h5subset
+
+CATALOG = os.environ.get('SSARA_CATALOG', 'ssara_catalog.sqlite')
+# indexed root attributes, the others are kept as JSON
+COLUMNS = [('mission', 'TEXT'), ('beam_mode', 'TEXT'), ('beam_swath', 'TEXT'), ('relative_orbit', 'INTEGER'),
+           ('frame', 'INTEGER'), ('first_date', 'TEXT'), ('last_date', 'TEXT'), ('flight_direction', 'TEXT'),
+           ('look_direction', 'TEXT'), ('polarization', 'TEXT'), ('processing_type', 'TEXT'),
+           ('master_absolute_orbit', 'INTEGER'), ('slave_absolute_orbit', 'INTEGER'), ('temporal_baseline', 'REAL'),
+           ('baseline_perp', 'REAL'), ('average_coherence', 'REAL'), ('max_coherence', 'REAL'),
+           ('percent_unwrapped', 'REAL'), ('scene_footprint', 'TEXT')]
+BBOX = ('west', 'south', 'east', 'north')
+PRINT_COLUMNS = ['mission', 'relative_orbit', 'frame', 'first_date', 'last_date', 'temporal_baseline', 'baseline_perp',
+                 'average_coherence', 'beam_mode', 'beam_swath', 'flight_direction', 'look_direction', 'polarization', 'path']
+# list valued query options: option, column, integer (ranges like 657-693 allowed)
+LIST_QUERIES = [('platform', 'mission', False), ('relativeOrbit', 'relative_orbit', True), ('frame', 'frame', True),
+                ('beamMode', 'beam_mode', False), ('beamSwath', 'beam_swath', False), ('polarization', 'polarization', False),
+                ('processingType', 'processing_type', False)]
+# min/max query options: option, column
+RANGE_QUERIES = [('minBaselinePerp', 'baseline_perp', '>='), ('maxBaselinePerp', 'baseline_perp', '<='),
+                 ('minTemporalBaseline', 'temporal_baseline', '>='), ('maxTemporalBaseline', 'temporal_baseline', '<='),
+                 ('minCoherence', 'average_coherence', '>='), ('maxCoherence', 'average_coherence', '<=')]
+
+def _value(value):
+    '''Attribute value as plain python (numbers, text or lists), for the JSON and the columns.'''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, list):
+        return [_value(v) for v in value]
+    return value
+
+def product_bbox(attrs, shape=None):
+    '''(west, south, east, north) of a product: its extent attributes, its grid or its footprint.'''
+    if all(key in attrs for key in BBOX):
+        west, south, east, north = [float(attrs[key]) for key in BBOX]
+        return min(west, east), min(south, north), max(west, east), max(south, north)
+    grid = h5subset.product_grid(attrs)
+    if grid is not None and shape is not None:
+        extent = h5subset.grid_attrs(grid, shape)
+        return tuple(extent[key] for key in BBOX)
+    if attrs.get('scene_footprint'):
+        return h5subset.parse_bbox(attrs['scene_footprint'])
+    return None
+
+def product_record(h5file):
+    '''Catalog row of one product: the indexed attributes, the bounding box and all root attributes.'''
+    import h5py
+    with h5py.File(h5file, 'r') as f:
+        attrs = dict((key, _value(value)) for key, value in f.attrs.items())
+        shape = None
+        if 'WIDTH' in attrs and 'FILE_LENGTH' in attrs:
+            shape = (int(attrs['FILE_LENGTH']), int(attrs['WIDTH']))
+        elif 'GEOCODE' in f and len(f['GEOCODE']):
+            shape = list(f['GEOCODE'].values())[0].shape
+    record = {}
+    for name, kind in COLUMNS:
+        value = attrs.get(name)
+        try:
+            record[name] = None if value is None else int(value) if kind == 'INTEGER' else float(value) if kind == 'REAL' else str(value)
+        except ValueError:
+            record[name] = None
+    bbox = product_bbox(attrs, shape)
+    record.update(zip(BBOX, bbox or (None,) * 4))
+    record['attrs'] = json.dumps(attrs, sort_keys=True)
+    return record
+
+def parse_list(value, integer=False):
+    '''Values and (low, high) ranges of a comma separated query option like "657-693,700".'''
+    values, ranges = [], []
+    for item in str(value).split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if integer and re.match(r'^\d+-\d+$', item):
+            low, high = item.split('-')
+            ranges.append((int(low), int(high)))
+        else:
+            values.append(int(item) if integer else item)
+    return values, ranges
+
+def parse_date(value):
+    '''YYYYMMDD of a date like 2007-01-01, 2007-01-01T00:00:00 or 20070101, as the products store it.'''
+    digits = re.sub(r'\D', '', str(value))
+    if len(digits) < 8:
+        raise ValueError('%r is not a date' % value)
+    return digits[:8]
+
+class Catalog(object):
+    '''SQLite catalog of local HDF5 products, see update() and query().'''
+    def __init__(self, filename=CATALOG):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.row_factory = sqlite3.Row
+        columns = ''.join(', %s %s' % column for column in COLUMNS + [(key, 'REAL') for key in BBOX])
+        self.db.execute('CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, '
+                        'mtime REAL%s, attrs TEXT)' % columns)
+        self.db.execute('CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY)')
+        for name in ('relative_orbit', 'first_date', 'mission'):
+            self.db.execute('CREATE INDEX IF NOT EXISTS products_%s ON products (%s)' % (name, name))
+        try:
+            self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS products_bbox USING rtree(id, west, east, south, north)')
+            self.rtree = True
+        except sqlite3.OperationalError:
+            # SQLite built without R*Tree, the box is searched in the products table
+            self.rtree = False
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, roots=None, verbose=False):
+        '''Index the .h5 files under roots (default the roots of earlier updates) that are new or changed.
+
+        Products that are no longer there are removed, and so are products
+        that changed and can not be read any more. Returns the number of
+        products (indexed, unchanged, removed, unreadable).
+        '''
+        roots = [os.path.abspath(root) for root in roots or []]
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO roots (path) VALUES (?)', [(root,) for root in roots])
+        roots = roots or [row['path'] for row in self.db.execute('SELECT path FROM roots')]
+        known = dict((row['path'], (row['id'], row['size'], row['mtime'])) for row in self.db.execute('SELECT id, path, size, mtime FROM products'))
+        indexed = unchanged = failed = 0
+        seen = set()
+        for root in roots:
+            for directory, dirs, files in os.walk(root):
+                for name in sorted(files):
+                    if not name.endswith('.h5'):
+                        continue
+                    path = os.path.join(directory, name)
+                    seen.add(path)
+                    st = os.stat(path)
+                    if path in known and known[path][1:] == (st.st_size, st.st_mtime):
+                        unchanged += 1
+                        continue
+                    try:
+                        record = product_record(path)
+                    except (IOError, OSError, ValueError, KeyError) as e:
+                        if verbose:
+                            print('Cannot index %s: %s' % (path, e))
+                        if path in known:
+                            # the row describes the file as it was before
+                            with self.db:
+                                self._remove([known[path][0]])
+                        failed += 1
+                        continue
+                    record.update(path=path, size=st.st_size, mtime=st.st_mtime)
+                    with self.db:
+                        self._store(known.get(path, (None,))[0], record)
+                    indexed += 1
+        gone = [known[path][0] for path in known if path not in seen and any(path.startswith(os.path.join(root, '')) for root in roots)]
+        with self.db:
+            self._remove(gone)
+        return indexed, unchanged, len(gone), failed
+
+    def _remove(self, ids):
+        self.db.executemany('DELETE FROM products WHERE id = ?', [(id,) for id in ids])
+        if self.rtree:
+            self.db.executemany('DELETE FROM products_bbox WHERE id = ?', [(id,) for id in ids])
+
+    def _store(self, id, record):
+        '''Replace the product id (None for a new one) by record, call in a transaction.'''
+        if id is not None:
+            self._remove([id])
+        names = sorted(record)
+        id = self.db.execute('INSERT INTO products (%s) VALUES (%s)' % (', '.join(names), ', '.join('?' * len(names))), [record[name] for name in names]).lastrowid
+        if self.rtree and record['west'] is not None:
+            self.db.execute('INSERT INTO products_bbox (id, west, east, south, north) VALUES (?, ?, ?, ?, ?)',
+                            (id, record['west'], record['east'], record['south'], record['north']))
+
+    def query(self, **query):
+        '''Products matching the query, as dictionaries of the columns plus attrs, ordered by date.
+
+        Takes the query options of the SSARA API by name (platform,
+        relativeOrbit, frame, start, end, beamMode, beamSwath, flightDirection,
+        lookDirection, polarization, absoluteOrbit, intersectsWith,
+        min/maxBaselinePerp, maxResults), the product specific
+        processingType, min/maxTemporalBaseline and min/maxCoherence.
+        Lists are comma separated strings, integer ones may have ranges.
+        '''
+        where, args = [], []
+        for option, column, integer in LIST_QUERIES:
+            if query.get(option) not in (None, ''):
+                values, ranges = parse_list(query[option], integer)
+                terms = ['%s IN (%s)' % (column, ', '.join('?' * len(values)))] if values else []
+                terms += ['%s BETWEEN ? AND ?' % column] * len(ranges)
+                where.append('(%s)' % ' OR '.join(terms))
+                args += values + [bound for r in ranges for bound in r]
+        for option, column in (('flightDirection', 'flight_direction'), ('lookDirection', 'look_direction')):
+            if query.get(option):
+                # A/D and L/R, or the names spelled out
+                letters = [value[0].upper() for value in parse_list(query[option])[0]]
+                where.append('upper(substr(%s, 1, 1)) IN (%s)' % (column, ', '.join('?' * len(letters))))
+                args += letters
+        if query.get('absoluteOrbit'):
+            values, ranges = parse_list(query['absoluteOrbit'], True)
+            terms = []
+            for column in ('master_absolute_orbit', 'slave_absolute_orbit'):
+                terms += ['%s IN (%s)' % (column, ', '.join('?' * len(values)))] if values else []
+                terms += ['%s BETWEEN ? AND ?' % column] * len(ranges)
+                args += values + [bound for r in ranges for bound in r]
+            where.append('(%s)' % ' OR '.join(terms))
+        if query.get('start'):
+            where.append('first_date >= ?')
+            args.append(parse_date(query['start']))
+        if query.get('end'):
+            where.append('last_date <= ?')
+            args.append(parse_date(query['end']))
+        for option, column, operator in RANGE_QUERIES:
+            if query.get(option) not in (None, ''):
+                where.append('%s %s ?' % (column, operator))
+                args.append(float(query[option]))
+        if query.get('intersectsWith'):
+            west, south, east, north = h5subset.parse_bbox(query['intersectsWith'])
+            overlap = 'west <= ? AND east >= ? AND south <= ? AND north >= ?'
+            where.append('id IN (SELECT id FROM products_bbox WHERE %s)' % overlap if self.rtree else overlap)
+            args += [east, west, north, south]
+        sql = 'SELECT * FROM products%s ORDER BY first_date, last_date, path' % (' WHERE ' + ' AND '.join(where) if where else '')
+        if query.get('maxResults'):
+            sql += ' LIMIT %d' % int(query['maxResults'])
+        products = []
+        for row in self.db.execute(sql, args):
+            product = dict((key, row[key]) for key in row.keys())
+            product['attrs'] = json.loads(product['attrs'])
+            products.append(product)
+        return products
+
+def parse(argv):
+    '''Command line parser, the query options are named like those of ssara_federated_query.py.'''
+    parser = argparse.ArgumentParser(description='Index local HDF5 interferogram products in SQLite and search them like the SSARA API')
+    parser.add_argument('--catalog', dest='catalog', action='store', help='catalog file (default=%(default)s, or $SSARA_CATALOG)', default=CATALOG)
+    parser.add_argument('--update', dest='update', action='store', nargs='*', metavar='DIR', help='index new and changed products under DIR (default the directories indexed before)')
+    query = parser.add_argument_group('Query Parameters', 'comma separated lists, orbits and frames may have ranges like 657-693')
+    query.add_argument('-p', '--platform', dest='platform', action='store', help='list of platforms (mission attribute)')
+    query.add_argument('-a', '--absoluteOrbit', dest='absoluteOrbit', action='store', help='absolute orbit of the master or slave')
+    query.add_argument('-r', '--relativeOrbit', dest='relativeOrbit', action='store', help='relative orbit (ie track or path)')
+    query.add_argument('-i', '--intersectsWith', dest='intersectsWith', action='store', help='WKT format POINT, LINE, or POLYGON, products whose bounding box intersects its bounding box')
+    query.add_argument('-f', '--frame', dest='frame', action='store', help='frame(s) (single frame or as a list or range)')
+    query.add_argument('-s', '--start', dest='start', action='store', help='earliest first date')
+    query.add_argument('-e', '--end', dest='end', action='store', help='latest last date')
+    query.add_argument('--beamMode', dest='beamMode', action='store', help='list of beam modes')
+    query.add_argument('--beamSwath', dest='beamSwath', action='store', help='list of swaths')
+    query.add_argument('--flightDirection', dest='flightDirection', action='store', help='flight direction (A or D, default is both)')
+    query.add_argument('--lookDirection', dest='lookDirection', action='store', help='look direction (L or R, default is both)')
+    query.add_argument('--polarization', dest='polarization', action='store', help='single or as a list')
+    query.add_argument('--processingType', dest='processingType', action='store', help='INTERFEROGRAM, LOS_VELOCITY, ...')
+    query.add_argument('--minBaselinePerp', dest='minBaselinePerp', action='store', type=float, help='min perpendicular baseline of the pair')
+    query.add_argument('--maxBaselinePerp', dest='maxBaselinePerp', action='store', type=float, help='max perpendicular baseline of the pair')
+    query.add_argument('--minTemporalBaseline', dest='minTemporalBaseline', action='store', type=float, help='min days between the dates')
+    query.add_argument('--maxTemporalBaseline', dest='maxTemporalBaseline', action='store', type=float, help='max days between the dates')
+    query.add_argument('--minCoherence', dest='minCoherence', action='store', type=float, help='min average coherence')
+    query.add_argument('--maxCoherence', dest='maxCoherence', action='store', type=float, help='max average coherence')
+    query.add_argument('--maxResults', dest='maxResults', action='store', type=int, help='maximum number of results to return')
+    parser.add_argument('--print', dest='print_products', action='store_true', help='print the matching products as CSV instead of their paths')
+    return parser.parse_args(argv)
+
+def main(argv):
+    clos = parse(argv[1:])
+    with Catalog(clos.catalog) as catalog:
+        if clos.update is not None:
+            start = time.time()
+            counts = catalog.update(clos.update, verbose=True)
+            print('Indexed %d products, %d unchanged, %d removed, %d unreadable in %.1f seconds' % (counts + (time.time() - start,)), file=sys.stderr)
+        query = dict((key, value) for key, value in vars(clos).items() if key not in ('catalog', 'update', 'print_products') and value is not None)
+        if clos.update is not None and not query:
+            return
+        start = time.time()
+        products = catalog.query(**query)
+        if clos.print_products:
+            print(','.join(PRINT_COLUMNS))
+            for product in products:
+                print(','.join('' if product[key] is None else str(product[key]) for key in PRINT_COLUMNS))
+        else:
+            for product in products:
+                print(product['path'])
+        print('Found %d products in %.1f ms' % (len(products), 1000 * (time.time() - start)), file=sys.stderr)
+
+if __name__ == '__main__':
+    main(sys.argv[:])
@@ -0,0 +1,542 @@
+###############################################################################
+# h5product.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Shared helpers for writing HDF5 interferogram products
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+# This module is shared by roipac2hdf5.py (python 2) and isce2hdf5.py (python 3)
+# so keep it importable from both.
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+SIGNATURE_ATTR = 'source_signature'
+# size of the row tiles used when processing rasters block by block
+BLOCK_BYTES = 16 * 1024 * 1024
+# downsampling factors of the overview levels, each one must divide the next
+OVERVIEW_FACTORS = (2, 4, 8)
+# BlockStats settings for layers that differ from the default (0 or nan is no data)
+LAYER_STATS = {'correlation': {'bins': 20, 'hist_range': (0.0, 1.0)},
+               'digital_elevation_model': {'nodata': -32768}}
+# quantized storage of the layers (see layer_encoding): integer type, scale_factor, add_offset
+# and _FillValue (no data) as CF attributes; the unwrapped phase scale is the requested precision
+LAYER_ENCODINGS = {'correlation': ('uint8', 1.0 / 254, 0.0, 255),
+                   'wrapped_interferogram': ('int16', np.pi / 32767, 0.0, -32768),
+                   'wrapped_filtered_interferogram': ('int16', np.pi / 32767, 0.0, -32768),
+                   'incidence_angle': ('int16', 0.01, 0.0, -32768),
+                   'unwrapped_interferogram': ('int32', None, 0.0, -2 ** 31)}
+ENCODING_ATTRS = ('scale_factor', 'add_offset', '_FillValue')
+# default step of the quantized unwrapped phase, in radians
+UNWRAPPED_PRECISION = 0.001
+
+def file_signature(path, checksum=False):
+    '''Describe the state of one input file.
+
+    By default the size and modification time are used. With checksum=True the
+    md5 of the contents is used instead of the mtime, so a file that was rewritten
+    with identical contents is still considered unchanged.
+    '''
+    if not os.path.exists(path):
+        return {'path': os.path.basename(path), 'size': None}
+    st = os.stat(path)
+    sig = {'path': os.path.basename(path), 'size': st.st_size}
+    if checksum:
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(4 * 1024 * 1024), b''):
+                md5.update(chunk)
+        sig['md5'] = md5.hexdigest()
+    else:
+        sig['mtime'] = repr(st.st_mtime)
+    return sig
+
+def dataset_options(overviews, encoding=None, aoi=None, looks=None):
+    '''Converter settings of a dataset for source_signature().'''
+    options = {'overviews': list(overviews)}
+    if encoding:
+        options['quantize'] = encoding
+    if aoi:
+        options['aoi'] = aoi if hasattr(aoi, 'split') else list(aoi)
+    if looks:
+        options['looks'] = list(looks)
+    return options
+
+def source_signature(paths, checksum=False, options=None):
+    '''Signature string for all the input files (rasters and metadata) of a dataset.
+
+    options holds the converter settings that change what is written for the
+    dataset (overviews, ...), so changing them also triggers a rewrite.
+    '''
+    sources = [file_signature(p, checksum) for p in paths]
+    if options:
+        return json.dumps({'sources': sources, 'options': options}, sort_keys=True)
+    return json.dumps(sources, sort_keys=True)
+
+def open_product(h5file):
+    '''Open (or create) the HDF5 product for updating.'''
+    import h5py
+    return h5py.File(h5file, 'a')
+
+def is_current(group, name, signature):
+    '''True if dataset name exists in group and was written from the same sources.'''
+    if name not in group:
+        return False
+    stored = group[name].attrs.get(SIGNATURE_ATTR)
+    if stored is None:
+        return False
+    if isinstance(stored, bytes):
+        stored = stored.decode('utf-8')
+    return stored == signature
+
+def block_rows(width, itemsize, block_bytes=BLOCK_BYTES, multiple=OVERVIEW_FACTORS[-1]):
+    '''Number of rows of a raster that fit in one processing tile.
+
+    The number is rounded to a multiple of the largest overview factor so that
+    every tile maps onto whole rows of the overview levels.
+    '''
+    rows = max(1, block_bytes // max(1, width * itemsize))
+    return max(multiple, rows // multiple * multiple)
+
+def iter_blocks(data, rows):
+    '''Yield (first_row, block) tiles of anything that can be sliced by rows.
+
+    Sources with their own blocks() method (see Prefetch) choose the tiles.
+    '''
+    if hasattr(data, 'blocks'):
+        for block in data.blocks():
+            yield block
+        return
+    length = data.shape[0]
+    for r0 in range(0, length, rows):
+        yield r0, np.asarray(data[r0:min(r0 + rows, length)])
+
+def write_dataset(group, name, data, signature=None, compression='gzip', overviews=OVERVIEW_FACTORS, kind='mean', stats=None, encoding=None, nodata=0):
+    '''Stream data to group[name] in row blocks, reusing the existing dataset when possible.
+
+    data is an array, a memory map or any object with shape, dtype and row
+    slicing, so a whole raster never has to be in memory. If a dataset with the
+    same shape and dtype already exists it is overwritten in place, otherwise it
+    is (re)created. Overview levels are built from the same blocks (see
+    Overviews, pixels equal to nodata are left out; kind=None skips them) and statistics are accumulated from them
+    when a BlockStats is given. The statistics and the source signature are
+    stored as attributes so the next run can skip the dataset with is_current().
+    With an encoding (see layer_encoding) the values are stored quantized;
+    the overviews and statistics are still computed from the full values.
+    '''
+    shape = tuple(data.shape)
+    dtype = np.dtype(encoding['dtype']) if encoding else np.dtype(data.dtype)
+    if name in group and (group[name].shape != shape or group[name].dtype != dtype):
+        del group[name]
+    if name in group:
+        dset = group[name]
+    else:
+        dset = group.create_dataset(name, shape=shape, dtype=dtype, compression=compression,
+                                    fillvalue=encoding['_FillValue'] if encoding else None)
+    pyramid = None
+    if kind and overviews:
+        pyramid = Overviews(group.file, name, shape, kind, overviews, compression, nodata)
+    else:
+        remove_overviews(group.file, name)
+    for r0, block in iter_blocks(data, block_rows(shape[1], np.dtype(data.dtype).itemsize)):
+        dset[r0:r0 + block.shape[0]] = encode(block, encoding) if encoding else block
+        if pyramid:
+            pyramid.update(r0, block)
+        if stats:
+            stats.update(block)
+    if stats:
+        stats.write(dset)
+    for key in ENCODING_ATTRS:
+        if encoding:
+            dset.attrs[key] = np.array(encoding[key], dtype=dtype if key == '_FillValue' else np.float32)
+        elif key in dset.attrs:
+            del dset.attrs[key]
+    if signature is not None:
+        dset.attrs[SIGNATURE_ATTR] = signature
+    return dset
+
+def layer_encoding(name, precision=UNWRAPPED_PRECISION):
+    '''Quantized storage of a GEOCODE layer, None for layers that are stored as they are.
+
+    Correlation is stored as uint8 over [0, 1], wrapped phase as int16 over
+    [-pi, pi], incidence as int16 in steps of 0.01 and unwrapped phase as
+    int32 in steps of precision (gzip then drops the unused high bytes).
+    '''
+    if name not in LAYER_ENCODINGS:
+        return None
+    dtype, scale, offset, fill = LAYER_ENCODINGS[name]
+    return {'dtype': dtype, 'scale_factor': precision if scale is None else scale, 'add_offset': offset, '_FillValue': fill}
+
+def encode(block, encoding):
+    '''Quantize a block: round((value - add_offset) / scale_factor) in the integer type, nan as _FillValue.
+
+    Values outside the range of the type are clipped to it.
+    '''
+    dtype = np.dtype(encoding['dtype'])
+    info = np.iinfo(dtype)
+    fill = encoding['_FillValue']
+    low, high = (info.min + 1, info.max) if fill == info.min else (info.min, info.max - 1)
+    # float32 like the sources, with bounds that stay inside the type once rounded to float32
+    low, high = [np.float32(v) if int(np.float32(v)) == v else np.nextafter(np.float32(v), np.float32(0)) for v in (low, high)]
+    values = np.subtract(block, encoding['add_offset'], dtype=np.float32)
+    values /= np.float32(encoding['scale_factor'])
+    valid = np.isfinite(values)
+    with np.errstate(invalid='ignore'):
+        np.round(values, out=values)
+        np.clip(values, low, high, out=values)
+    values[~valid] = fill
+    return values.astype(dtype)
+
+def read_dataset(dset, selection=Ellipsis):
+    '''Read dset[selection], decoding quantized values (CF scale_factor/add_offset/_FillValue) to float32 with nan.'''
+    data = dset[selection]
+    if 'scale_factor' not in dset.attrs and 'add_offset' not in dset.attrs:
+        return data
+    data = np.asarray(data)
+    values = data.astype(np.float32)
+    values *= np.float32(dset.attrs.get('scale_factor', 1.0))
+    values += np.float32(dset.attrs.get('add_offset', 0.0))
+    if '_FillValue' in dset.attrs:
+        values[data == dset.attrs['_FillValue']] = np.nan
+    return values
+
+class BlockStats(object):
+    '''Nan-aware statistics of a dataset, accumulated one block at a time.
+
+    Pixels that are nan, inf or equal to nodata are not valid. Gives the mean,
+    min and max of the valid pixels, the valid pixel fraction and, if bins is
+    set, a histogram over hist_range.
+    '''
+    def __init__(self, nodata=0, bins=None, hist_range=None):
+        self.nodata = nodata
+        self.bins = bins
+        self.hist_range = hist_range
+        self.count = 0
+        self.valid = 0
+        self.total = 0.0
+        self.min = np.nan
+        self.max = np.nan
+        self.histogram = np.zeros(bins, dtype=np.int64) if bins else None
+        self.edges = None
+
+    def update(self, block):
+        block = np.asarray(block)
+        values = block[np.isfinite(block) & (block != self.nodata)]
+        self.count += block.size
+        if not values.size:
+            return
+        self.valid += values.size
+        self.total += values.sum(dtype=np.float64)
+        self.min = np.nanmin([self.min, values.min()])
+        self.max = np.nanmax([self.max, values.max()])
+        if self.bins:
+            hist, self.edges = np.histogram(values, bins=self.bins, range=self.hist_range)
+            self.histogram += hist
+
+    @property
+    def mean(self):
+        return self.total / self.valid if self.valid else np.nan
+
+    @property
+    def valid_fraction(self):
+        return float(self.valid) / self.count if self.count else 0.0
+
+    def write(self, dset):
+        '''Store the statistics as attributes of dset.'''
+        for key in ('mean', 'min', 'max', 'valid_fraction'):
+            dset.attrs[key] = getattr(self, key)
+        dset.attrs['valid_count'] = self.valid
+        if self.histogram is not None and self.edges is not None:
+            dset.attrs['histogram'] = self.histogram
+            dset.attrs['histogram_edges'] = self.edges
+
+def layer_stats(name):
+    '''BlockStats for one of the GEOCODE layers.'''
+    return BlockStats(**LAYER_STATS.get(name, {}))
+
+def layer_nodata(name):
+    '''No data value of one of the GEOCODE layers, as used by its BlockStats.'''
+    return LAYER_STATS.get(name, {}).get('nodata', 0)
+
+def product_statistics(group):
+    '''Root metadata computed from the statistics stored on the GEOCODE datasets.
+
+    Works whether or not the datasets were rewritten in this run.
+    '''
+    meta = {}
+    if 'correlation' in group and 'mean' in group['correlation'].attrs:
+        # float32 like the np.mean of the correlation layer the converters stored before
+        meta['average_coherence'] = np.float32(group['correlation'].attrs['mean'])
+        meta['max_coherence'] = np.float32(group['correlation'].attrs['max'])
+    if 'unwrapped_interferogram' in group and 'wrapped_interferogram' in group:
+        unwrapped = group['unwrapped_interferogram'].attrs.get('valid_count')
+        wrapped = group['wrapped_interferogram'].attrs.get('valid_count')
+        if unwrapped is not None and wrapped:
+            meta['percent_unwrapped'] = 100.0 * unwrapped / wrapped
+    return meta
+
+def _block_sum(a, k, m=None):
+    '''Sum over non-overlapping k x m windows (k x k by default), the edges are zero padded.'''
+    m = m or k
+    rows, cols = -(-a.shape[0] // k), -(-a.shape[1] // m)
+    if a.shape != (rows * k, cols * m):
+        padded = np.zeros((rows * k, cols * m), dtype=a.dtype)
+        padded[:a.shape[0], :a.shape[1]] = a
+        a = padded
+    return a.reshape(rows, k, cols, m).sum(axis=(1, 3))
+
+def _window_terms(block, valid, kind):
+    '''Per pixel terms that are summed over a window: the values, or cos and sin of the phase for kind='phase'.'''
+    if kind == 'phase':
+        return [np.where(valid, np.cos(block), 0), np.where(valid, np.sin(block), 0)]
+    return [np.where(valid, block, 0)]
+
+def _window_mean(sums, count, kind):
+    '''Mean of each window from its summed terms and valid pixel count, nan if it has no valid pixel.'''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if kind == 'phase':
+            level = np.arctan2(sums[1], sums[0])
+        else:
+            level = sums[0] / count
+    level[count == 0] = np.nan
+    return level
+
+class Overviews(object):
+    '''Downsampled levels of a dataset, built block by block while it is written.
+
+    The levels are stored as OVERVIEW/<factor>x/<name>. kind='mean' uses a nan
+    aware mean, kind='phase' the circular mean for wrapped phase. Pixels equal
+    to nodata are left out like nan, windows without a valid pixel are nan. Sums and
+    valid counts are cascaded from one level to the next so every level is the
+    exact mean over the full resolution pixels it covers.
+    '''
+    def __init__(self, h5file, name, shape, kind='mean', factors=OVERVIEW_FACTORS, compression='gzip', nodata=0):
+        self.kind = kind
+        self.nodata = nodata
+        self.factors = factors
+        self.dsets = []
+        remove_overviews(h5file, name)
+        for factor in factors:
+            group = h5file.require_group('OVERVIEW/%dx' % factor)
+            dset = group.create_dataset(name, shape=(-(-shape[0] // factor), -(-shape[1] // factor)),
+                                        dtype=np.float32, compression=compression)
+            dset.attrs['factor'] = factor
+            dset.attrs['method'] = 'circular_mean' if kind == 'phase' else 'nanmean'
+            self.dsets.append(dset)
+
+    def update(self, r0, block):
+        '''Add the full resolution rows starting at r0 (a multiple of the largest factor).'''
+        block = np.asarray(block, dtype=np.float32)
+        valid = np.isfinite(block)
+        if self.nodata is not None:
+            valid &= block != self.nodata
+        sums = _window_terms(block, valid, self.kind)
+        count = valid.astype(np.float32)
+        previous = 1
+        for factor, dset in zip(self.factors, self.dsets):
+            step = factor // previous
+            previous = factor
+            sums = [_block_sum(s, step) for s in sums]
+            count = _block_sum(count, step)
+            level = _window_mean(sums, count, self.kind)
+            dset[r0 // factor:r0 // factor + level.shape[0]] = level
+
+def remove_overviews(h5file, name):
+    '''Delete the overview levels of dataset name, if there are any.'''
+    if 'OVERVIEW' not in h5file:
+        return
+    for level in h5file['OVERVIEW'].values():
+        if name in level:
+            del level[name]
+
+def remove_dataset(group, name):
+    '''Delete dataset name from group, and its overview levels, if it is there.'''
+    if name in group:
+        del group[name]
+    remove_overviews(group.file, name)
+
+def map_raster(infile, dtype, length, width):
+    '''Memory-map a flat binary raster of length x width samples without reading it.'''
+    return np.memmap(infile, dtype=dtype, mode='r', shape=(length, width))
+
+def map_bands(infile, dtype, length, width, nbands=2):
+    '''Memory-map a row interleaved (roi_pac rmg) raster as (length, nbands, width).
+
+    raster[:, band] is a view of one band that can be streamed by rows.
+    '''
+    return np.memmap(infile, dtype=dtype, mode='r', shape=(length, nbands, width))
+
+def complex_amp_phase(data, amp=None, phase=None, rows=None):
+    '''Amplitude and phase of a complex (length, width) raster in a single pass.
+
+    data is usually a memory-mapped file.  It is processed in tiles of rows: each
+    tile is copied once into a reusable buffer and both the magnitude and the
+    phase are computed from it into the float32 outputs, which are allocated
+    here unless preallocated arrays are passed in. Pass amp=False to only
+    compute the phase.
+    '''
+    length, width = data.shape
+    if amp is None:
+        amp = np.empty((length, width), dtype=np.float32)
+    if phase is None:
+        phase = np.empty((length, width), dtype=np.float32)
+    if rows is None:
+        rows = block_rows(width, data.dtype.itemsize)
+    buf = np.empty((min(rows, length), width), dtype=data.dtype)
+    for r0 in range(0, length, rows):
+        r1 = min(r0 + rows, length)
+        tile = buf[:r1 - r0]
+        tile[...] = data[r0:r1]
+        if amp is not False:
+            np.abs(tile, out=amp[r0:r1])
+        np.arctan2(tile.imag, tile.real, out=phase[r0:r1])
+    return amp, phase
+
+class PhaseRaster(object):
+    '''Wrapped phase of a complex raster, computed only for the rows that are sliced.
+
+    Lets write_dataset stream the phase of a memory-mapped interferogram without
+    materializing the whole phase array.
+    '''
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = np.dtype(np.float32)
+
+    def __getitem__(self, rows):
+        tile = np.asarray(self.data[rows])
+        return np.arctan2(tile.imag, tile.real)
+
+class BandRaster(object):
+    '''Rows (and columns) of a GDAL raster band, read with ReadAsArray only when they are sliced.'''
+    def __init__(self, band):
+        self.band = band
+        self.shape = (band.YSize, band.XSize)
+        self.dtype = band.ReadAsArray(0, 0, band.XSize, 1).dtype
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        r0, r1, _ = rows.indices(self.shape[0])
+        c0, c1, _ = cols.indices(self.shape[1])
+        return self.band.ReadAsArray(c0, r0, c1 - c0, r1 - r0)
+
+class Window(object):
+    '''The part of a raster source inside a window of rows and columns (slices), read only when sliced.
+
+    The source must accept [rows, cols] slicing like arrays, PhaseRaster and BandRaster.
+    '''
+    def __init__(self, data, rows, cols):
+        self.data = data
+        self.rows = rows
+        self.cols = cols
+        self.shape = (rows.stop - rows.start, cols.stop - cols.start)
+        self.dtype = np.dtype(data.dtype)
+
+    def __getitem__(self, rows):
+        r0, r1, _ = rows.indices(self.shape[0])
+        return np.asarray(self.data[self.rows.start + r0:self.rows.start + r1, self.cols])
+
+class Multilook(object):
+    '''Mean of a raster source over looks = (rows, columns) windows, computed for the rows that are sliced.
+
+    Uses the reduction of Overviews: a nan aware mean, or the circular mean for
+    kind='phase'. Pixels equal to nodata are left out and windows without a
+    valid pixel are nan. Complex sources are averaged as complex numbers.
+    Partial windows at the bottom and right edges are dropped.
+    '''
+    def __init__(self, data, looks, kind='mean', nodata=0):
+        self.data = data
+        self.looks = tuple(looks)
+        self.kind = kind
+        self.nodata = nodata
+        self.shape = (data.shape[0] // self.looks[0], data.shape[1] // self.looks[1])
+        self.dtype = np.dtype(np.complex64 if np.dtype(data.dtype).kind == 'c' else np.float32)
+
+    def __getitem__(self, rows):
+        r0, r1, _ = rows.indices(self.shape[0])
+        n, m = self.looks
+        block = np.asarray(self.data[r0 * n:r1 * n])[:, :self.shape[1] * m].astype(self.dtype)
+        valid = np.isfinite(block)
+        if self.nodata is not None:
+            valid &= block != self.nodata
+        sums = [_block_sum(s, n, m) for s in _window_terms(block, valid, self.kind)]
+        return _window_mean(sums, _block_sum(valid.astype(np.float32), n, m), self.kind)
+
+    def blocks(self):
+        # tiles of the source rows, not of the smaller output rows, keep the memory bounded
+        rows = block_rows(self.data.shape[1] * self.looks[0], np.dtype(self.data.dtype).itemsize)
+        for r0 in range(0, self.shape[0], rows):
+            yield r0, self[r0:min(r0 + rows, self.shape[0])]
+
+def crop_and_look(data, window=None, looks=None, kind='mean', nodata=0):
+    '''A raster source cropped to window (row and column slices) and multilooked by looks (rows, columns).'''
+    if window is not None:
+        data = Window(data, *window)
+    if looks and tuple(looks) != (1, 1):
+        data = Multilook(data, looks, kind, nodata)
+    return data
+
+class Prefetch(object):
+    '''Read the row blocks of a raster in a background thread, ahead of the writer.
+
+    At most depth blocks are kept waiting, so several rasters can be prefetched
+    at the same time with bounded memory. Each source must only be used by its
+    own thread (e.g. one GDAL dataset handle per Prefetch).
+    '''
+    def __init__(self, data, depth=2, rows=None):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = np.dtype(data.dtype)
+        self.rows = rows or block_rows(self.shape[1], self.dtype.itemsize)
+        self.queue = queue.Queue(maxsize=depth)
+        self.thread = threading.Thread(target=self._read)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read(self):
+        try:
+            for block in iter_blocks(self.data, self.rows):
+                self.queue.put(block)
+        except Exception as e:
+            self.queue.put(e)
+            return
+        self.queue.put(None)
+
+    def blocks(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
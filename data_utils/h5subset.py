@@ -0,0 +1,286 @@
+###############################################################################
+# h5subset.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Read an area of interest from HDF5 interferogram products
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+# Shared by python 2 and 3 like h5product.py.
+"""Read an area of interest from the GEOCODE datasets of HDF5 interferogram products.
+
+A lon/lat bounding box (or the box around a WKT geometry) is mapped to row and
+column slices with the grid attributes of the product, X_FIRST/Y_FIRST/X_STEP/
+Y_STEP from roipac2hdf5.py and gmtsar2hdf5.py or west/north/xstep/ystep from
+isce2hdf5.py, so only the HDF5 chunks that overlap the AOI are read and
+decompressed:
+
+    subset = read_subset('ALOS_..._.h5', 'POLYGON((...))', ['unwrapped_interferogram'])
+    subset['data']['unwrapped_interferogram'], subset['grid']
+
+A stack of products is read with a pool of worker processes that is kept
+between calls (StackReader); h5py serializes the HDF5 calls of a process behind
+one lock, so threads would not read or decompress in parallel. From the command
+line the AOI of many products is saved to one HDF5 file:
+
+    h5subset.py -bbox -118.4 33.7 -118.0 34.0 -datasets unwrapped_interferogram,correlation *.h5
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import math
+import time
+import argparse
+
+import numpy as np
+
+import h5product
+
+# (x of the first column, y of the first row, column step, row step) of the pixel
+# corners, as written by roipac2hdf5.py/gmtsar2hdf5.py and by isce2hdf5.py
+GRID_ATTRS = (('X_FIRST', 'Y_FIRST', 'X_STEP', 'Y_STEP'), ('west', 'north', 'xstep', 'ystep'))
+DATASETS = ('unwrapped_interferogram',)
+
+def parse_bbox(aoi):
+    '''(west, south, east, north) of an AOI given as a sequence, a "west,south,east,north" string or WKT.'''
+    if not hasattr(aoi, 'split'):
+        return tuple(float(v) for v in aoi)
+    numbers = [float(x.replace(' ', '')) for x in re.findall(r"[+-]? *(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?", aoi)]
+    if re.match(r'\s*[A-Za-z]', aoi):
+        lons, lats = numbers[0::2], numbers[1::2]
+        return min(lons), min(lats), max(lons), max(lats)
+    if len(numbers) != 4:
+        raise ValueError('%r is neither WKT nor west,south,east,north' % aoi)
+    return tuple(numbers)
+
+def product_grid(attrs):
+    '''(x_first, y_first, x_step, y_step) of a product from its root attributes, None if it has none.'''
+    for keys in GRID_ATTRS:
+        if all(key in attrs for key in keys):
+            return tuple(float(attrs[key]) for key in keys)
+    return None
+
+def step_digit(step):
+    '''Value of the last decimal digit of a pixel step as it was written, 1e-9 for 0.000833333.'''
+    mantissa, _, exponent = ('%.15g' % abs(step)).partition('e')
+    return 10.0 ** (int(exponent or 0) - len(mantissa.partition('.')[2]))
+
+def bbox_slices(grid, shape, bbox):
+    '''Row and column slices of a raster on grid covering bbox, None if they do not overlap.
+
+    Pixels partly inside the box are included; a point selects one pixel.
+    '''
+    x0, y0, dx, dy = grid
+    west, south, east, north = bbox
+    # box edges on pixel edges must not pick up a neighbour through rounding errors. Steps are
+    # written with a few digits (0.000833333 for 1/1200), the error of a pixel position grows
+    # with the distance from the first pixel by the last digit of the step over the step
+    snap = lambda v, step: round(v) if abs(v - round(v)) < 1e-6 + abs(v) * step_digit(step) / abs(step) else v
+    cols = sorted([snap((west - x0) / dx, dx), snap((east - x0) / dx, dx)])
+    rows = sorted([snap((north - y0) / dy, dy), snap((south - y0) / dy, dy)])
+    c0 = max(0, int(math.floor(cols[0])))
+    c1 = min(shape[1], max(int(math.ceil(cols[1])), int(math.floor(cols[0])) + 1))
+    r0 = max(0, int(math.floor(rows[0])))
+    r1 = min(shape[0], max(int(math.ceil(rows[1])), int(math.floor(rows[0])) + 1))
+    if c1 <= c0 or r1 <= r0:
+        return None
+    return slice(r0, r1), slice(c0, c1)
+
+def window_grid(grid, window):
+    '''Grid of the part of a raster inside window (row and column slices).'''
+    rows, cols = window
+    return (grid[0] + cols.start * grid[2], grid[1] + rows.start * grid[3], grid[2], grid[3])
+
+def output_window(grid, shape, aoi=None, looks=None):
+    '''Window of a raster to convert for an AOI, and the grid and shape of the output after looks (rows, columns).
+
+    Returns (window, grid, shape), window is None without an AOI. Raises
+    ValueError if the AOI is outside the raster or the looks are larger.
+    '''
+    window = None
+    if aoi is not None:
+        window = bbox_slices(grid, shape, parse_bbox(aoi))
+        if window is None:
+            raise ValueError('the area of interest %s is outside the raster' % (aoi,))
+        grid = window_grid(grid, window)
+        shape = (window[0].stop - window[0].start, window[1].stop - window[1].start)
+    if looks:
+        grid = (grid[0], grid[1], grid[2] * looks[1], grid[3] * looks[0])
+        shape = (shape[0] // looks[0], shape[1] // looks[1])
+        if not shape[0] or not shape[1]:
+            raise ValueError('%dx%d looks do not fit in the raster' % tuple(looks))
+    return window, grid, shape
+
+def footprint_wkt(grid, shape):
+    '''WKT polygon of the extent of a raster of shape on grid.'''
+    extent = grid_attrs(grid, shape)
+    west, south, east, north = [extent[key] for key in ('west', 'south', 'east', 'north')]
+    return "POLYGON((%f %f,%f %f,%f %f,%f %f,%f %f))" % (west, north, east, north, east, south, west, south, west, north)
+
+def update_grid_metadata(meta, grid, shape, footprint=True):
+    '''Set the grid, size and extent entries meta already has (and the footprint) to those of a raster of shape on grid.'''
+    values = grid_attrs(grid, shape)
+    values.update(width=shape[1], length=shape[0], XMIN=0, XMAX=shape[1] - 1, YMIN=0, YMAX=shape[0] - 1)
+    if footprint:
+        values['scene_footprint'] = footprint_wkt(grid, shape)
+    for key, value in values.items():
+        if key in meta:
+            # keep the type of the entry, .rsc headers hold (numpy) strings
+            meta[key] = type(meta[key])(str(value)) if isinstance(meta[key], str) else value
+
+def grid_attrs(grid, shape):
+    '''Grid attributes (both conventions, with the extent) of a raster of shape on grid.'''
+    x0, y0, dx, dy = grid
+    length, width = shape
+    x1, y1 = x0 + width * dx, y0 + length * dy
+    return {'X_FIRST': x0, 'Y_FIRST': y0, 'X_STEP': dx, 'Y_STEP': dy, 'WIDTH': width, 'FILE_LENGTH': length,
+            'west': min(x0, x1), 'east': max(x0, x1), 'north': max(y0, y1), 'south': min(y0, y1), 'xstep': dx, 'ystep': dy}
+
+def read_subset(h5file, aoi, datasets=DATASETS, factor=1):
+    '''Read the part of the GEOCODE datasets of one product that covers aoi.
+
+    With factor > 1 the OVERVIEW level of that factor is read instead of the
+    full resolution. Quantized layers are decoded to float32. Returns a
+    dictionary with the product file, data (an array per dataset name), the
+    grid (x_first, y_first, x_step, y_step) of the subset and the root
+    attributes of the product, or None if the product does not overlap the
+    AOI.
+    '''
+    import h5py
+    bbox = parse_bbox(aoi)
+    with h5py.File(h5file, 'r') as f:
+        grid = product_grid(f.attrs)
+        if grid is None:
+            raise ValueError('%s has no %s attributes' % (h5file, ' or '.join('/'.join(keys) for keys in GRID_ATTRS)))
+        if factor > 1:
+            grid = (grid[0], grid[1], grid[2] * factor, grid[3] * factor)
+        group = f['OVERVIEW/%dx' % factor] if factor > 1 else f['GEOCODE']
+        data = {}
+        window = None
+        for name in datasets:
+            dset = group[name]
+            window = bbox_slices(grid, dset.shape, bbox)
+            if window is None:
+                return None
+            # a hyperslab selection, HDF5 only reads and decompresses the chunks it touches
+            data[name] = h5product.read_dataset(dset, window)
+        return {'product': h5file, 'data': data, 'attrs': dict(f.attrs), 'grid': window_grid(grid, window)}
+
+def _read_subset(task):
+    return read_subset(*task)
+
+class StackReader(object):
+    '''Read the AOI of many products with a pool of worker processes that is kept between calls.
+
+    Each product is read by one worker, so the chunks of different products
+    are read and decompressed in parallel. workers=0 reads in this process.
+    '''
+    def __init__(self, workers=4):
+        self.pool = None
+        if workers:
+            import multiprocessing
+            self.pool = multiprocessing.Pool(workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, products, aoi, datasets=DATASETS, factor=1):
+        '''read_subset() of all products, in the order given (None where a product does not overlap).'''
+        tasks = [(product, parse_bbox(aoi), tuple(datasets), factor) for product in products]
+        if self.pool is None:
+            return [_read_subset(task) for task in tasks]
+        return self.pool.map(_read_subset, tasks, chunksize=1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+def read_stack(products, aoi, datasets=DATASETS, factor=1, workers=4):
+    '''read_subset() of all products with a StackReader of its own.'''
+    with StackReader(min(workers, len(products)) if len(products) > 1 else 0) as reader:
+        return reader.read(products, aoi, datasets, factor)
+
+def write_subsets(subsets, h5file, compression='gzip'):
+    '''Save subsets to h5file, one group per product with the grid attributes of the subset.
+
+    Groups are named after the product files, products from different
+    directories with the same file name get _2, _3, ... in the order given,
+    and the path of the product is in the source_product attribute.
+    The file is written under a temporary name and renamed when complete.
+    '''
+    import h5py
+    tmp = h5file + '.part'
+    try:
+        with h5py.File(tmp, 'w') as f:
+            for subset in subsets:
+                base = group_name = os.path.splitext(os.path.basename(subset['product']))[0]
+                n = 1
+                while group_name in f:
+                    n += 1
+                    group_name = '%s_%d' % (base, n)
+                group = f.create_group(group_name)
+                for key, value in subset['attrs'].items():
+                    group.attrs[key] = value
+                group.attrs['source_product'] = subset['product']
+                for name, data in subset['data'].items():
+                    group.create_dataset(name, data=data, compression=compression)
+                for key, value in grid_attrs(subset['grid'], data.shape).items():
+                    group.attrs[key] = value
+        os.rename(tmp, h5file)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def parse(argv):
+    '''Command line parser.'''
+    parser = argparse.ArgumentParser(description='Read an area of interest from HDF5 interferogram products into one HDF5 file')
+    parser.add_argument('products', nargs='+', help='HDF5 products')
+    parser.add_argument('-bbox', dest='bbox', action='store', nargs=4, type=float, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'), help='lon/lat bounding box')
+    parser.add_argument('-wkt', dest='wkt', action='store', help='WKT geometry, its bounding box is read', type=str)
+    parser.add_argument('-datasets', dest='datasets', action='store', help='comma separated GEOCODE datasets (default=%(default)s)', type=str, default=','.join(DATASETS))
+    parser.add_argument('-overview', dest='overview', action='store', help='read the OVERVIEW level of this factor instead of full resolution', type=int, default=1)
+    parser.add_argument('-workers', dest='workers', action='store', help='worker processes reading products (default=%(default)s)', type=int, default=4)
+    parser.add_argument('-o', dest='output', action='store', help='output HDF5 file (default=%(default)s)', type=str, default='subset.h5')
+    clos = parser.parse_args(argv)
+    if not clos.bbox and not clos.wkt:
+        parser.error('give the area of interest with -bbox or -wkt')
+    return clos
+
+def main(argv):
+    clos = parse(argv[1:])
+    start = time.time()
+    subsets = read_stack(clos.products, clos.bbox or clos.wkt, clos.datasets.split(','), clos.overview, clos.workers)
+    subsets = [s for s in subsets if s is not None]
+    write_subsets(subsets, clos.output)
+    print('Read %d of %d products overlapping the AOI in %.1f seconds, saved to %s' % (len(subsets), len(clos.products), time.time() - start, clos.output))
+
+if __name__ == '__main__':
+    main(sys.argv[:])
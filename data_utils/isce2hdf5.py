@@ -34,52 +34,20 @@ import sys
 import glob
 import argparse
 import datetime
-import xml.etree.ElementTree as ET
 
 import numpy as np
-import h5py
 
-from iscesys.Parsers.FileParserFactory import createFileParser
-import isce
-import isceobj
-import pickle
-from mroipac.geolocate.Geolocate import Geolocate
-
-def read_float32(infile,length,width):
-  '''Reads roi_pac unw, cor, or hgt data.
-
-  Requires the file path and returns amplitude and phase
-  Usage:
-    amplitude, phase, rscDictionary = readUnw('/Users/sbaker/Desktop/geo_070603-070721_0048_00018.unw')
-  '''
-  oddindices = np.where(np.arange(length*2)&1)[0]
-  data = np.fromfile(infile,np.float32,length*2*width).reshape(length*2,width)
-  a = np.array([data.take(oddindices-1,axis=0)]).reshape(length,width)
-  p = np.array([data.take(oddindices,axis=0)]).reshape(length,width)
-  return a, p
-
-def read_complex64(infile,length,width):
-  '''Reads roi_pac int or slc data.
-
-  Requires the file path and returns amplitude and phase
-  Usage:
-    amp, phase, rscDictionary = readInt('/Users/sbaker/Desktop/geo_070603-070721_0048_00018.int')
-  '''
-  data = np.fromfile(infile,np.complex64,length*2*width).reshape(length,width)
-  a = np.array([np.hypot(data.real,data.imag)]).reshape(length,width)
-  p = np.array([np.arctan2(data.imag,data.real)]).reshape(length,width)
-  return a, p
-
-def read_dem(infile,length,width):
-  '''Read a roipac dem file.
-
-  Input:
-    roi_pac format dem file
-  '''
-  d=np.fromfile(infile,dtype=np.int16).reshape(length,width)
-  return d
+import h5product
+import h5subset
+import sar_metadata
+import tracing
 
 def footprintFromPickle():
+    # ISCE is only needed for this geometric footprint, so it is not imported at startup
+    import isce
+    import isceobj
+    import pickle
+    from mroipac.geolocate.Geolocate import Geolocate
     insar = pickle.load(open('PICKLE/preprocess','rb'))
     planet = insar.masterFrame.getInstrument().getPlatform().getPlanet()
     earlySquint = insar.masterFrame._squintAngle
@@ -98,22 +66,33 @@ def footprintFromPickle():
     wkt = "POLYGON((%f %f, %f %f, %f %f, %f %f, %f %f))" % ( nearEarlyCorner.getLongitude(),nearEarlyCorner.getLatitude(),farEarlyCorner.getLongitude(),farEarlyCorner.getLatitude(),farLateCorner.getLongitude(),farLateCorner.getLatitude(), nearLateCorner.getLongitude(),nearLateCorner.getLatitude(),nearEarlyCorner.getLongitude(),nearEarlyCorner.getLatitude() )
     return wkt
 
-def footprintFromLogFile():
-    """WARNING:  MASSIVE KLUDGE AHEAD"""
-    f = open('isce.log')
-    log = f.readlines()
-    f.close()
+def footprintFromLogFile(logfile='isce.log'):
+    """Footprint from the frame corners that FrameInfoExtractor writes to the log.
+
+    The log is streamed line by line and reading stops at the first four corners,
+    which are logged during preprocessing, so the time does not depend on how
+    long the rest of the log is.  Returns None if there are no corners.
+    """
     lats = []
     lons = []
-    for line_number, line in enumerate(log, 1):
-        if 'contrib.frameUtils.FrameInfoExtractor' in line and 'Corner' in line:
-            lats.append(log[line_number-1].strip().split(":")[-1])
-            lons.append(log[line_number].strip().split(":")[-1])
+    with open(logfile) as f:
+        for line in f:
+            if 'contrib.frameUtils.FrameInfoExtractor' in line and 'Corner' in line:
+                lats.append(line.strip().split(":")[-1])
+                lons.append(next(f, '').strip().split(":")[-1])
+                if len(lats) == 4:
+                    break
+    if len(lats) < 4:
+        return None
     poly_lats = [lats[0],lats[1],lats[3],lats[2],lats[0]]
     poly_lons =  [lons[0],lons[1],lons[3],lons[2],lons[0]]
     wkt = "POLYGON((" + ",".join([lon+' '+lat for lat,lon in zip(poly_lats,poly_lons)]) + "))"
     return wkt
 
+def footprintFromExtent(north,south,west,east):
+    """Footprint of the geocoded grid, used when the frame corners are not available."""
+    return "POLYGON((%f %f,%f %f,%f %f,%f %f,%f %f))" % (west,north,east,north,east,south,west,south,west,north)
+
 def parse():
     '''Command line parser.
 
@@ -125,7 +104,7 @@ def parse():
 #    parser.add_argument('-mission', dest='mission', action='store', help='Name of the mission', type=str, required=True)
 #    parser.add_argument('-relative_orbit', dest='relative_orbit', action='store', help='Relative orbit/Track/Path number', type=int, required=True)
     parser.add_argument('-processing_type', dest='processing_type', action='store', help='Type of processing: INTERFEROGRAM, LOS_VELOCITY,...', type=str, default='INTERFEROGRAM')
-#    parser.add_argument('-footprint', dest='scene_footprint', action='store', help='WKT Polygon for the area covered by the swath', type=str)
+    parser.add_argument('-footprint', dest='scene_footprint', action='store', help='WKT Polygon for the area covered by the swath, default is the frame corners from isce.log', type=str)
     parser.add_argument('-swath', dest='beam_swath', action='store', help='Swath name without underscores', type=str )
     ## RECOMMENDED METADATA ##
     parser.add_argument('-beam_mode', dest='beam_mode', action='store', help='', type=str)
@@ -142,12 +121,32 @@ def parse():
 #    parser.add_argument('-slave_platform', dest='slave_platform', action='store', help='', type=str)
 #    parser.add_argument('-slave_orbit', dest='slave_absolute_orbit', action='store', help='', type=int)
 #    parser.add_argument('-', dest='', action='store', help='', type=str)
+    ## UPDATING EXISTING PRODUCTS ##
+    parser.add_argument('-checksum', dest='checksum', action='store_true', help='detect changed inputs by md5 of their contents instead of size/mtime')
+    parser.add_argument('-force', dest='force', action='store_true', help='rewrite all datasets even if their inputs did not change')
+    parser.add_argument('-complex', dest='store_complex', action='store_true', help='also store the complex interferogram as complex_interferogram')
+    parser.add_argument('-no_overviews', dest='overviews', action='store_false', help='do not store the 2x, 4x and 8x downsampled OVERVIEW levels')
+    parser.add_argument('-quantize', dest='quantize', action='store_true', help='store correlation as uint8, wrapped phase and incidence as int16 and unwrapped phase as int32 steps of -unwrapped_precision, with CF scale_factor, add_offset and _FillValue attributes')
+    parser.add_argument('-unwrapped_precision', dest='unwrapped_precision', action='store', help='step of the quantized unwrapped phase in radians (default=%(default)s)', type=float, default=h5product.UNWRAPPED_PRECISION)
+    ## AREA OF INTEREST AND RESOLUTION ##
+    parser.add_argument('-bbox', dest='bbox', action='store', nargs=4, type=float, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'), help='only convert this lon/lat bounding box')
+    parser.add_argument('-wkt', dest='wkt', action='store', help='only convert the bounding box of this WKT geometry', type=str)
+    parser.add_argument('-looks', dest='looks', action='store', nargs=2, type=int, metavar=('ROWS', 'COLUMNS'), help='multilook: average ROWS x COLUMNS pixel windows (circular mean for the wrapped phase)')
+    ## PROFILING ##
+    parser.add_argument('-trace', dest='trace', action='store', help='write the time, bytes and allocations of each dataset conversion to this JSON trace file', type=str)
+    parser.add_argument('-trace_profile', dest='trace_profile', action='store_true', help='also profile the conversion with cProfile, saved as TRACE.prof')
+    parser.add_argument('-trace_memory', dest='trace_memory', action='store_true', help='also trace allocations with tracemalloc (python 3 only)')
     clos = parser.parse_args()
     return clos
 
 def main(argv):
     # GET THE COMMAND LINE OPTIONS
     clos = parse()
+    tracer = None
+    if clos.trace:
+        import atexit
+        tracer = tracing.Tracer(clos.trace, clos.trace_profile, clos.trace_memory)
+        atexit.register(tracer.close)
 
     ### READ GEOCODE DATASETS ###
     # these are hardwired in here, change if you have different naming conventions or want to include different products
@@ -157,28 +156,33 @@ def main(argv):
     unw_file = "filt_topophase.flat.unw.geo"
     rdr_file = 'los.rdr.geo'
 
-    PA = createFileParser('xml')
-    dictOut,dictFact,dictMisc = PA.parse(xmlfile)
+    dictOut = sar_metadata.read_isce_image(xmlfile)
     width = dictOut['width']
     length = dictOut['length']
-    xstep = dictOut['Coordinate1']['delta']
-    ystep = dictOut['Coordinate2']['delta']
-    north = dictOut['Coordinate2']['startingvalue']
+    xstep = dictOut['coordinate1']['delta']
+    ystep = dictOut['coordinate2']['delta']
+    north = dictOut['coordinate2']['startingvalue']
     south = north + length*ystep
-    west = dictOut['Coordinate1']['startingvalue']
+    west = dictOut['coordinate1']['startingvalue']
     east = west + width*xstep
+    # window of the -bbox/-wkt area of interest and grid of the (multilooked) datasets
+    aoi = clos.bbox or clos.wkt
+    window, grid, shape = h5subset.output_window((west, north, xstep, ystep), (length, width), aoi, clos.looks)
 
-    inta,intp = read_complex64(int_file,length,width)
-    unwa,unwp = read_float32(unw_file,length,width)
-    rdra,rdrp = read_float32(rdr_file,length,width)
-    corp = np.fromfile(cor_file,dtype=np.float32).reshape(length,width)
+    # (dataset name, input file, memory-mapped source streamed to the HDF5, overview kind)
+    layers = [('unwrapped_interferogram', unw_file, lambda fn: h5product.map_bands(fn,np.float32,length,width)[:,1], 'mean'),
+              ('wrapped_interferogram', int_file, lambda fn: h5product.PhaseRaster(h5product.map_raster(fn,np.complex64,length,width)), 'phase'),
+              ('correlation', cor_file, lambda fn: h5product.map_raster(fn,np.float32,length,width), 'mean'),
+              ('incidence_angle', rdr_file, lambda fn: h5product.map_bands(fn,np.float32,length,width)[:,1], 'mean')]
+    if clos.store_complex:
+        layers.append(('complex_interferogram', int_file, lambda fn: h5product.map_raster(fn,np.complex64,length,width), None))
+    overviews = h5product.OVERVIEW_FACTORS if clos.overviews else ()
 
     #################################
     ###  METADATA
     #################################
     # we will grab most of the metadata from the insarProc.xml file
-    tree = ET.parse('insarProc.xml')
-    root = tree.getroot()
+    root = sar_metadata.read_xml('insarProc.xml')
     first_date = datetime.datetime.strptime(root.find('master/frame/SENSING_START').text,'%Y-%m-%d %H:%M:%S.%f') 
     last_date = datetime.datetime.strptime(root.find('slave/frame/SENSING_START').text,'%Y-%m-%d %H:%M:%S.%f') 
     meta_dict = {}
@@ -198,7 +202,10 @@ def main(argv):
     meta_dict['last_date'] = last_date.strftime("%Y%m%d")
     meta_dict['processing_type'] = clos.processing_type # SET AS A DEFAULT IN parse()
 #    meta_dict['scene_footprint'] = footprintFromPickle()
-    meta_dict['scene_footprint'] = footprintFromLogFile()
+    if clos.scene_footprint:
+        meta_dict['scene_footprint'] = clos.scene_footprint
+    else:
+        meta_dict['scene_footprint'] = (os.path.exists('isce.log') and footprintFromLogFile()) or footprintFromExtent(north,south,west,east)
 
     ## RECOMMENDED METADATA ##
     if clos.beam_mode:
@@ -242,10 +249,10 @@ def main(argv):
         meta_dict['processing_atmos_correct_method'] = clos.processing_atmos_correct_method
     meta_dict['processing_dem'] = 'SRTM1'
     meta_dict['history'] = 'H5 file created: %s' % datetime.datetime.utcnow()
+    ## GRID, SIZE AND FOOTPRINT OF THE CROPPED/MULTILOOKED DATASETS ##
+    if aoi or clos.looks:
+        h5subset.update_grid_metadata(meta_dict, grid, shape, footprint=bool(aoi))
 
-    meta_dict['average_coherence'] = np.mean(corp)
-    meta_dict['max_coherence'] = np.nanmax(corp)
-#    meta_dict['percent_unwrapped'] = ''
 #    meta_dict['percent_atmos'] = ''
     meta_dict['baseline_perp'] = float(root.find('baseline/perp_baseline_top').text) 
     meta_dict['temporal_baseline'] = abs((first_date-last_date).days)
@@ -258,19 +265,28 @@ def main(argv):
     filename_root = '%s_%s_%03d_%04d_%s-%s_%04d_%05d' % (meta_dict['mission'],meta_dict['beam_swath'],meta_dict['relative_orbit'],meta_dict['frame'],first_date.strftime("%Y%m%d"),last_date.strftime("%Y%m%d"),meta_dict['temporal_baseline'],meta_dict['baseline_perp']) 
     h5file = os.getcwd() + '/'+filename_root+'.h5' 
     ## OPEN HDF5 FILE ##
-    f = h5py.File(h5file)
+    f = h5product.open_product(h5file)
     ## CREATE GEOCODE GROUP ##
-    group = f.create_group('GEOCODE')
-    ## CREATE GEOCODE DATASETS ##
-    if not os.path.basename('unwrapped_interferogram') in group:
-        dset = group.create_dataset('unwrapped_interferogram', data=unwp, compression='gzip')
-    if not os.path.basename('wrapped_interferogram') in group:
-        dset = group.create_dataset('wrapped_interferogram', data=intp, compression='gzip')
-    if not os.path.basename('correlation') in group:
-        dset = group.create_dataset('correlation', data=corp, compression='gzip')
-    if not os.path.basename('incidence_angle') in group:
-        dest = group.create_dataset('incidence_angle', data=rdrp, compression='gzip')
-#    if not os.path.basename('digital_elevatino_model') in group:
+    group = f.require_group('GEOCODE')
+    ## A complex_interferogram LEFT BY AN EARLIER RUN WITH -complex ##
+    if not clos.store_complex:
+        h5product.remove_dataset(group, 'complex_interferogram')
+    ## CREATE/UPDATE GEOCODE DATASETS, ONLY THOSE WHOSE INPUTS CHANGED ##
+    for name,infile,source,kind in layers:
+        encoding = h5product.layer_encoding(name, clos.unwrapped_precision) if clos.quantize else None
+        signature = h5product.source_signature([infile, infile+'.xml'], clos.checksum, h5product.dataset_options(overviews, encoding, aoi, clos.looks))
+        if not clos.force and h5product.is_current(group, name, signature):
+            print( 'Skipping %s, %s has not changed' % (name, infile) )
+            continue
+        with tracing.span(tracer, 'convert', dataset=name, input=infile) as span:
+            data = h5product.crop_and_look(source(infile), window, clos.looks, kind, h5product.layer_nodata(name))
+            stats = h5product.layer_stats(name) if kind else None
+            h5product.write_dataset(group, name, data, signature, overviews=overviews, kind=kind, stats=stats, encoding=encoding,
+                                    nodata=h5product.layer_nodata(name))
+            span.add(bytes_in=os.path.getsize(infile), bytes_out=group[name].id.get_storage_size())
+    ## average_coherence, max_coherence and percent_unwrapped FROM THE DATASET STATISTICS ##
+    meta_dict.update(h5product.product_statistics(group))
+#    if not os.path.basename('digital_elevation_model') in group:
 #        dest = group.create_dataset('digital_elevation_model',data=dem,compression='gzip')
 
     ## WRITE ATTRIBUTES TO THE HDF ##
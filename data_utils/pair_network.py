@@ -0,0 +1,132 @@
+###############################################################################
+# pair_network.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Interferogram pair networks from query results
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+# Used by ssara_federated_query.py (python 2), keep it importable from python 3 too.
+"""Plan interferogram pairs for a stack of scenes from the SSARA API.
+
+The temporal and perpendicular baselines between all scenes are built as
+n x n matrices and the pairs are selected with array masks, so a 500 scene
+stack is planned in milliseconds:
+
+    sbas        all pairs within the temporal and perpendicular baseline limits
+    sequential  each scene with the next N acquisitions (within the limits)
+
+Only scenes of the same stack (platform, relative orbit, frames and swath) are
+paired. Perpendicular baselines come from the baselinePerp field of the scene
+records, relative to a common reference scene, where the archive provides it.
+Pairs with an unknown baseline only have to meet the temporal limits.
+"""
+import datetime
+
+import numpy as np
+
+METHODS = ('sbas', 'sequential')
+
+def stack_key(scene):
+    return (scene.get('platform'), scene.get('relativeOrbit'), scene.get('firstFrame'), scene.get('finalFrame'), scene.get('beamSwath'))
+
+def baseline_matrices(scenes):
+    '''Temporal (days) and perpendicular (m) baselines between all scenes and a same-stack mask.
+
+    days[i,j] is the time from scene i to scene j, bperp[i,j] the baseline of j
+    relative to i (NaN if either is unknown).
+    '''
+    epoch = datetime.datetime(1970, 1, 1)
+    t = np.array([(datetime.datetime.strptime(s['startTime'], "%Y-%m-%d %H:%M:%S") - epoch).total_seconds() / 86400.0 for s in scenes])
+    b = np.array([float(s['baselinePerp']) if s.get('baselinePerp') not in (None, '') else np.nan for s in scenes])
+    keys = {}
+    k = np.array([keys.setdefault(stack_key(s), len(keys)) for s in scenes])
+    days = t[np.newaxis, :] - t[:, np.newaxis]
+    bperp = b[np.newaxis, :] - b[:, np.newaxis]
+    same_stack = k[np.newaxis, :] == k[:, np.newaxis]
+    return days, bperp, same_stack
+
+def pair_mask(days, bperp, same_stack, method='sbas', min_days=1, max_days=None, max_bperp=None, neighbors=3):
+    '''Boolean n x n matrix, True at [i,j] if scene i (earlier) and j make a pair.'''
+    mask = same_stack & (days >= max(min_days, 1e-6))
+    if max_days is not None:
+        mask &= days <= max_days
+    if max_bperp is not None:
+        with np.errstate(invalid='ignore'):
+            mask &= ~(np.abs(bperp) > max_bperp)
+    if method == 'sequential':
+        # rank of each later scene of the same stack as seen from scene i: 1 is the next acquisition
+        later = same_stack & (days > 0)
+        order = np.where(later, days, np.inf).argsort(axis=1).argsort(axis=1) + 1
+        mask &= later & (order <= neighbors)
+    elif method != 'sbas':
+        raise ValueError('unknown pair network %r, use one of %s' % (method, ', '.join(METHODS)))
+    return mask
+
+def components(n, i, j):
+    '''Number of connected subsets of the network (scenes without pairs are not counted).'''
+    parent = list(range(n))
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+    for a, b in zip(i, j):
+        parent[find(a)] = find(b)
+    used = set(i) | set(j)
+    return len(set(find(a) for a in used))
+
+def plan(scenes, method='sbas', min_days=1, max_days=None, max_bperp=None, neighbors=3):
+    '''Pair network for the scenes.
+
+    Returns (pairs, needed, subsets): the pairs as dictionaries with the master
+    and slave scene records (master is the earlier one), days and bperp
+    (None if unknown); the scenes used by at least one pair, in the order
+    given; and the number of disconnected subsets of the network.
+    '''
+    given = scenes
+    scenes = sorted(scenes, key=lambda s: s['startTime'])
+    if not scenes:
+        return [], [], 0
+    days, bperp, same_stack = baseline_matrices(scenes)
+    i, j = np.nonzero(pair_mask(days, bperp, same_stack, method, min_days, max_days, max_bperp, neighbors))
+    pairs = [{'master': scenes[a], 'slave': scenes[b], 'days': int(round(days[a, b])),
+              'bperp': None if np.isnan(bperp[a, b]) else float(bperp[a, b])} for a, b in zip(i, j)]
+    used = np.zeros(len(scenes), bool)
+    used[i] = True
+    used[j] = True
+    used = set(id(s) for s, u in zip(scenes, used) if u)
+    needed = [s for s in given if id(s) in used]
+    return pairs, needed, components(len(scenes), i.tolist(), j.tolist())
+
+def write_pairs(pairs, filename):
+    '''Write the pairs as CSV: dates, baselines and the two download URLs.'''
+    import csv
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Master Time', 'Slave Time', 'Days', 'Bperp', 'Master URL', 'Slave URL'])
+        for p in pairs:
+            writer.writerow([p['master']['startTime'], p['slave']['startTime'], p['days'],
+                             '' if p['bperp'] is None else '%.1f' % p['bperp'],
+                             p['master']['downloadUrl'], p['slave']['downloadUrl']])
+    return filename
@@ -36,57 +36,66 @@ import argparse
 import datetime
 
 import numpy as np
-import h5py
+
+import h5product
+import h5subset
+import sar_metadata
+import tracing
 
 def read_rsc_file(rscfile):
   '''Read the .rsc file into a python dictionary structure.
 
+  Files are only parsed once per modification, see sar_metadata.read_rsc.
+  The values are numpy strings, like np.loadtxt gave them, so they are still
+  stored as fixed length string attributes.
   '''
-  rsc_dict = dict(np.loadtxt(rscfile,dtype=str))
-  return rsc_dict
+  return dict((key, np.string_(value)) for key, value in sar_metadata.read_rsc(rscfile).items())
 
-def read_float32(floatfile):
-  '''Reads roi_pac unw, cor, or hgt data.
+def map_float32(floatfile):
+  '''Memory-map roi_pac unw, cor, or hgt data without reading it.
 
-  Requires the file path and returns amplitude and phase
-  Usage:
-    amplitude, phase, rscDictionary = readUnw('geo_070603-070721_0048_00018.unw')
+  Returns the (length, 2, width) array, [:,0] is the amplitude and [:,1] the
+  phase band, and the rsc dictionary.
   '''
   rscContents = read_rsc_file(floatfile + '.rsc')
   width = int(rscContents['WIDTH'])
   length = int(rscContents['FILE_LENGTH'])
-  oddindices = np.where(np.arange(length*2)&1)[0]
-  data = np.fromfile(floatfile,np.float32,length*2*width).reshape(length*2,width)
-  a = np.array([data.take(oddindices-1,axis=0)]).reshape(length,width)
-  p = np.array([data.take(oddindices,axis=0)]).reshape(length,width)
-  return a, p, rscContents
-
-def read_complex64(complexfile):
-  '''Reads roi_pac int or slc data.
-
-  Requires the file path and returns amplitude and phase
-  Usage:
-    amp, phase, rscDictionary = readInt('geo_070603-070721_0048_00018.int')
+  return h5product.map_bands(floatfile,np.float32,length,width), rscContents
+
+def map_complex64(complexfile):
+  '''Memory-map roi_pac int or slc data without reading it.
+
+  Returns the complex (length, width) array and the rsc dictionary.
   '''
   rscContents = read_rsc_file(complexfile + '.rsc')
   width = int(rscContents['WIDTH'])
   length = int(rscContents['FILE_LENGTH'])
-  data = np.fromfile(complexfile,np.complex64,length*2*width).reshape(length,width)
-  a = np.array([np.hypot(data.real,data.imag)]).reshape(length,width)
-  p = np.array([np.arctan2(data.imag,data.real)]).reshape(length,width)
-  return a, p, rscContents
+  return h5product.map_raster(complexfile,np.complex64,length,width), rscContents
 
-def read_dem(demfile):
-  '''Read a roipac dem file.
-
-  Input:
-    roi_pac format dem file
-  '''
+def map_dem(demfile):
+  '''Memory-map a roipac dem file without reading it.'''
   rscContents = read_rsc_file(demfile + '.rsc')
   width = int(rscContents['WIDTH'])
   length = int(rscContents['FILE_LENGTH'])
-  d=np.fromfile(demfile,dtype=np.int16).reshape(length,width)
-  return d, rscContents
+  return h5product.map_raster(demfile,np.int16,length,width), rscContents
+
+def layer_window(rscfile, grid, shape, aoi, looks):
+  '''Window of the layer described by rscfile for the AOI, None if it does not come out on grid and shape.
+
+  The layers can have grids of their own (the DEM has), so the window of each
+  one is found from its own rsc, and a layer that would not line up with the
+  interferogram after cropping and multilooking is left out.
+  '''
+  rsc = read_rsc_file(rscfile)
+  try:
+    window, layer_grid, layer_shape = h5subset.output_window(h5subset.product_grid(rsc), (int(rsc['FILE_LENGTH']), int(rsc['WIDTH'])), aoi, looks)
+  except ValueError:
+    return None
+  # origins within a hundredth of a pixel, steps written with different numbers of digits
+  if layer_shape != shape or any(abs(a - b) > 0.01 * abs(step) for a, b, step in zip(layer_grid[:2], grid[:2], grid[2:])) \
+     or any(abs(a - b) > 1e-4 * abs(b) for a, b in zip(layer_grid[2:], grid[2:])):
+    return None
+  return window
 
 def parse():
     '''Command line parser.
@@ -118,12 +127,32 @@ def parse():
 #    parser.add_argument('-slave_platform', dest='slave_platform', action='store', help='', type=str)
 #    parser.add_argument('-slave_orbit', dest='slave_absolute_orbit', action='store', help='', type=int)
 #    parser.add_argument('-', dest='', action='store', help='', type=str)
+    ## UPDATING EXISTING PRODUCTS ##
+    parser.add_argument('-checksum', dest='checksum', action='store_true', help='detect changed inputs by md5 of their contents instead of size/mtime')
+    parser.add_argument('-force', dest='force', action='store_true', help='rewrite all datasets even if their inputs did not change')
+    parser.add_argument('-complex', dest='store_complex', action='store_true', help='also store the complex interferogram as complex_interferogram')
+    parser.add_argument('-no_overviews', dest='overviews', action='store_false', help='do not store the 2x, 4x and 8x downsampled OVERVIEW levels')
+    parser.add_argument('-quantize', dest='quantize', action='store_true', help='store correlation as uint8, wrapped phase and incidence as int16 and unwrapped phase as int32 steps of -unwrapped_precision, with CF scale_factor, add_offset and _FillValue attributes')
+    parser.add_argument('-unwrapped_precision', dest='unwrapped_precision', action='store', help='step of the quantized unwrapped phase in radians (default=%(default)s)', type=float, default=h5product.UNWRAPPED_PRECISION)
+    ## AREA OF INTEREST AND RESOLUTION ##
+    parser.add_argument('-bbox', dest='bbox', action='store', nargs=4, type=float, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'), help='only convert this lon/lat bounding box')
+    parser.add_argument('-wkt', dest='wkt', action='store', help='only convert the bounding box of this WKT geometry', type=str)
+    parser.add_argument('-looks', dest='looks', action='store', nargs=2, type=int, metavar=('ROWS', 'COLUMNS'), help='multilook: average ROWS x COLUMNS pixel windows (circular mean for the wrapped phase)')
+    ## PROFILING ##
+    parser.add_argument('-trace', dest='trace', action='store', help='write the time, bytes and allocations of each dataset conversion to this JSON trace file', type=str)
+    parser.add_argument('-trace_profile', dest='trace_profile', action='store_true', help='also profile the conversion with cProfile, saved as TRACE.prof')
+    parser.add_argument('-trace_memory', dest='trace_memory', action='store_true', help='also trace allocations with tracemalloc (python 3 only)')
     clos = parser.parse_args()
     return clos
 
 def main(argv):
     # GET THE COMMAND LINE OPTIONS
     clos = parse()
+    tracer = None
+    if clos.trace:
+        import atexit
+        tracer = tracing.Tracer(clos.trace, clos.trace_profile, clos.trace_memory)
+        atexit.register(tracer.close)
 
     rsc_master = read_rsc_file(clos.rsc1)
     rsc_slave = read_rsc_file(clos.rsc2)
@@ -131,15 +160,24 @@ def main(argv):
     last_date = datetime.datetime.strptime(rsc_slave['DATE'],'%y%m%d')
     rsc_baseline = read_rsc_file('%s_%s_baseline.rsc' % (first_date.strftime("%y%m%d"),last_date.strftime("%y%m%d")))
 
-    ### READ GEOCODE DATASETS ###
+    ### GEOCODE DATASETS ###
     geo_root = 'geo_%s-%s' % (first_date.strftime("%y%m%d"),last_date.strftime("%y%m%d"))
     # the file root is hardcoded based on the standard processing produces same/standard filenames each time
     # if you have modified output names, you might need to update this to match your configuration
-    ampunw,unw,unwrsc = read_float32(geo_root+'.unw')
-    ampwrap,wrapped,wraprsc = read_complex64(geo_root+'.int')
-    ampcor,cor,corrsc = read_float32(geo_root+'.cor')
-    ampinc, phaseinc, incrsc = read_float32('geo_incidence.unw')
-    dem,demrsc = read_dem('../DEM/roipac.dem')
+    # (dataset name, input file, memory-mapped source streamed to the HDF5, overview kind)
+    layers = [('unwrapped_interferogram', geo_root+'.unw', lambda fn: map_float32(fn)[0][:,1], 'mean'),
+              ('wrapped_interferogram', geo_root+'.int', lambda fn: h5product.PhaseRaster(map_complex64(fn)[0]), 'phase'),
+              ('correlation', geo_root+'.cor', lambda fn: map_float32(fn)[0][:,1], 'mean'),
+              ('incidence_angle', 'geo_incidence.unw', lambda fn: map_float32(fn)[0][:,0], 'mean'),
+              ('digital_elevation_model', '../DEM/roipac.dem', lambda fn: map_dem(fn)[0], 'mean')]
+    if clos.store_complex:
+        layers.append(('complex_interferogram', geo_root+'.int', lambda fn: map_complex64(fn)[0], None))
+    overviews = h5product.OVERVIEW_FACTORS if clos.overviews else ()
+    wraprsc = read_rsc_file(geo_root+'.int.rsc')
+    # window of the -bbox/-wkt area of interest and grid of the (multilooked) datasets, all layers share the grid
+    # (each layer is cropped with the window from its own rsc, see layer_window())
+    aoi = clos.bbox or clos.wkt
+    window, grid, shape = h5subset.output_window(h5subset.product_grid(wraprsc), (int(wraprsc['FILE_LENGTH']), int(wraprsc['WIDTH'])), aoi, clos.looks)
 
     # these define the footprint of the scene and are used to create the WKT POLYGON below
     lats = [wraprsc['LAT_REF1'],wraprsc['LAT_REF3'],wraprsc['LAT_REF4'],wraprsc['LAT_REF2'],wraprsc['LAT_REF1']]
@@ -184,9 +222,6 @@ def main(argv):
     meta_dict['processing_dem'] = 'SRTM'
     meta_dict['history'] = 'H5 file created: %s' % datetime.datetime.utcnow()
 
-    meta_dict['average_coherence'] = np.mean(cor)
-    meta_dict['max_coherence'] = np.nanmax(cor)
-#    meta_dict['percent_unwrapped'] = ''
 #    meta_dict['percent_atmos'] = ''
     meta_dict['baseline_perp'] = np.mean([float(rsc_baseline['P_BASELINE_TOP_HDR']),float(rsc_baseline['P_BASELINE_BOTTOM_HDR'])])
     meta_dict['temporal_baseline'] = abs((first_date-last_date).days)
@@ -196,27 +231,52 @@ def main(argv):
         meta_dict[key] = value
     for key,value in rsc_baseline.iteritems():
         meta_dict[key] = value
+    ## GRID, SIZE AND FOOTPRINT OF THE CROPPED/MULTILOOKED DATASETS ##
+    if aoi or clos.looks:
+        h5subset.update_grid_metadata(meta_dict, grid, shape, footprint=bool(aoi))
+    ## THE REF CORNERS ARE THOSE OF THE WHOLE RADAR FRAME, THE FOOTPRINT OF THE AOI IS IN scene_footprint ##
+    ref_corners = ['%s_REF%d' % (axis, n) for axis in ('LAT', 'LON') for n in range(1, 5)]
+    if aoi:
+        for key in ref_corners:
+            meta_dict.pop(key, None)
 
     print 'Creating HDF5 file containing geo*int, geo*unw, geo*cor, and geo_incidence.unw ' 
     filename_root = '%s_%s_%03d_%04d_%s-%s_%04d_%05d' % (meta_dict['mission'],meta_dict['beam_swath'],meta_dict['relative_orbit'],meta_dict['frame'],meta_dict['first_date'],meta_dict['last_date'],meta_dict['temporal_baseline'],meta_dict['baseline_perp']) 
     h5file = os.getcwd() + '/'+filename_root+'.h5' 
     ## OPEN HDF5 FILE ##
-    f = h5py.File(h5file)
+    f = h5product.open_product(h5file)
     ## CREATE GEOCODE GROUP ##
-    group = f.create_group('GEOCODE')
-    ## CREATE GEOCODE DATASETS ##
-    if not os.path.basename('unwrapped_interferogram') in group:
-        dset = group.create_dataset('unwrapped_interferogram', data=unw, compression='gzip')
-    if not os.path.basename('wrapped_interferogram') in group:
-        dset = group.create_dataset('wrapped_interferogram', data=wrapped, compression='gzip')
-    if not os.path.basename('correlation') in group:
-        dset = group.create_dataset('correlation', data=cor, compression='gzip')
-    if not os.path.basename('incidence_angle') in group:
-        dest = group.create_dataset('incidence_angle', data=ampinc, compression='gzip')
-    if not os.path.basename('digital_elevatino_model') in group:
-        dest = group.create_dataset('digital_elevation_model',data=dem,compression='gzip')
-
-    ## WRITE ATTRIBUTES TO THE HDF ##
+    group = f.require_group('GEOCODE')
+    ## A complex_interferogram LEFT BY AN EARLIER RUN WITH -complex ##
+    if not clos.store_complex:
+        h5product.remove_dataset(group, 'complex_interferogram')
+    ## CREATE/UPDATE GEOCODE DATASETS, ONLY THOSE WHOSE INPUTS CHANGED ##
+    for name,infile,source,kind in layers:
+        layer = window
+        if aoi or clos.looks:
+            layer = layer_window(infile+'.rsc', grid, shape, aoi, clos.looks)
+            if layer is None:
+                print 'Skipping %s, %s is not on the grid of the interferogram in the area of interest' % (name, infile)
+                h5product.remove_dataset(group, name)
+                continue
+        encoding = h5product.layer_encoding(name, clos.unwrapped_precision) if clos.quantize else None
+        signature = h5product.source_signature([infile, infile+'.rsc'], clos.checksum, h5product.dataset_options(overviews, encoding, aoi, clos.looks))
+        if not clos.force and h5product.is_current(group, name, signature):
+            print 'Skipping %s, %s has not changed' % (name, infile)
+            continue
+        with tracing.span(tracer, 'convert', dataset=name, input=infile) as span:
+            data = h5product.crop_and_look(source(infile), layer, clos.looks, kind, h5product.layer_nodata(name))
+            stats = h5product.layer_stats(name) if kind else None
+            h5product.write_dataset(group, name, data, signature, overviews=overviews, kind=kind, stats=stats, encoding=encoding,
+                                    nodata=h5product.layer_nodata(name))
+            span.add(bytes_in=os.path.getsize(infile), bytes_out=group[name].id.get_storage_size())
+    ## average_coherence, max_coherence and percent_unwrapped FROM THE DATASET STATISTICS ##
+    meta_dict.update(h5product.product_statistics(group))
+
+    ## WRITE ATTRIBUTES TO THE HDF, WITHOUT THE REF CORNERS OF AN EARLIER RUN ON THE WHOLE FRAME ##
+    for key in ref_corners:
+        if key not in meta_dict and key in f.attrs:
+            del f.attrs[key]
     for key,value in meta_dict.iteritems():
         f.attrs[key] = value
 
@@ -0,0 +1,137 @@
+###############################################################################
+# sar_metadata.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Parsers for ROI_PAC, GMTSAR and ISCE metadata files
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+# Used by roipac2hdf5.py and gmtsar2hdf5.py (python 2) and isce2hdf5.py (python 3)
+# so keep it importable from both.
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+_cache = {}
+_lock = threading.Lock()
+
+def parse_value(text):
+    '''Convert a metadata value to int or float when it is one, otherwise return the string.
+
+    Zero padded numbers such as dates (070603) or frame numbers stay strings.
+    '''
+    digits = text.lstrip('+-')
+    if len(digits) > 1 and digits[0] == '0' and digits[1] != '.':
+        return text
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+def _cached(path, kind, parser):
+    '''Parse path with parser once per (path, mtime, size).
+
+    SLC .rsc and .PRM files are shared by every pair of a stack, so batch
+    conversions would otherwise parse them again for each interferogram.
+    '''
+    st = os.stat(path)
+    key = (os.path.abspath(path), kind)
+    stamp = (st.st_mtime, st.st_size)
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    result = parser(path)
+    with _lock:
+        _cache[key] = (stamp, result)
+    return result
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+def _parse_rsc(path):
+    rsc = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split(None, 1)
+            if len(fields) == 2:
+                rsc[fields[0]] = fields[1].strip()
+    return rsc
+
+def _parse_prm(path):
+    prm = {}
+    with open(path) as f:
+        for line in f:
+            key, sep, value = line.partition('=')
+            if sep:
+                prm[key.strip()] = value.strip()
+    return prm
+
+def _typed(d):
+    return dict((key, parse_value(value)) for key, value in d.items())
+
+def read_rsc(path, typed=False):
+    '''Read a ROI_PAC .rsc file into a dictionary.
+
+    Values are strings unless typed=True, which converts numbers to int/float.
+    '''
+    if typed:
+        return dict(_cached(path, 'rsc_typed', lambda p: _typed(_parse_rsc(p))))
+    return dict(_cached(path, 'rsc', _parse_rsc))
+
+def read_prm(path, typed=False):
+    '''Read a GMTSAR .PRM file (key = value lines) into a dictionary.'''
+    if typed:
+        return dict(_cached(path, 'prm_typed', lambda p: _typed(_parse_prm(p))))
+    return dict(_cached(path, 'prm', _parse_prm))
+
+def read_xml(path):
+    '''Root element of an XML file such as ISCE's insarProc.xml.
+
+    The element is shared between callers, do not modify it.
+    '''
+    return _cached(path, 'xml', lambda p: ET.parse(p).getroot())
+
+def _parse_isce_image(path):
+    def properties(element):
+        d = {}
+        for prop in element.findall('property'):
+            value = prop.find('value')
+            if value is not None and value.text is not None:
+                d[prop.get('name').lower()] = parse_value(value.text.strip())
+        for component in element.findall('component'):
+            d[component.get('name').lower()] = properties(component)
+        return d
+    return properties(ET.parse(path).getroot())
+
+def read_isce_image(path):
+    '''Read an ISCE image .xml file (e.g. filt_topophase.flat.geo.xml) into a dictionary.
+
+    Property and component names are lower case and values are typed, e.g.
+    d['width'], d['coordinate1']['startingvalue'], d['coordinate2']['delta'].
+    Does not need ISCE to be installed.
+    '''
+    return _cached(path, 'isce_image', _parse_isce_image)
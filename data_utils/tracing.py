@@ -0,0 +1,185 @@
+###############################################################################
+# tracing.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Stage spans, profiling and allocation tracing
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+# Used by ssara_federated_query.py, roipac2hdf5.py and gmtsar2hdf5.py (python 2)
+# and isce2hdf5.py (python 3) so keep it importable from both. json, threading,
+# cProfile and tracemalloc are only imported when a Tracer is made, so importing
+# this module costs nothing when tracing is off.
+"""Stage spans written to a JSON trace file.
+
+    tracer = tracing.Tracer('trace.json', profile=True, memory=True)
+    with tracer.span('download', url=url) as span:
+        ...
+        span.add(bytes=n)
+    tracer.close()
+
+The file is in the Chrome trace event format (load it in chrome://tracing or
+https://ui.perfetto.dev) with a summary per stage name added: count, total and
+max seconds, and the sums of the counters (bytes, ...). Every span records wall
+time, the process CPU time and peak RSS at its end, and with memory=True the
+bytes allocated during the span (tracemalloc, python 3 only) plus the top
+allocation sites. With profile=True the calling thread is profiled with
+cProfile and the stats are saved next to the trace as <file>.prof.
+"""
+import os
+import sys
+import time
+
+class NoSpan(object):
+    """Stand-in for a span when tracing is off."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **fields):
+        pass
+
+    def add(self, **counts):
+        pass
+
+NO_SPAN = NoSpan()
+
+def span(tracer, name, **fields):
+    """tracer.span(name, ...), or a no-op span if tracer is None."""
+    if tracer is None:
+        return NO_SPAN
+    return tracer.span(name, **fields)
+
+def _cpu():
+    t = os.times()
+    return t[0] + t[1]
+
+def _rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kB on Linux and in bytes on Mac OS X
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+class Span(NoSpan):
+    """One timed stage, use it as a context manager."""
+    def __init__(self, tracer, name, fields):
+        self.tracer = tracer
+        self.name = name
+        self.fields = fields
+        self.counts = {}
+
+    def set(self, **fields):
+        """Attach values to the span (file names, options, ...)."""
+        self.fields.update(fields)
+
+    def add(self, **counts):
+        """Add to the span's counters, e.g. span.add(bytes=len(chunk))."""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        self.start = time.time()
+        self.cpu = _cpu()
+        self.allocated = self.tracer._allocated()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.time()
+        args = dict(self.fields)
+        args.update(self.counts)
+        args['cpu_seconds'] = _cpu() - self.cpu
+        args['rss_mb'] = _rss_mb()
+        if self.allocated is not None:
+            args['allocated_bytes'] = self.tracer._allocated() - self.allocated
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        self.tracer._record(self, end, args)
+        return False
+
+class Tracer(object):
+    """Collects spans from all threads and writes them to filename on close()."""
+    def __init__(self, filename, profile=False, memory=False):
+        import threading
+        self.filename = filename
+        self.events = []
+        self.summary = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._tracemalloc = None
+        self._profile = None
+        if memory:
+            try:
+                import tracemalloc
+                tracemalloc.start(10)
+                self._tracemalloc = tracemalloc
+            except ImportError:
+                print("tracemalloc needs python 3.4 or newer, allocations will not be traced")
+        if profile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def span(self, name, **fields):
+        return Span(self, name, fields)
+
+    def _allocated(self):
+        if self._tracemalloc is None:
+            return None
+        return self._tracemalloc.get_traced_memory()[0]
+
+    def _record(self, span, end, args):
+        import threading
+        event = {'name': span.name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.current_thread().name,
+                 'ts': int((span.start - self.started) * 1e6), 'dur': int((end - span.start) * 1e6), 'args': args}
+        with self._lock:
+            self.events.append(event)
+            s = self.summary.setdefault(span.name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            s['count'] += 1
+            s['seconds'] += end - span.start
+            s['max_seconds'] = max(s['max_seconds'], end - span.start)
+            for key, value in span.counts.items():
+                s[key] = s.get(key, 0) + value
+
+    def close(self):
+        """Stop profiling and write the trace, can be called more than once."""
+        import json
+        trace = {'traceEvents': self.events, 'summary': self.summary, 'command': sys.argv,
+                 'wall_seconds': time.time() - self.started, 'rss_mb': _rss_mb()}
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.filename + '.prof')
+            trace['profile'] = self.filename + '.prof'
+            self._profile = None
+        if self._tracemalloc is not None:
+            current, peak = self._tracemalloc.get_traced_memory()
+            top = self._tracemalloc.take_snapshot().statistics('lineno')[:20]
+            trace['allocations'] = {'current_bytes': current, 'peak_bytes': peak,
+                                    'top': [{'where': str(stat.traceback[0]), 'bytes': stat.size, 'count': stat.count} for stat in top]}
+            self._tracemalloc.stop()
+            self._tracemalloc = None
+        with open(self.filename, 'w') as f:
+            json.dump(trace, f, indent=1, default=str)
@@ -0,0 +1,316 @@
+#! /usr/bin/env python
+###############################################################################
+# ssara_daemon.py
+#
+#  Project:  Seamless SAR Archive
+#  Purpose:  Long running query/download service for the federated client
+#  Created:  October 2026
+#
+###############################################################################
+#  Copyright (c) 2026, SSARA project
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a
+#  copy of this software and associated documentation files (the "Software"),
+#  to deal in the Software without restriction, including without limitation
+#  the rights to use, copy, modify, merge, publish, distribute, sublicense,
+#  and/or sell copies of the Software, and to permit persons to whom the
+#  Software is furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included
+#  in all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+#  OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+#  THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+#  DEALINGS IN THE SOFTWARE.
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import optparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+import ssara_federated_query as ssara
+
+# hosts (and their subdomains) the archives serve granules from; scene records
+# posted to /jobs must point there, their URLs are handed to the download tools
+ARCHIVE_HOSTS = ('alaska.edu', 'unavco.org', 'esa.int')
+ARCHIVE_SCHEMES = ('http', 'https', 'ftp', 'sftp')
+
+def check_scenes(scenes):
+    """Lines explaining which posted scene records are not granules on a known archive, empty if all are.
+
+    Every priority policy must be able to order the records too (startTime,
+    stringFootprint and the size fields), since /priority can switch to any.
+    """
+    import urlparse
+    if not isinstance(scenes, list):
+        return ['"scenes" must be a list of scene records']
+    problems = []
+    for d in scenes:
+        url = d.get('downloadUrl') if isinstance(d, dict) else None
+        if not isinstance(url, basestring) or not isinstance(d.get('collectionName'), basestring):
+            problems.append('not a scene record: %s' % json.dumps(d))
+            continue
+        parts = urlparse.urlsplit(url)
+        host = (parts.hostname or '').lower()
+        if parts.scheme not in ARCHIVE_SCHEMES or not any(host == h or host.endswith('.' + h) for h in ARCHIVE_HOSTS) \
+                or os.path.basename(url) in ('', '.', '..') or len(url.split()) != 1:
+            problems.append('not a granule on a known archive: %s' % url)
+            continue
+        for policy in sorted(ssara.PRIORITY_POLICIES):
+            try:
+                ssara.priority_key(policy, 'POINT(0 0)', [])(d)
+            except Exception, e:
+                problems.append('%s: a field the %s priority needs is missing or malformed (%s)' % (url, policy, e))
+                break
+    return problems
+
+class Job(object):
+    """A download request: the granules (download URLs) it needs and where they go."""
+    def __init__(self, job_id, scenes, directory):
+        self.id = job_id
+        self.created = time.time()
+        self.directory = directory
+        self.urls = [d['downloadUrl'] for d in scenes]
+
+class Scheduler(object):
+    """Download scheduler shared by all jobs.
+
+    Each granule (download URL) is downloaded once, no matter how many jobs
+    ask for it: a job that requests a granule which is already queued,
+    downloading or done just waits for that transfer. Failed granules are
+    queued again when a new job asks for them.
+
+    With a granule store on the client each job can name its own directory
+    under root (default the current directory); finished granules are linked
+    from the store into every directory that asked for them.
+
+    Waiting granules are downloaded in the order of a priority policy
+    (ssara_federated_query.PRIORITY_POLICIES) that can be changed at any time.
+    """
+    def __init__(self, client, parallel=1, priority='recency', root=None):
+        self.client = client
+        self.root = os.path.realpath(root or os.getcwd())
+        self.priority = priority
+        self.queue = ssara.DownloadQueue(ssara.priority_key(priority))
+        self.lock = threading.Lock()
+        self.granules = {}
+        self.jobs = {}
+        self.next_id = 1
+        for i in range(parallel):
+            t = threading.Thread(target=self._work)
+            t.setDaemon(True)
+            t.start()
+
+    def job_directory(self, directory=None):
+        """Real path of a job directory (relative ones are under root), None if it is outside root."""
+        path = os.path.realpath(os.path.join(self.root, directory or ''))
+        if path != self.root and not path.startswith(os.path.join(self.root, '')):
+            return None
+        return path
+
+    def submit(self, scenes, directory=None):
+        path = self.job_directory(directory)
+        if path is None:
+            raise ValueError('job directories must be under %s: %s' % (self.root, directory))
+        directory = path
+        with self.lock:
+            fresh = {}
+            queued = []
+            for d in scenes:
+                url = d['downloadUrl']
+                granule = self.granules.get(url)
+                if (granule is None or granule['state'] == 'failed') and url not in fresh:
+                    fresh[url] = {'scene': d, 'state': 'queued', 'jobs': [], 'directories': []}
+                    queued.append([d, None])
+            # queued before anything is registered: if the priority key fails on
+            # a scene the queue is unchanged and no granule or job is left behind
+            self.queue.extend(queued)
+            self.granules.update(fresh)
+            job = Job(self.next_id, scenes, directory)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            for d in scenes:
+                granule = self.granules[d['downloadUrl']]
+                granule['jobs'].append(job.id)
+                if directory not in granule['directories']:
+                    granule['directories'].append(directory)
+                    if granule['state'] == 'done' and self.client.store:
+                        self._link(d, directory)
+        return job
+
+    def _link(self, d, directory):
+        try:
+            self.client.store.link(d, directory)
+        except Exception, e:
+            print 'Problem linking %s into %s:' % (d['downloadUrl'], directory)
+            print e
+
+    def _work(self):
+        while True:
+            d, unused = self.queue.get()
+            url = d['downloadUrl']
+            with self.lock:
+                granule = self.granules[url]
+                granule['state'] = 'downloading'
+                directory = granule['directories'][0]
+            try:
+                state = 'done' if self.client.download_scene(granule['scene'], directory=directory) else 'failed'
+            except Exception, e:
+                print 'Problem with:', url
+                print e
+                state = 'failed'
+            try:
+                with self.lock:
+                    granule['state'] = state
+                    if state == 'done' and self.client.store:
+                        for directory in granule['directories']:
+                            self._link(granule['scene'], directory)
+            finally:
+                # a worker that dies here would leave the queue with one worker less
+                self.queue.task_done()
+
+    def reprioritize(self, priority, aoi=None, ranks=None):
+        """Reorder the waiting granules by another policy."""
+        self.queue.reprioritize(ssara.priority_key(priority, aoi, ranks))
+        self.priority = priority
+
+    def waiting(self):
+        return {'priority': self.priority, 'waiting': [d['downloadUrl'] for d in self.queue.waiting()]}
+
+    def statuses(self):
+        """Status of all jobs, in the order they were submitted."""
+        with self.lock:
+            job_ids = sorted(self.jobs)
+        return [self.status(job_id) for job_id in job_ids]
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            states = dict((url, self.granules[url]['state']) for url in job.urls)
+        counts = {}
+        for state in states.values():
+            counts[state] = counts.get(state, 0) + 1
+        finished = counts.get('done', 0) + counts.get('failed', 0) == len(states)
+        return {'job': job.id, 'created': job.created, 'directory': job.directory, 'finished': finished, 'counts': counts, 'granules': states}
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """JSON API:
+
+    POST /query  {"platform": "ENVISAT", ...}                   -> {"scenes": [...], "messages": [...]}
+    POST /jobs   {"query": {...}, "filter": {"monthMin": 6}}   -> {"job": 1, ...}
+                 or {"scenes": [scene records from /query]}
+                 optionally with "directory": "/path/to/project" (under --jobRoot, needs --store)
+    GET  /jobs                                                  -> status of all jobs
+    GET  /jobs/<id>                                             -> status of one job
+    POST /priority {"policy": "aoi", "aoi": "POLYGON((...))"}  -> reorder the waiting granules
+                   or {"policy": "rank", "ranks": [granule names or URLs]}
+    GET  /priority                                              -> policy and waiting granules in order
+    """
+    def _reply(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _request(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or '{}')
+
+    def do_GET(self):
+        scheduler = self.server.scheduler
+        parts = self.path.strip('/').split('/')
+        if parts == ['priority']:
+            self._reply(200, scheduler.waiting())
+        elif parts == ['jobs']:
+            self._reply(200, scheduler.statuses())
+        elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit() and scheduler.status(int(parts[1])):
+            self._reply(200, scheduler.status(int(parts[1])))
+        else:
+            self._reply(404, {'error': 'not found: %s' % self.path})
+
+    def do_POST(self):
+        client = self.server.scheduler.client
+        try:
+            request = self._request()
+            if self.path == '/query':
+                scenes = client.query(**request)
+                self._reply(200, {'scenes': scenes, 'messages': client.messages})
+            elif self.path == '/jobs':
+                scheduler = self.server.scheduler
+                if 'scenes' in request:
+                    # posted records are downloaded as they are, so they must be granules the archives serve
+                    scenes = request['scenes']
+                    problems = check_scenes(scenes)
+                    if problems:
+                        self._reply(400, {'error': problems})
+                        return
+                else:
+                    scenes = client.filter(client.query(**request.get('query', {})), **request.get('filter', {}))
+                if request.get('directory') and not client.store:
+                    self._reply(400, {'error': 'job directories need a granule store (--store)'})
+                    return
+                if scheduler.job_directory(request.get('directory')) is None:
+                    self._reply(400, {'error': 'job directories must be under %s' % scheduler.root})
+                    return
+                problems = client.check_credentials(scenes)
+                if problems:
+                    self._reply(400, {'error': [p.strip() for p in problems if p.strip()]})
+                    return
+                job = scheduler.submit(scenes, request.get('directory'))
+                self._reply(202, scheduler.status(job.id))
+            elif self.path == '/priority':
+                if request.get('policy') not in ssara.PRIORITY_POLICIES:
+                    self._reply(400, {'error': 'policy must be one of %s' % ', '.join(sorted(ssara.PRIORITY_POLICIES))})
+                    return
+                if request['policy'] == 'aoi' and not request.get('aoi'):
+                    self._reply(400, {'error': 'the aoi policy needs an "aoi" WKT'})
+                    return
+                self.server.scheduler.reprioritize(request['policy'], request.get('aoi'), request.get('ranks'))
+                self._reply(200, self.server.scheduler.waiting())
+            else:
+                self._reply(404, {'error': 'not found: %s' % self.path})
+        except Exception, e:
+            self._reply(500, {'error': str(e)})
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def main(argv):
+    parser = optparse.OptionParser(description="Run the SSARA client as a long running service with a local JSON API "
+                                   "for query and download jobs. All jobs share one API connection, the archive logins "
+                                   "and one download scheduler, and granules requested by several jobs are only downloaded once.")
+    parser.add_option('--host', action="store", dest="host", default='127.0.0.1', help='address to listen on (default=%default)')
+    parser.add_option('--port', action="store", dest="port", type="int", default=8780, help='port to listen on (default=%default)')
+    parser.add_option('--parallel', action="store", dest="parallel", type="int", default=1, metavar='<ARG>', help='number of scenes to download in parallel (default=%default)')
+    parser.add_option('--priority', action="store", dest="priority", default='recency', metavar='<ARG>', help='initial download order: %s (default=%%default)' % ', '.join(sorted(ssara.PRIORITY_POLICIES)))
+    parser.add_option('--directory', action="store", dest="directory", default='.', help='directory the data are downloaded to (default=%default)')
+    parser.add_option('--keepFree', action="store", dest="keepFree", type="float", default=512, metavar='<MB>', help='disk space left free by the downloads, which wait until there is room (default=%default)')
+    parser.add_option('--jobRoot', action="store", dest="jobRoot", default='', metavar='<DIR>', help='jobs can only name directories under this one (default is --directory)')
+    parser.add_option('--store', action="store", dest="store", default=os.environ.get('SSARA_STORE', ''), metavar='<DIR>', help='shared granule store, lets jobs name their own directory (default is $SSARA_STORE if set)')
+    opts, remainder = parser.parse_args(argv)
+    os.chdir(opts.directory)
+    server = Server((opts.host, opts.port), Handler)
+    server.scheduler = Scheduler(ssara.SsaraClient(store=opts.store and ssara.GranuleStore(opts.store),
+                                                   space=ssara.DiskSpace(opts.keepFree * 1024 * 1024)), opts.parallel, opts.priority, opts.jobRoot or None)
+    print "SSARA daemon listening on http://%s:%d, downloading to %s" % (opts.host, opts.port, os.getcwd())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -31,23 +31,29 @@
 
 import os
 import sys
-import urllib
-import urllib2
-import json
 import datetime
 import time
-import csv
-from xml.dom import minidom
-import itertools
 import operator
-import re
 import optparse
-import threading
-import Queue
-import subprocess as sub
 
 import password_config
 
+# shared helpers that live in data_utils/ next to this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_utils'))
+import tracing
+
+# the network, export and download modules are imported where they are used so that
+# option parsing and --help do not pay for them, see benchmarks/bench_startup.py
+
+API_URL = "http://web-services.unavco.org/brokered/ssara/api/sar/search"
+ASF_LOGIN_URL = "https://ursa.asfdaac.alaska.edu/cgi-bin/login"
+UNAVCO_AUTH_URL = "http://www.unavco.org/data/imaging/sar/"
+# options that are passed on to the API query
+QUERY_FIELDS = ['platform', 'absoluteOrbit', 'relativeOrbit', 'frame', 'start', 'end', 'beamMode', 'beamSwath',
+                'flightDirection', 'lookDirection', 'polarization', 'collectionName', 'processingLevel', 'maxResults',
+                'intersectsWith', 'minBaselinePerp', 'maxBaselinePerp', 'minDoppler', 'maxDoppler',
+                'minFaradayRotation', 'maxFaradayRotation', 'minInsarStackSize', 'maxInsarStackSize']
+
 
 class MyParser(optparse.OptionParser):
     def format_epilog(self, formatter):
@@ -117,6 +123,16 @@ Usage Examples:
     resultsgroup.add_option('--print', action="store_true", default=False, help='print results to screen')
     resultsgroup.add_option('--download', action="store_true", default=False, help='download the data')
     resultsgroup.add_option('--parallel', action="store", dest="parallel", type="int", default=1, metavar='<ARG>', help='number of scenes to download in parallel (default=%default)')
+    resultsgroup.add_option('--preflight', action="store_true", default=False, help='before downloading, check login, size and local copy of every granule with concurrent zero-length requests and report the total size and ETA; already complete granules are not downloaded again')
+    resultsgroup.add_option('--preflightThreads', action="store", dest="preflightThreads", type="int", default=16, metavar='<ARG>', help='concurrent preflight requests (default=%default)')
+    resultsgroup.add_option('--rate', action="store", dest="rate", type="float", default=10, metavar='<MB/S>', help='expected download rate per parallel download for the preflight ETA (default=%default)')
+    resultsgroup.add_option('--unpack', action="store_true", default=False, help='decompress each .zip, .tgz/.tar.gz or .gz granule as soon as it is downloaded, while the next ones download')
+    resultsgroup.add_option('--convert', action="store", dest="convert", metavar='<CMD>', help='shell command run on each downloaded (and unpacked) granule while the next ones download, {} is replaced by its path')
+    resultsgroup.add_option('--pipelineDepth', action="store", dest="pipelineDepth", type="int", default=2, metavar='<ARG>', help='granules that may wait for --unpack or --convert before the downloads pause (default=%default)')
+    resultsgroup.add_option('--priority', action="store", dest="priority", default='recency', metavar='<ARG>', help='download order: recency (newest first), aoi (most overlap with --intersectsWith first), size (smallest first) or rank (order of the --ranks file) (default=%default)')
+    resultsgroup.add_option('--ranks', action="store", dest="ranks", metavar='<FILE>', help='granule names or URLs, one per line, highest priority first, for --priority=rank. The file is watched and the waiting downloads are reordered when it changes')
+    resultsgroup.add_option('--keepFree', action="store", dest="keepFree", type="float", default=512, metavar='<MB>', help='disk space left free by the downloads; a download that does not fit waits until there is room (default=%default)')
+    resultsgroup.add_option('--store', action="store", dest="store", default=os.environ.get('SSARA_STORE', ''), metavar='<DIR>', help='shared granule store: download each granule once into DIR and link it into the current directory (default is $SSARA_STORE if set)')
 #    resultsgroup.add_option('--unavuser', action="store", dest="unavuser", type="str", metavar='<ARG>', help='UNAVCO SAR Archive username')
 #    resultsgroup.add_option('--unavpass', action="store", dest="unavpass", type="str",metavar='<ARG>', help='UNAVCO SAR Archive password')
 #    resultsgroup.add_option('--asfuser', action="store", dest="asfuser", type="str", metavar='<ARG>', help='ASF Archive username')
@@ -128,65 +144,273 @@ Usage Examples:
     resultsgroup.add_option('--noswath', action="store_true", default=False, help='Enforce first_frame==final_frame (i.e. not a swath)')
     resultsgroup.add_option('--dem', action="store_true", default=False, help='OT call for DEM')
     parser.add_option_group(resultsgroup) 
+
+    pairgroup = optparse.OptionGroup(parser, "Pair Network Options", "Plan interferogram pairs from the filtered scenes and keep "
+                                     "only the scenes the network needs (for --print, --csv and --download). The pairs are saved to a CSV file.")
+    pairgroup.add_option('--pairs', action="store", dest="pairs", default='', metavar='<ARG>', help='network to plan: sbas (all pairs within the baseline limits) or sequential')
+    pairgroup.add_option('--minTemporalBaseline', action="store", dest="minTemporalBaseline", type="float", default=1, metavar='<DAYS>', help='shortest pair in days (default=%default)')
+    pairgroup.add_option('--maxTemporalBaseline', action="store", dest="maxTemporalBaseline", type="float", metavar='<DAYS>', help='longest pair in days')
+    pairgroup.add_option('--maxPairBaselinePerp', action="store", dest="maxPairBaselinePerp", type="float", metavar='<M>', help='largest perpendicular baseline of a pair in meters, where the archive gives baselines')
+    pairgroup.add_option('--neighbors', action="store", dest="neighbors", type="int", default=3, metavar='<ARG>', help='later acquisitions each scene is paired with in a sequential network (default=%default)')
+    pairgroup.add_option('--pairsFile', action="store", dest="pairsFile", metavar='<FILE>', help='CSV file for the pairs (default ssara_pairs_<time>.csv)')
+    parser.add_option_group(pairgroup)
+
+    tracegroup = optparse.OptionGroup(parser, "Tracing Options", "Record how long the query, parse, filter, export and download "
+                                      "stages take (with byte counts) in a JSON trace file")
+    tracegroup.add_option('--trace', action="store", dest="trace", default='', metavar='<FILE>', help='write the stage spans to FILE (Chrome trace format)')
+    tracegroup.add_option('--trace-profile', action="store_true", dest="trace_profile", default=False, help='also profile the main thread with cProfile, saved as FILE.prof')
+    tracegroup.add_option('--trace-memory', action="store_true", dest="trace_memory", default=False, help='also trace allocations with tracemalloc (python 3 only)')
+    parser.add_option_group(tracegroup)
     opts, remainder = parser.parse_args(argv)
     opt_dict= vars(opts)
 
     ### BUILD DICTIONARY WITH QUERY FIELDS TO THE API ###
-    query_dict = {}
-    if opt_dict['platform']: query_dict['platform'] = opt_dict['platform']
-    if opt_dict['absoluteOrbit']: query_dict['absoluteOrbit'] = opt_dict['absoluteOrbit']
-    if opt_dict['relativeOrbit']: query_dict['relativeOrbit'] = opt_dict['relativeOrbit']
-    if opt_dict['frame']: query_dict['frame'] = opt_dict['frame']
-    if opt_dict['start']: query_dict['start'] = opt_dict['start']
-    if opt_dict['end']: query_dict['end'] = opt_dict['end']
-    if opt_dict['beamMode']: query_dict['beamMode'] = opt_dict['beamMode']
-    if opt_dict['beamSwath']: query_dict['beamSwath'] = opt_dict['beamSwath']
-    if opt_dict['flightDirection']: query_dict['flightDirection'] = opt_dict['flightDirection']
-    if opt_dict['lookDirection']: query_dict['lookDirection'] = opt_dict['lookDirection']
-    if opt_dict['polarization']: query_dict['polarization'] = opt_dict['polarization']
-    if opt_dict['collectionName']: query_dict['collectionName'] = opt_dict['collectionName']
-    if opt_dict['processingLevel']: query_dict['processingLevel'] = opt_dict['processingLevel']
-    if opt_dict['maxResults']: query_dict['maxResults'] = opt_dict['maxResults']
-    if opt_dict['intersectsWith']: query_dict['intersectsWith'] = opt_dict['intersectsWith']
-    if opt_dict['minBaselinePerp']: query_dict['minBaselinePerp'] = opt_dict['minBaselinePerp']
-    if opt_dict['maxBaselinePerp']: query_dict['maxBaselinePerp'] = opt_dict['maxBaselinePerp']
-    if opt_dict['minDoppler']: query_dict['minDoppler'] = opt_dict['minDoppler']
-    if opt_dict['maxDoppler']: query_dict['maxDoppler'] = opt_dict['maxDoppler']
-    if opt_dict['minFaradayRotation']: query_dict['minFaradayRotation'] = opt_dict['minFaradayRotation']
-    if opt_dict['maxFaradayRotation']: query_dict['maxFaradayRotation'] = opt_dict['maxFaradayRotation']
-    if opt_dict['minInsarStackSize']: query_dict['minInsarStackSize'] = opt_dict['minInsarStackSize']
-    if opt_dict['maxInsarStackSize']: query_dict['maxInsarStackSize'] = opt_dict['maxInsarStackSize']
+    query_dict = dict((field, opt_dict[field]) for field in QUERY_FIELDS if opt_dict[field])
 
+    tracer = None
+    if opt_dict['trace']:
+        import atexit
+        tracer = tracing.Tracer(opt_dict['trace'], opt_dict['trace_profile'], opt_dict['trace_memory'])
+        atexit.register(tracer.close)
 
     ### QUERY THE APIs AND GET THE JSON RESULTS ###
-    params = urllib.urlencode(query_dict)
-    ssara_url = "http://web-services.unavco.org/brokered/ssara/api/sar/search?%s" % params
-    print "Running SSARA API Query"
-    t = time.time()
-    f = urllib2.urlopen(ssara_url)
-    json_data = f.read()
-    data = json.loads(json_data)
-    scenes = data['resultList']
-    print "SSARA API query: %f seconds" % (time.time()-t)
-
-    if data['message']:
+    client = SsaraClient(verbose=True, store=opt_dict['store'] and GranuleStore(opt_dict['store']), tracer=tracer,
+                         space=DiskSpace(opt_dict['keepFree'] * 1024 * 1024))
+    scenes = client.query(**query_dict)
+
+    if client.messages:
         print "###########################"
-        for d in data['message']:
+        for d in client.messages:
             print d
         print "###########################"
 
-    ### ORDER THE SCENES BY STARTTIME, NEWEST FIRST ###
-    scenes = sorted(scenes, key=operator.itemgetter('startTime'), reverse=True)
     print "Found %d scenes" % len(scenes)
-    scenes = [r for r in sorted(scenes, key=operator.itemgetter('startTime')) 
-                     if datetime.datetime.strptime(r['startTime'],"%Y-%m-%d %H:%M:%S").month >= opt_dict['monMin'] 
-                     and datetime.datetime.strptime(r['startTime'],"%Y-%m-%d %H:%M:%S").month <= opt_dict['monMax'] ]
+    scenes = client.filter(scenes, monthMin=opt_dict['monMin'], monthMax=opt_dict['monMax'])
     print "Scenes after filtering for monthMin %d and monthMax %d: %d" % (opt_dict['monMin'],opt_dict['monMax'],len(scenes))
     if opt_dict['noswath']:
-        scenes = [ r for r in sorted(scenes) if r['firstFrame']==r['finalFrame'] ]
+        scenes = client.filter(scenes, noswath=True)
         print "Scenes after filtering out swaths: %d" % len(scenes)
 
+    ### PLAN THE INTERFEROGRAM PAIRS, ONLY THE SCENES IN THE NETWORK ARE KEPT ###
+    if opt_dict['pairs']:
+        pairs, scenes, subsets = client.plan_pairs(scenes, opt_dict['pairs'], opt_dict['minTemporalBaseline'], opt_dict['maxTemporalBaseline'],
+                                                   opt_dict['maxPairBaselinePerp'], opt_dict['neighbors'])
+        filename = client.export_pairs(pairs, opt_dict['pairsFile'])
+        print "Planned %d %s pairs from %d scenes in %d disconnected subsets, saved to %s" % (len(pairs), opt_dict['pairs'], len(scenes), subsets, filename)
+        if opt_dict['maxPairBaselinePerp'] is not None and not [p for p in pairs if p['bperp'] is not None]:
+            print "No perpendicular baselines in the scene records, the pairs only meet the temporal limits"
+
     if opt_dict['dem']:
+        print client.dem_command(scenes)
+
+    if not opt_dict['kml'] and not opt_dict['download'] and not opt_dict['print'] and not opt_dict['preflight']:
+        print "You did not specify the --kml, --print, --preflight or --download option, so there really is nothing else I can do for you now"
+    if opt_dict['print']:
+        client.print_scenes(scenes)
+    ### MAKE THE CSV FILE ###
+    if opt_dict['csv']:
+        client.export_csv(scenes)
+    ### GET A KML FILE, THE FEDERATED API HAS THIS OPTION ALREADY, SO MAKE THE SAME CALL AGAIN WITH output=kml OPTION ###
+    if opt_dict['kml']:
+        client.export_kml(**query_dict)
+    ### CHECK LOGINS, SIZES AND LOCAL COPIES OF ALL GRANULES BEFORE DOWNLOADING ###
+    if opt_dict['preflight']:
+        problems = client.check_credentials(scenes)
+        if problems:
+            for line in problems:
+                print line
+            print "Exiting now since some username/password are needed for the preflight check"
+            exit()
+        start = time.time()
+        results = client.preflight(scenes, opt_dict['preflightThreads'])
+        for line in preflight_report(results, time.time() - start, opt_dict['parallel'], opt_dict['rate']):
+            print line
+        if [r for r in results if r['status'] == 'auth']:
+            print "Exiting now since the archives did not accept some username/password, check password_config.py"
+            exit()
+        # granules complete in a store are kept, downloading them only links them here
+        scenes = [r['scene'] for r in results if (client.store or not r['complete']) and r['status'] != 'missing']
+
+    ### DOWNLOAD THE DATA FROM THE QUERY RESULTS ### 
+    if opt_dict['download']:
+        problems = client.check_credentials(scenes)
+        if problems:
+            for line in problems:
+                print line
+            print "Exiting now since some username/password are needed for data download to continue"
+            exit()
+        if opt_dict['priority'] not in PRIORITY_POLICIES:
+            print "Unknown --priority %s, use one of %s" % (opt_dict['priority'], ', '.join(PRIORITY_POLICIES))
+            exit()
+        if opt_dict['priority'] == 'aoi' and not opt_dict['intersectsWith']:
+            print "--priority=aoi needs the AOI as --intersectsWith"
+            exit()
+        if opt_dict['priority'] == 'rank':
+            if not opt_dict['ranks']:
+                print "--priority=rank needs a --ranks file"
+                exit()
+            watch_ranks(client, opt_dict['ranks'])
+        pipeline = None
+        if opt_dict['unpack'] or opt_dict['convert']:
+            pipeline = Pipeline(opt_dict['unpack'], opt_dict['convert'], opt_dict['pipelineDepth'], tracer=tracer)
+        print "Downloading data now, %d at a time, %s first." % (opt_dict['parallel'], PRIORITY_POLICIES[opt_dict['priority']])
+        client.download(scenes, opt_dict['parallel'], opt_dict, opt_dict['priority'], aoi=opt_dict['intersectsWith'], ranks=read_ranks(opt_dict['ranks']),
+                        pipeline=pipeline)
+        if pipeline:
+            pipeline.close()
+
+class SsaraClient(object):
+    """Client for the SSARA federated API that can be used from python.
+
+    Keeps its HTTP connection to the API and the authenticated archive sessions
+    (ASF login cookie, UNAVCO digest auth) and download threads alive between
+    calls, so a long running program can run many queries and downloads
+    without paying for them each time. Example:
+
+        client = SsaraClient()
+        scenes = client.query(platform='ENVISAT', relativeOrbit=170, frame=2925)
+        scenes = client.filter(scenes, monthMin=6, monthMax=9)
+        pairs, scenes, subsets = client.plan_pairs(scenes, 'sbas', max_days=400, max_bperp=300)
+        client.export_csv(scenes)
+        client.download(scenes, parallel=4)
+
+    With a tracing.Tracer each stage (query, parse, filter, export, download)
+    is recorded as a span. Downloads start only when their file fits on the
+    disk, see DiskSpace.
+
+    Scene records are the dictionaries returned by the API (collectionName,
+    platform, startTime, downloadUrl, stringFootprint, ...).
+    """
+    def __init__(self, api_url=None, credentials=None, verbose=False, timeout=300, store=None, tracer=None, space=None):
+        import threading
+        self.api_url = api_url or API_URL
+        self.credentials = credentials or password_config
+        self.verbose = verbose
+        self.store = store
+        self.space = space or DiskSpace()
+        self.tracer = tracer
+        self.timeout = timeout
+        self.messages = []
+        self._connections = {}
+        self._openers = {}
+        self._lock = threading.Lock()
+        # the ASF login is network I/O, it must not hold up self._lock
+        self._opener_lock = threading.Lock()
+        self._queue = None
+        self._workers = []
+
+    def _log(self, message):
+        if self.verbose:
+            print message
+
+    def _fetch(self, url, redirects=5):
+        """GET url, returns (headers, body).
+
+        Requests to a host reuse idle keep-alive connections; a connection
+        the server has dropped is reopened once. The lock is only held to take
+        a connection from the pool and put it back, so concurrent requests
+        (and downloads) do not wait for each other's round-trips. If a proxy
+        is configured urllib2 is used instead.
+        """
+        import httplib
+        import socket
+        import urllib
+        import urllib2
+        import urlparse
+        parts = urlparse.urlsplit(url)
+        if urllib.getproxies().get(parts.scheme):
+            r = urllib2.urlopen(url)
+            return r.info(), r.read()
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        for attempt in (0, 1):
+            conn = None
+            if not attempt:
+                with self._lock:
+                    idle = self._connections.get(key)
+                    conn = idle.pop() if idle else None
+            if conn is None:
+                connection = httplib.HTTPSConnection if parts.scheme == 'https' else httplib.HTTPConnection
+                conn = connection(parts.netloc, timeout=self.timeout)
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            with self._lock:
+                self._connections.setdefault(key, []).append(conn)
+            break
+        if response.status in (301, 302, 303, 307) and redirects:
+            return self._fetch(urlparse.urljoin(url, response.getheader('location')), redirects - 1)
+        if response.status >= 400:
+            raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+        return response.msg, body
+
+    def query(self, **query):
+        """Search the API, returns the list of scene records newest first.
+
+        The keyword arguments are the API query fields, see QUERY_FIELDS. Any
+        messages from the API are kept in self.messages.
+        """
+        import json
+        import urllib
+        self._log("Running SSARA API Query")
+        t = time.time()
+        with tracing.span(self.tracer, 'query') as span:
+            headers, json_data = self._fetch("%s?%s" % (self.api_url, urllib.urlencode(query)))
+            span.add(bytes=len(json_data))
+        with tracing.span(self.tracer, 'parse') as span:
+            data = json.loads(json_data)
+            self._log("SSARA API query: %f seconds" % (time.time()-t))
+            self.messages = data['message'] or []
+            ### ORDER THE SCENES BY STARTTIME, NEWEST FIRST ###
+            scenes = sorted(data['resultList'], key=operator.itemgetter('startTime'), reverse=True)
+            span.add(scenes=len(scenes))
+        return scenes
+
+    def filter(self, scenes, monthMin=1, monthMax=12, noswath=False):
+        """Keep scenes acquired in months monthMin to monthMax, optionally only single frames (not swaths)."""
+        with tracing.span(self.tracer, 'filter', scenes_in=len(scenes)) as span:
+            scenes = self._filter(scenes, monthMin, monthMax, noswath)
+            span.add(scenes=len(scenes))
+        return scenes
+
+    def _filter(self, scenes, monthMin, monthMax, noswath):
+        scenes = [r for r in sorted(scenes, key=operator.itemgetter('startTime')) 
+                         if datetime.datetime.strptime(r['startTime'],"%Y-%m-%d %H:%M:%S").month >= monthMin 
+                         and datetime.datetime.strptime(r['startTime'],"%Y-%m-%d %H:%M:%S").month <= monthMax ]
+        if noswath:
+            scenes = [ r for r in sorted(scenes) if r['firstFrame']==r['finalFrame'] ]
+        return scenes
+
+    def plan_pairs(self, scenes, method='sbas', min_days=1, max_days=None, max_bperp=None, neighbors=3):
+        """Interferogram pair network for the scenes, see data_utils/pair_network.py.
+
+        Returns (pairs, needed, subsets): the pairs (dictionaries with the
+        master and slave scene records, days and bperp), the scenes used by the
+        pairs and the number of disconnected subsets of the network.
+        """
+        import pair_network
+        with tracing.span(self.tracer, 'plan', method=method, scenes_in=len(scenes)) as span:
+            pairs, needed, subsets = pair_network.plan(scenes, method, min_days, max_days, max_bperp, neighbors)
+            span.add(pairs=len(pairs), scenes=len(needed))
+        return pairs, needed, subsets
+
+    def export_pairs(self, pairs, filename=None):
+        """Write the pairs from plan_pairs to a CSV file, returns the file name."""
+        import pair_network
+        if not filename:
+            filename = 'ssara_pairs_'+datetime.datetime.now().strftime("%Y%m%d%H%M%S")+".csv"
+        with tracing.span(self.tracer, 'export', format='pairs'):
+            return pair_network.write_pairs(pairs, filename)
+
+    def dem_command(self, scenes):
+        """wget command to get an SRTM30 DEM from OpenTopography covering the scenes."""
+        import re
         lats = []
         lons = []
         for scene in scenes:
@@ -199,16 +423,18 @@ Usage Examples:
         south = min(lats)-0.15
         east = max(lons)+0.15
         west = min(lons)-0.15
-        print 'wget -O dem.tif "http://ot-data1.sdsc.edu:9090/otr/getdem?north=%f&south=%f&east=%f&west=%f&demtype=SRTM30"' % (north,south,east,west)
+        return 'wget -O dem.tif "http://ot-data1.sdsc.edu:9090/otr/getdem?north=%f&south=%f&east=%f&west=%f&demtype=SRTM30"' % (north,south,east,west)
 
-    if not opt_dict['kml'] and not opt_dict['download'] and not opt_dict['print']:
-        print "You did not specify the --kml, --print, or --download option, so there really is nothing else I can do for you now"
-    if opt_dict['print']:
+    def print_scenes(self, scenes, out=sys.stdout):
         for r in sorted(scenes, key=operator.itemgetter('startTime')):
-            print ",".join(str(x) for x in [r['collectionName'], r['platform'], r['absoluteOrbit'], r['startTime'], r['stopTime'], r['relativeOrbit'], r['firstFrame'], r['finalFrame'], r['beamMode'], r['beamSwath'], r['flightDirection'], r['lookDirection'],r['polarization'], r['downloadUrl']])
-    ### MAKE THE CSV FILE ###
-    if opt_dict['csv']:
-        with open('ssara_federated_search_'+datetime.datetime.now().strftime("%Y%m%d%H%M%S")+".csv",'w') as CSV:
+            out.write(",".join(str(x) for x in [r['collectionName'], r['platform'], r['absoluteOrbit'], r['startTime'], r['stopTime'], r['relativeOrbit'], r['firstFrame'], r['finalFrame'], r['beamMode'], r['beamSwath'], r['flightDirection'], r['lookDirection'],r['polarization'], r['downloadUrl']]) + "\n")
+
+    def export_csv(self, scenes, filename=None):
+        """Write the scenes to a CSV file, returns the file name."""
+        import csv
+        if not filename:
+            filename = 'ssara_federated_search_'+datetime.datetime.now().strftime("%Y%m%d%H%M%S")+".csv"
+        with tracing.span(self.tracer, 'export', format='csv') as span, open(filename,'w') as CSV:
             writer = csv.writer(CSV)
             writer.writerow(['Collection','Platform','absOrbit','relOrbit','First Frame','Final Frame','Start Time','Stop Time','Beam Mode','Swath','Flight Dir','Look Dir','Polarization','Process Level','URL','WKT'])
             for scene in sorted(scenes, key=operator.itemgetter('startTime')):
@@ -216,67 +442,210 @@ Usage Examples:
                                  scene['firstFrame'],scene['finalFrame'],scene['startTime'],scene['stopTime'],scene['beamMode'],
                                  scene['beamSwath'],scene['flightDirection'],scene['lookDirection'],scene['polarization'],
                                  scene['processingLevel'],scene['downloadUrl'],scene['stringFootprint']])
-#                CSV.write(",".join(str(x) for x in [r['collectionName'], r['platform'], r['absoluteOrbit'], r['startTime'], r['stopTime'], r['relativeOrbit'], r['firstFrame'], r['finalFrame'], r['beamMode'], r['beamSwath'], r['flightDirection'], r['lookDirection'],r['polarization'], r['downloadUrl']])+"\n")
-    ### GET A KML FILE, THE FEDERATED API HAS THIS OPTION ALREADY, SO MAKE THE SAME CALL AGAIN WITH output=kml OPTION ###
-    if opt_dict['kml']:
-        ssara_url = "http://web-services.unavco.org/brokered/ssara/api/sar/search?output=kml&%s" % params
-        print "Getting KML"
-        t = time.time()
-        req = urllib2.Request(ssara_url)
-        r = urllib2.urlopen(req)
-        localName = r.info()['Content-Disposition'].split('filename=')[1].replace('"','')
-        print "Saving KML: %s" % localName
-        f = open(localName, 'wb')
-        f.write(r.read())
-        f.close() 
-    ### DOWNLOAD THE DATA FROM THE QUERY RESULTS ### 
-    if opt_dict['download']:
-        allGood = True
+            span.add(scenes=len(scenes), bytes=CSV.tell())
+        return filename
+
+    def export_kml(self, filename=None, **query):
+        """Save the KML the API makes for the query, returns the file name."""
+        import urllib
+        self._log("Getting KML")
+        with tracing.span(self.tracer, 'export', format='kml') as span:
+            headers, kml = self._fetch("%s?output=kml&%s" % (self.api_url, urllib.urlencode(query)))
+            if not filename:
+                filename = headers['Content-Disposition'].split('filename=')[1].replace('"','')
+            self._log("Saving KML: %s" % filename)
+            with open(filename, 'wb') as f:
+                f.write(kml)
+            span.add(bytes=len(kml))
+        return filename
+
+    def check_credentials(self, scenes):
+        """Lines explaining which collections can't be downloaded with the configured credentials, empty if all is well."""
+        problems = []
         for collection in list(set([d['collectionName'] for d in scenes])):
-            if ('WInSAR' in collection or 'EarthScope' in collection) and not (password_config.unavuser and password_config.unavpass ):
-                print "Can't download collection: %s" % collection
-                print "You need to specify your UNAVCO username and password in password_config.py"
-                print "If you don't have a UNAVCO username/password, limit the query with the --collection option\n"
-                allGood = False
-            if 'Supersites VA4' in collection and not (password_config.eossouser and password_config.eossopass ):
-                print "Can't download collection: %s" % collection
-                print "You need to specify your EO Single Sign On username and password in password_config.py"
-                print "\n****************************************************************"
-                print "For the Supersites VA4 data, you need an EO Single Sign On username/password:"
-                print "Sign up for one here: https://eo-sso-idp.eo.esa.int/idp/AuthnEngine"
-                print "****************************************************************\n"
-                allGood = False
-            if 'ASF' in collection and not (password_config.asfuser and password_config.asfpass ):
-                print "Can't download collection: %s" % collection
-                print "You need to specify your ASF username and password in password_config.py"
-                print "If you don't have a ASF username/password, limit the query with the --collection option\n"
-                allGood = False
-        if not allGood:
-            print "Exiting now since some username/password are needed for data download to continue"
-            exit()
-        print "Downloading data now, %d at a time." % opt_dict['parallel']
-        #create a queue for parallel downloading
-        queue = Queue.Queue()
-        #spawn a pool of threads, and pass them queue instance 
-        for i in range(opt_dict['parallel']):
-            t = ThreadDownload(queue)
-            t.setDaemon(True)
-            t.start()
-        #populate queue with data   
-        for d in sorted(scenes, key=operator.itemgetter('collectionName')):
-            queue.put([d, opt_dict])
-        #wait on the queue until everything has been processed     
-        queue.join()
-        
-def asf_dl(d, opt_dict):
-    user_name = password_config.asfuser
-    user_password = password_config.asfpass
-    url = d['downloadUrl']
-    filename = os.path.basename(url)
+            if ('WInSAR' in collection or 'EarthScope' in collection) and not (self.credentials.unavuser and self.credentials.unavpass ):
+                problems.append("Can't download collection: %s" % collection)
+                problems.append("You need to specify your UNAVCO username and password in password_config.py")
+                problems.append("If you don't have a UNAVCO username/password, limit the query with the --collection option\n")
+            if 'Supersites VA4' in collection and not (self.credentials.eossouser and self.credentials.eossopass ):
+                problems.append("Can't download collection: %s" % collection)
+                problems.append("You need to specify your EO Single Sign On username and password in password_config.py")
+                problems.append("\n****************************************************************")
+                problems.append("For the Supersites VA4 data, you need an EO Single Sign On username/password:")
+                problems.append("Sign up for one here: https://eo-sso-idp.eo.esa.int/idp/AuthnEngine")
+                problems.append("****************************************************************\n")
+            if 'ASF' in collection and not (self.credentials.asfuser and self.credentials.asfpass ):
+                problems.append("Can't download collection: %s" % collection)
+                problems.append("You need to specify your ASF username and password in password_config.py")
+                problems.append("If you don't have a ASF username/password, limit the query with the --collection option\n")
+        return problems
+
+    def opener(self, archive):
+        """Authenticated urllib2 opener for 'asf' or 'unavco', created once and shared by all downloads.
+
+        The ASF login session is shared by all threads. UNAVCO openers are made
+        per thread because urllib2's digest handler counts retries in the
+        handler, and concurrent challenges would make it give up.
+        """
+        import thread
+        key = archive if archive == 'asf' else (archive, thread.get_ident())
+        with self._opener_lock:
+            if key not in self._openers:
+                if archive == 'asf':
+                    self._openers[key] = asf_opener(self.credentials.asfuser, self.credentials.asfpass)
+                else:
+                    self._openers[key] = unavco_opener(self.credentials.unavuser, self.credentials.unavpass)
+            return self._openers[key]
+
+    def probe(self, d):
+        """Check one granule without downloading it, see preflight()."""
+        import socket
+        import urllib2
+        url = d['downloadUrl']
+        result = {'scene': d, 'status': 'ok', 'bytes': None, 'complete': False, 'error': ''}
+        archive = 'unavco' if 'unavco' in url else 'asf' if 'asf' in url else None
+        if archive is None:
+            # secp (Supersites VA4) logs in through the ESA single sign-on for each transfer
+            result['status'] = 'unchecked'
+        else:
+            try:
+                r = self.opener(archive).open(urllib2.Request(url, headers={'Range': 'bytes=0-0'}), timeout=self.timeout)
+                if r.code == 206 and '/' in (r.info().get('Content-Range') or ''):
+                    result['bytes'] = int(r.info()['Content-Range'].split('/')[-1])
+                elif r.info().get('Content-Length'):
+                    result['bytes'] = int(r.info()['Content-Length'])
+                r.close()
+            except urllib2.HTTPError, e:
+                result['status'] = 'auth' if e.code in (401, 403) else 'missing' if e.code == 404 else 'error'
+                result['error'] = str(e)
+            except (urllib2.URLError, socket.error, ValueError), e:
+                result['status'] = 'error'
+                result['error'] = str(e)
+        if self.store:
+            result['complete'] = self.store.complete(d)
+        else:
+            filename = os.path.basename(url)
+            result['complete'] = os.path.exists(filename) and result['bytes'] is not None and os.path.getsize(filename) == result['bytes']
+        return result
+
+    def preflight(self, scenes, threads=16):
+        """Check every granule with concurrent zero-length Range requests before a bulk download.
+
+        Returns a list with a dictionary per scene: the scene record, status
+        ('ok', 'auth' for a rejected login, 'missing', 'error', or 'unchecked'
+        for Supersites VA4), bytes (the granule size if the archive gives it),
+        complete (already downloaded, or in the store) and error (the message).
+        """
+        import Queue
+        import threading
+        tasks = Queue.Queue()
+        for i, d in enumerate(scenes):
+            tasks.put((i, d))
+        results = [None] * len(scenes)
+        def work():
+            while True:
+                try:
+                    i, d = tasks.get_nowait()
+                except Queue.Empty:
+                    return
+                results[i] = self.probe(d)
+        with tracing.span(self.tracer, 'preflight', scenes=len(scenes)) as span:
+            workers = [threading.Thread(target=work) for i in range(min(threads, len(scenes)))]
+            for t in workers:
+                t.setDaemon(True)
+                t.start()
+            for t in workers:
+                t.join()
+            span.add(bytes=sum(r['bytes'] or 0 for r in results))
+        return results
+
+    def download_scene(self, d, opt_dict=None, directory=None):
+        """Download one scene with the driver for its archive, returns the local file or None.
+
+        Without a store the file is written to the current directory. With a
+        GranuleStore it is fetched into the store once, under a lock shared by
+        all threads and processes using the store, and linked into directory
+        (default the current directory).
+        """
+        with tracing.span(self.tracer, 'download', url=d['downloadUrl']) as span:
+            path = self._download_scene(d, opt_dict or {}, directory)
+            span.set(complete=bool(path))
+            if path:
+                span.add(bytes=os.path.getsize(path))
+        return path
+
+    def _download_scene(self, d, opt_dict, directory):
+        if not self.store:
+            filename = os.path.basename(d['downloadUrl'])
+            download_scene(d, opt_dict, self)
+            return filename if os.path.exists(filename) else None
+        with self.store.lock(d):
+            if not self.store.complete(d) and not self.store.adopt(d):
+                download_scene(d, opt_dict, self, self.store.partial(d))
+                if not self.store.commit(d):
+                    return None
+        return self.store.link(d, directory or os.getcwd())
+
+    def download(self, scenes, parallel=1, opt_dict=None, priority='recency', aoi=None, ranks=None, pipeline=None):
+        """Download the scenes into the current directory, parallel at a time.
+
+        Each finished granule is handed to the pipeline (see Pipeline) if one
+        is given, which unpacks and converts it while the downloads go on.
+        Close the pipeline to wait for its last granules.
+
+        Scenes are downloaded in the order of the priority policy, see
+        priority_key(). The download threads are started on the first call and
+        reused by later calls (more are added if parallel grows); scenes still
+        waiting from other calls are reordered by the new policy. Returns when
+        all queued scenes are done.
+        """
+        key = priority_key(priority, aoi, ranks)
+        with tracing.span(self.tracer, 'download_all', scenes=len(scenes), parallel=parallel):
+            with self._lock:
+                if self._queue is None:
+                    #create a queue for parallel downloading
+                    self._queue = DownloadQueue(key)
+                else:
+                    self._queue.reprioritize(key)
+                #populate queue with data, all at once so the first scenes taken are the most urgent
+                self._queue.extend([[d, opt_dict or {}, pipeline] for d in scenes])
+                #spawn a pool of threads, and pass them queue instance 
+                while len(self._workers) < parallel:
+                    t = ThreadDownload(self._queue, self)
+                    t.setDaemon(True)
+                    t.start()
+                    self._workers.append(t)
+            #wait on the queue until everything has been processed     
+            self._queue.join()
+
+    def reprioritize(self, priority, aoi=None, ranks=None):
+        """Reorder the scenes waiting to be downloaded by another policy, also while download() runs."""
+        with self._lock:
+            if self._queue is not None:
+                self._queue.reprioritize(priority_key(priority, aoi, ranks))
+
+def asf_opener(user_name, user_password):
+    """urllib2 opener logged in to ASF (the session cookie is kept by the opener)."""
+    import urllib
+    import urllib2
     o = urllib2.build_opener(urllib2.HTTPCookieProcessor() )
-    urllib2.install_opener(o)
     p = urllib.urlencode({'user_name':user_name,'user_password':user_password})
-    o.open("https://ursa.asfdaac.alaska.edu/cgi-bin/login",p)
+    o.open(ASF_LOGIN_URL,p)
+    return o
+
+def unavco_opener(user_name, user_password):
+    """urllib2 opener with digest authentication for the UNAVCO SAR archive."""
+    import urllib2
+    passman = urllib2.HTTPPasswordMgrWithDefaultRealm()
+    passman.add_password(None, UNAVCO_AUTH_URL, user_name, user_password)
+    authhandler = urllib2.HTTPDigestAuthHandler(passman)
+    return urllib2.build_opener(authhandler)
+
+def asf_dl(d, opt_dict, opener=None, filename=None, space=None):
+    import urllib2
+    url = d['downloadUrl']
+    filename = filename or os.path.basename(url)
+    o = opener or asf_opener(password_config.asfuser, password_config.asfpass)
     try:
         f = o.open(url)
     except urllib2.HTTPError, e:
@@ -293,28 +662,22 @@ def asf_dl(d, opt_dict):
             print "%s already downloaded" % filename
             f.close()
             return
-    print "ASF Download:",filename
-    start = time.time()
-    CHUNK = 256 * 10240
-    with open(filename, 'wb') as fp:
-        while True:
-            chunk = f.read(CHUNK)
-            if not chunk: break
-            fp.write(chunk)
+    with _reserve(space, filename, dl_file_size, f.close) as reservation:
+        if reservation.waited:
+            f = o.open(url)
+        print "ASF Download:",filename
+        start = time.time()
+        _save(f, filename, dl_file_size, reservation)
     total_time = time.time()-start
     mb_sec = (os.path.getsize(filename)/(1024*1024.0))/total_time
     print "%s download time: %.2f secs (%.2f MB/sec)" %(filename,total_time,mb_sec)
     f.close()
         
-def unavco_dl(d, opt_dict):
-    user_name = password_config.unavuser
-    user_password = password_config.unavpass
+def unavco_dl(d, opt_dict, opener=None, filename=None, space=None):
+    import urllib2
     url = d['downloadUrl']
-    passman = urllib2.HTTPPasswordMgrWithDefaultRealm()
-    passman.add_password(None, 'http://www.unavco.org/data/imaging/sar/', user_name, user_password)
-    authhandler = urllib2.HTTPDigestAuthHandler(passman)
-    opener = urllib2.build_opener(authhandler)    
-    filename = os.path.basename(url)
+    opener = opener or unavco_opener(password_config.unavuser, password_config.unavpass)
+    filename = filename or os.path.basename(url)
     try:
         f = opener.open(url)
     except urllib2.HTTPError, e:
@@ -327,45 +690,649 @@ def unavco_dl(d, opt_dict):
             print "%s already downloaded" % filename
             f.close()
             return
-    start = time.time()
-    with open(filename, 'wb') as T:
-        T.write(f.read())
+    with _reserve(space, filename, dl_file_size, f.close) as reservation:
+        if reservation.waited:
+            f = opener.open(url)
+        start = time.time()
+        _save(f, filename, dl_file_size, reservation)
     total_time = time.time() - start
     mb_sec = (os.path.getsize(filename) / (1024 * 1024.0)) / total_time
     print "%s download time: %.2f secs (%.2f MB/sec)" % (filename, total_time, mb_sec)
     f.close()
     
-def va4_dl(d, opt_dict):
+def va4_dl(d, opt_dict, filename=None):
+    import subprocess as sub
     user_name = password_config.eossouser
     user_password = password_config.eossopass
     url = d['downloadUrl']
-    filename = os.path.basename(url)
     secp_path = os.path.dirname(sys.argv[0])+"/data_utils/secp"
-    cmd = """%s -C %s:%s %s""" % (secp_path,user_name,user_password,d['downloadUrl'])
+    # an argument list, not a shell command: the URL comes from the scene record
+    cmd = [secp_path, '-C', '%s:%s' % (user_name, user_password), url]
+    if filename:
+        # secp names the sink after the URL, so download to its directory and rename
+        cmd += ['-c', '-O', '-o', os.path.dirname(os.path.abspath(filename))]
+        sink = os.path.join(os.path.dirname(os.path.abspath(filename)), os.path.basename(url))
+    filename = filename or os.path.basename(url)
     print "Downloading:",url
     start = time.time()
-    pipe = sub.Popen(cmd, shell=True, stdout=sub.PIPE, stderr=sub.STDOUT).stdout
+    pipe = sub.Popen(cmd, stdout=sub.PIPE, stderr=sub.STDOUT).stdout
     pipe.read()
+    if filename != os.path.basename(url) and os.path.exists(sink):
+        os.rename(sink, filename)
     total_time = time.time() - start
     mb_sec = (os.path.getsize(filename) / (1024 * 1024.0)) / total_time
     print "%s download time: %.2f secs (%.2f MB/sec)" % (filename, total_time, mb_sec)
     
-class ThreadDownload(threading.Thread):
+def download_scene(d, opt_dict, client=None, filename=None):
+    """Download one scene with the driver for its archive, using the client's sessions if given.
+
+    The file is written to filename, by default the base name of the URL in the current directory.
+    With a client, the download waits until the file fits on the disk (see DiskSpace).
+    """
+    space = client and client.space
+    if 'unavco' in d['downloadUrl']:
+        unavco_dl(d, opt_dict, client and client.opener('unavco'), filename, space)
+    elif 'asf' in d['downloadUrl'] :
+        asf_dl(d, opt_dict, client and client.opener('asf'), filename, space)
+    elif d['collectionName'] == 'Supersites VA4':
+        # secp writes the file itself, so it is only admitted by the size in the scene record
+        with _reserve(space, filename or os.path.basename(d['downloadUrl']), int(scene_size(d) or 0)):
+            va4_dl(d,opt_dict,filename)
+
+def _reserve(space, filename, size, paused=None):
+    """DiskSpace reservation for a download to filename, one that reserves nothing without space."""
+    return space.reserve(filename, size, paused) if space else Reservation()
+
+def _save(f, filename, size, reservation, chunk=256 * 10240):
+    """Stream the response f to filename, preallocated to its size; a partial file is removed if the transfer fails."""
+    try:
+        with open(filename, 'wb') as fp:
+            if size and preallocate(fp, size):
+                reservation.allocated()
+            while True:
+                data = f.read(chunk)
+                if not data: break
+                fp.write(data)
+            fp.truncate()
+            if size and fp.tell() < size:
+                raise IOError("connection closed after %d of %d bytes of %s" % (fp.tell(), size, filename))
+    except:
+        if os.path.exists(filename):
+            os.remove(filename)
+        raise
+
+def preflight_report(results, seconds, parallel=1, rate=10):
+    """Lines summarizing SsaraClient.preflight() results: problems, totals and the download ETA at rate MB/s per download."""
+    lines = []
+    for r in results:
+        if r['status'] not in ('ok', 'unchecked'):
+            lines.append("%-8s %s %s" % (r['status'].upper(), r['scene']['downloadUrl'], r['error']))
+    count = lambda status: len([r for r in results if r['status'] == status])
+    todo = [r for r in results if not r['complete'] and r['status'] in ('ok', 'unchecked')]
+    total = sum(r['bytes'] or 0 for r in todo)
+    lines.append("Preflight of %d granules in %.1f seconds: %d to download, %d already complete, %d missing, %d login failed, %d errors, %d not checked"
+                 % (len(results), seconds, len(todo), len([r for r in results if r['complete']]), count('missing'), count('auth'), count('error'), count('unchecked')))
+    if todo:
+        streams = max(1, min(parallel, len(todo)))
+        eta = total / (rate * 1024 * 1024 * streams)
+        unknown = len([r for r in todo if r['bytes'] is None])
+        lines.append("Download size %.2f GB%s, about %d:%02d:%02d at %.1f MB/s with %d parallel downloads"
+                     % (total / 1024.0 ** 3, ' plus %d granules of unknown size' % unknown if unknown else '',
+                        eta // 3600, eta % 3600 // 60, eta % 60, rate, streams))
+    return lines
+
+# download priority policies, the scenes with the smallest key are downloaded first
+PRIORITY_POLICIES = {'recency': 'newest acquisitions', 'aoi': 'largest AOI overlap', 'size': 'smallest files', 'rank': 'ranked granules'}
+
+def priority_key(policy, aoi=None, ranks=None):
+    """Sort key for scenes under a download policy (see PRIORITY_POLICIES), ties go newest first.
+
+    aoi is a WKT POINT or POLYGON, the overlap is measured between bounding
+    boxes. size uses the sizeMB or bytes field of the scene record, scenes
+    without a size go last. ranks is a list of granule names or URLs, highest
+    priority first, unranked scenes go last.
+    """
+    recency = lambda d: -time.mktime(time.strptime(d['startTime'], "%Y-%m-%d %H:%M:%S"))
+    if policy == 'recency':
+        return lambda d: (recency(d),)
+    if policy == 'aoi':
+        box = wkt_bbox(aoi)
+        return lambda d: (-bbox_overlap(wkt_bbox(d['stringFootprint']), box), recency(d))
+    if policy == 'size':
+        return lambda d: (scene_size(d) or float('inf'), recency(d))
+    if policy == 'rank':
+        order = {}
+        for i, r in enumerate(ranks or []):
+            order.setdefault(os.path.basename(r.strip()), i)
+        return lambda d: (order.get(os.path.basename(d['downloadUrl']), len(order)), recency(d))
+    raise ValueError('unknown priority policy %r' % policy)
+
+def wkt_bbox(wkt):
+    """(west, south, east, north) of the coordinates in a WKT string."""
+    import re
+    fp = [float(x.replace(' ', '')) for x in re.findall(r"[+-]? *(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?", wkt)]
+    lons, lats = fp[0::2], fp[1::2]
+    return min(lons), min(lats), max(lons), max(lats)
+
+def bbox_overlap(box, aoi):
+    """Fraction of the aoi box covered by box (1 or 0 for a point aoi)."""
+    west, south = max(box[0], aoi[0]), max(box[1], aoi[1])
+    east, north = min(box[2], aoi[2]), min(box[3], aoi[3])
+    if east < west or north < south:
+        return 0.0
+    area = (aoi[2] - aoi[0]) * (aoi[3] - aoi[1])
+    return (east - west) * (north - south) / area if area else 1.0
+
+def scene_size(d):
+    """Size of the granule in bytes from the scene record, None if it has none."""
+    if d.get('bytes'):
+        return float(d['bytes'])
+    if d.get('sizeMB'):
+        return float(d['sizeMB']) * 1024 * 1024
+    return None
+
+def read_ranks(filename):
+    """Granule names or URLs from a ranks file, one per line, None without a file."""
+    if not filename:
+        return None
+    with open(filename) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def watch_ranks(client, filename, interval=2):
+    """Reorder the client's waiting downloads whenever the ranks file changes."""
+    import threading
+    def watch():
+        mtime = os.path.getmtime(filename)
+        while True:
+            time.sleep(interval)
+            try:
+                if os.path.getmtime(filename) != mtime:
+                    mtime = os.path.getmtime(filename)
+                    client.reprioritize('rank', ranks=read_ranks(filename))
+                    print "Reordered the waiting downloads by %s" % filename
+            except (IOError, OSError):
+                pass
+    t = threading.Thread(target=watch)
+    t.setDaemon(True)
+    t.start()
+
+class DownloadQueue(object):
+    """Queue of [scene, opt_dict, pipeline] download tasks handed out in priority order.
+
+    key(scene) is the priority, smallest first; reprioritize() reorders the
+    tasks that are still waiting. Has the get/put/task_done/join interface of
+    Queue.Queue that ThreadDownload uses. If the key raises on a scene, put(),
+    extend() and reprioritize() raise without changing the queue.
+    """
+    def __init__(self, key):
+        import threading
+        self.key = key
+        self._heap = []
+        self._count = 0
+        self._unfinished = 0
+        self._cond = threading.Condition()
+
+    def put(self, task):
+        self.extend([task])
+
+    def extend(self, tasks):
+        """Add several tasks at once, so waiting threads only see them in priority order."""
+        import heapq
+        with self._cond:
+            entries = [(self.key(task[0]), self._count + i, task) for i, task in enumerate(tasks)]
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+            self._count += len(entries)
+            self._unfinished += len(entries)
+            self._cond.notify_all()
+
+    def get(self):
+        import heapq
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            return heapq.heappop(self._heap)[2]
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            if not self._unfinished:
+                self._cond.notify_all()
+
+    def join(self):
+        with self._cond:
+            while self._unfinished:
+                self._cond.wait()
+
+    def reprioritize(self, key):
+        import heapq
+        with self._cond:
+            heap = [(key(task[0]), count, task) for old, count, task in self._heap]
+            heapq.heapify(heap)
+            self.key, self._heap = key, heap
+
+    def waiting(self):
+        """Scenes not yet handed out, in the order they will be."""
+        with self._cond:
+            return [task[0] for key, count, task in sorted(self._heap)]
+
+class Pipeline(object):
+    """Unpack and convert stages that work on granules while the next ones download.
+
+    The download threads put() each finished granule. It is unpacked (see
+    unpack()) and then given to the convert command in threads of their own.
+    The stages are connected by queues of depth granules, so when unpacking or
+    converting falls behind, the downloads wait rather than piling up work.
+    close() waits until every granule put so far has been through all stages.
+    """
+    def __init__(self, unpack=True, convert=None, depth=2, unpackers=1, tracer=None):
+        import Queue
+        import threading
+        self.unpack = unpack
+        self.convert = convert
+        self.tracer = tracer
+        self._unpack_queue = Queue.Queue(depth)
+        self._convert_queue = Queue.Queue(depth)
+        self._threads = [threading.Thread(target=self._unpacker) for i in range(unpackers)]
+        if convert:
+            self._threads.append(threading.Thread(target=self._converter))
+        for t in self._threads:
+            t.setDaemon(True)
+            t.start()
+
+    def put(self, path):
+        self._unpack_queue.put(path)
+
+    def close(self):
+        self._unpack_queue.join()
+        self._convert_queue.join()
+
+    def _unpacker(self):
+        while True:
+            path = self._unpack_queue.get()
+            try:
+                if self.unpack:
+                    with tracing.span(self.tracer, 'unpack', file=path) as span:
+                        path = unpack(path)
+                        span.add(bytes=os.path.getsize(path) if os.path.isfile(path) else 0)
+                if self.convert:
+                    self._convert_queue.put(path)
+            except Exception, e:
+                print 'Problem unpacking:', path
+                print e
+            finally:
+                self._unpack_queue.task_done()
+
+    def _converter(self):
+        import pipes
+        import subprocess
+        while True:
+            path = self._convert_queue.get()
+            try:
+                cmd = self.convert.replace('{}', pipes.quote(path)) if '{}' in self.convert else '%s %s' % (self.convert, pipes.quote(path))
+                with tracing.span(self.tracer, 'convert', file=path) as span:
+                    status = subprocess.call(cmd, shell=True)
+                    span.set(status=status)
+                if status:
+                    print 'Problem converting %s: %s exited with %d' % (path, cmd, status)
+            except Exception, e:
+                print 'Problem converting:', path
+                print e
+            finally:
+                self._convert_queue.task_done()
+
+def unpack(path, chunk=4 * 1024 * 1024):
+    """Decompress a .zip, .tgz/.tar.gz/.tar or .gz granule next to it and return what it unpacked to.
+
+    Archives are extracted into a directory named after them, a .gz file
+    into the file without the .gz. The data are streamed through the
+    decompressor chunk by chunk (tar archives in a single pass), members
+    with absolute paths or .. are skipped. Anything else, or an archive that
+    was already unpacked, is returned as it is. Everything is written to
+    the target name plus .part and renamed into place when complete, so an
+    interrupted or failed extraction is never taken for an unpacked granule.
+    """
+    import shutil
+    name = os.path.basename(path)
+    lower = name.lower()
+    for ext in ('.tar.gz', '.tgz', '.tar', '.zip', '.gz'):
+        if lower.endswith(ext):
+            break
+    else:
+        return path
+    target = os.path.join(os.path.dirname(path), name[:-len(ext)])
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        return target
+    safe = lambda member: not os.path.isabs(member) and '..' not in member.replace('\\', '/').split('/')
+    tmp = target + '.part'
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    if ext == '.gz':
+        import gzip
+        try:
+            src = gzip.open(path, 'rb')
+            try:
+                with open(tmp, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, chunk)
+            finally:
+                src.close()
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.rename(tmp, target)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return target
+    try:
+        os.mkdir(tmp)
+        if ext == '.zip':
+            import zipfile
+            archive = zipfile.ZipFile(path)
+            try:
+                for member in archive.infolist():
+                    if not safe(member.filename) or member.filename.endswith('/'):
+                        continue
+                    out = os.path.join(tmp, member.filename)
+                    if not os.path.isdir(os.path.dirname(out)):
+                        os.makedirs(os.path.dirname(out))
+                    src = archive.open(member)
+                    try:
+                        with open(out, 'wb') as dst:
+                            shutil.copyfileobj(src, dst, chunk)
+                    finally:
+                        src.close()
+            finally:
+                archive.close()
+        else:
+            import tarfile
+            archive = tarfile.open(path, 'r|*')
+            try:
+                for member in archive:
+                    if safe(member.name) and (member.isfile() or member.isdir()):
+                        archive.extract(member, tmp)
+            finally:
+                archive.close()
+        # a "./" member gives the directory the time stamp from the archive, which would look stale
+        os.utime(tmp, None)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        os.rename(tmp, target)
+    except:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+class DiskSpace(object):
+    """Admission control for downloads: a transfer starts only when its file fits on the disk.
+
+    The room on a file system is its free space (statvfs) less the bytes
+    reserved by transfers that started but have not preallocated their file
+    yet, less keep_free bytes left for everything else. A transfer that does
+    not fit waits until others are done or space is freed, checking again
+    every interval seconds, instead of failing part-way with a truncated
+    file. Its download thread waits, so the queue pauses. A file larger than
+    the file system could ever hold fails right away.
+    """
+    def __init__(self, keep_free=0, interval=30):
+        import threading
+        self.keep_free = keep_free
+        self.interval = interval
+        self._reserved = {}
+        self._cond = threading.Condition()
+
+    def room(self, path):
+        """Bytes a new transfer to path may use."""
+        directory = os.path.dirname(os.path.abspath(path))
+        with self._cond:
+            return self._room(directory, os.stat(directory).st_dev)
+
+    def _room(self, directory, device):
+        st = os.statvfs(directory)
+        return st.f_bavail * st.f_frsize - self._reserved.get(device, 0) - self.keep_free
+
+    def capacity(self, path):
+        """Bytes a transfer to path could use with nothing else on the file system."""
+        st = os.statvfs(os.path.dirname(os.path.abspath(path)))
+        # the blocks reserved for root (f_bfree - f_bavail) are never available
+        return (st.f_blocks - st.f_bfree + st.f_bavail) * st.f_frsize - self.keep_free
+
+    def reserve(self, path, size, paused=None):
+        """Wait until size bytes fit next to path and reserve them, returns the Reservation.
+
+        paused() is called once if the transfer has to wait, to close its
+        connection. Raises IOError (ENOSPC) if size is more than capacity(path).
+        """
+        import errno
+        directory = os.path.dirname(os.path.abspath(path))
+        device = os.stat(directory).st_dev
+        capacity = self.capacity(path)
+        if size > capacity:
+            if paused:
+                paused()
+            raise IOError(errno.ENOSPC, "%s needs %.1f MB and %s can never hold more than %.1f MB (keeping %.1f MB free)" % (
+                os.path.basename(path), size / 1048576.0, directory, max(capacity, 0) / 1048576.0, self.keep_free / 1048576.0))
+        waited = False
+        with self._cond:
+            while self._room(directory, device) < size:
+                if not waited:
+                    print "Pausing %s: it needs %.1f MB and %.1f MB are free in %s (keeping %.1f MB free)" % (
+                        os.path.basename(path), size / 1048576.0, (self._room(directory, device) + self.keep_free) / 1048576.0,
+                        directory, self.keep_free / 1048576.0)
+                    if paused:
+                        paused()
+                    waited = True
+                self._cond.wait(self.interval)
+            self._reserved[device] = self._reserved.get(device, 0) + size
+        if waited:
+            print "Resuming %s" % os.path.basename(path)
+        return Reservation(self, device, size, waited)
+
+    def _release(self, device, size):
+        with self._cond:
+            self._reserved[device] -= size
+            self._cond.notify_all()
+
+class Reservation(object):
+    """Disk space reserved by DiskSpace.reserve() for one transfer, released when its with block ends.
+
+    waited tells whether the transfer had to wait for room. Reservation() reserves nothing.
+    """
+    def __init__(self, space=None, device=None, size=0, waited=False):
+        self.space = space
+        self.device = device
+        self.size = size
+        self.waited = waited
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def allocated(self):
+        """The file is preallocated, so the file system itself accounts for the bytes now."""
+        self.release()
+
+    def release(self):
+        if self.size:
+            self.space._release(self.device, self.size)
+            self.size = 0
+
+FALLOC_FL_KEEP_SIZE = 1
+
+def preallocate(fp, size):
+    """Allocate size bytes of disk for the open file fp, returns False where the file system cannot.
+
+    Uses fallocate() with FALLOC_FL_KEEP_SIZE, which allocates the blocks
+    without changing the file length, so an interrupted download does not
+    look complete to the size checks, as it would after posix_fallocate().
+    Without fallocate() (not glibc), posix_fallocate() is used and the
+    caller truncates the file to what it wrote. Raises IOError if the disk
+    is full.
+    """
+    import ctypes
+    import errno
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return False
+    fp.flush()
+    if hasattr(libc, 'fallocate64'):
+        fallocate = libc.fallocate64
+        fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        err = ctypes.get_errno() if fallocate(fp.fileno(), FALLOC_FL_KEEP_SIZE, 0, size) else 0
+    elif hasattr(libc, 'posix_fallocate'):
+        # returns the error instead of setting errno; glibc emulates it by writing
+        # zeros, but glibc has fallocate64 so this is other C libraries only
+        libc.posix_fallocate.argtypes = [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+        err = libc.posix_fallocate(fp.fileno(), 0, size)
+    else:
+        return False
+    if err == errno.ENOSPC:
+        raise IOError(err, os.strerror(err), fp.name)
+    return not err
+
+class GranuleStore(object):
+    """Shared download store, so a granule is only transferred and kept on disk once.
+
+    Granules are stored under DIR/objects/<sha1 of the URL>/<file name> with a
+    .json record of their size and md5. Projects get hard links (symlinks
+    across file systems) into their own directories. If the scene record has
+    an md5sum, granules with the same contents under another URL are reused
+    through DIR/md5/<md5>, and the download is checked against it.
+
+    lock() takes an exclusive flock per granule, which works between threads
+    (each takes its own open file) and between processes sharing the store.
+    """
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        for sub in ('objects', 'locks', 'md5'):
+            if not os.path.isdir(os.path.join(self.root, sub)):
+                try:
+                    os.makedirs(os.path.join(self.root, sub))
+                except OSError:
+                    pass
+
+    def key(self, d):
+        import hashlib
+        return hashlib.sha1(d['downloadUrl']).hexdigest()
+
+    def path(self, d):
+        return os.path.join(self.root, 'objects', self.key(d), os.path.basename(d['downloadUrl']))
+
+    def partial(self, d):
+        path = self.path(d)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return path + '.part'
+
+    def lock(self, d):
+        import contextlib
+        import fcntl
+        @contextlib.contextmanager
+        def locked():
+            with open(os.path.join(self.root, 'locks', self.key(d) + '.lock'), 'w') as lockfile:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lockfile, fcntl.LOCK_UN)
+        return locked()
+
+    def complete(self, d):
+        return os.path.exists(self.path(d)) and os.path.exists(self.path(d) + '.json')
+
+    def _expected_md5(self, d):
+        return d.get('md5sum') or d.get('md5')
+
+    def adopt(self, d):
+        """Reuse a stored granule with the same md5 as the scene record, if there is one."""
+        md5 = self._expected_md5(d)
+        if not md5 or not os.path.exists(os.path.join(self.root, 'md5', md5)):
+            return False
+        self.partial(d)
+        _link(os.path.join(self.root, 'md5', md5), self.path(d))
+        self._record(d, md5)
+        return True
+
+    def commit(self, d):
+        """Move a finished download into the store, False if it is missing or its md5 does not match."""
+        import hashlib
+        part = self.partial(d)
+        if not os.path.exists(part):
+            return False
+        md5 = hashlib.md5()
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(4 * 1024 * 1024), ''):
+                md5.update(chunk)
+        md5 = md5.hexdigest()
+        expected = self._expected_md5(d)
+        if expected and expected.lower() != md5:
+            print "%s: md5 %s does not match %s, not storing it" % (os.path.basename(part), md5, expected)
+            os.remove(part)
+            return False
+        os.rename(part, self.path(d))
+        if not os.path.exists(os.path.join(self.root, 'md5', md5)):
+            _link(self.path(d), os.path.join(self.root, 'md5', md5))
+        self._record(d, md5)
+        return True
+
+    def _record(self, d, md5):
+        import json
+        with open(self.path(d) + '.json', 'w') as f:
+            json.dump({'url': d['downloadUrl'], 'size': os.path.getsize(self.path(d)), 'md5': md5}, f)
+
+    def link(self, d, directory):
+        """Link the stored granule into directory, returns the linked path."""
+        target = os.path.join(directory, os.path.basename(d['downloadUrl']))
+        if os.path.exists(target) and os.path.samefile(target, self.path(d)):
+            return target
+        if os.path.lexists(target):
+            os.remove(target)
+        _link(self.path(d), target)
+        return target
+
+def _link(source, target):
+    """Hard link source to target, or symlink it when a hard link is not possible."""
+    try:
+        os.link(source, target)
+    except OSError:
+        os.symlink(source, target)
+
+class ThreadDownload(object):
     """Threaded SAR data download"""
-    def __init__(self, queue):
-        threading.Thread.__init__(self)
+    def __init__(self, queue, client=None):
+        import threading
         self.queue = queue
+        self.client = client
+        self.thread = threading.Thread(target=self.run)
+
+    def setDaemon(self, daemonic):
+        self.thread.setDaemon(daemonic)
+
+    def start(self):
+        self.thread.start()
 
     def run(self):
         while True:
-            d, opt_dict = self.queue.get()
-            if 'unavco' in d['downloadUrl']:
-                unavco_dl(d, opt_dict)
-            elif 'asf' in d['downloadUrl'] :
-                asf_dl(d, opt_dict)
-            elif d['collectionName'] == 'Supersites VA4':
-                va4_dl(d,opt_dict)
-            self.queue.task_done()
+            d, opt_dict, pipeline = self.queue.get()
+            try:
+                if self.client:
+                    path = self.client.download_scene(d, opt_dict)
+                else:
+                    download_scene(d, opt_dict)
+                    path = os.path.basename(d['downloadUrl'])
+                if pipeline and path and os.path.exists(path):
+                    # blocks while the pipeline is full, so downloads do not run away from unpacking
+                    pipeline.put(path)
+            except Exception, e:
+                print 'Problem with:',d['downloadUrl']
+                print e
+            finally:
+                self.queue.task_done()
              
 if __name__ == '__main__':
     if len(sys.argv) < 2: